@@ -0,0 +1,223 @@
+'''
+Quality metrics for colormaps, e.g. those made with `gradient_maker.grad_brite`.
+
+All metrics are computed for a whole batch of colormaps at once, so thousands of candidate
+maps can be scored in one call:
+
+    import gradient_analysis as ga
+    scores = ga.colormap_metrics([c_icy, c_beachy, c_koster])
+    scores['uniformity']      # one value per colormap
+'''
+import numpy as np
+
+import gradient_maker as gm
+
+# Simulation of dichromatic color vision, full severity, applied to linear RGB
+# (Machado, Oliveira & Fernandes 2009; https://doi.org/10.1109/TVCG.2009.113)
+CVD_MATRICES = {
+    'protan': np.array([[ 0.152286,  1.052583, -0.204868],
+                        [ 0.114503,  0.786281,  0.099216],
+                        [-0.003882, -0.048116,  1.051998]]),
+    'deutan': np.array([[ 0.367322,  0.860646, -0.227968],
+                        [ 0.280085,  0.672501,  0.047413],
+                        [-0.011820,  0.042940,  0.968881]]),
+    'tritan': np.array([[ 1.255528, -0.076749, -0.178779],
+                        [-0.078411,  0.930809,  0.147602],
+                        [ 0.004733,  0.691367,  0.303900]]),
+}
+
+
+def colormap_colors(cmaps, ncol=256):
+    '''
+    Gathers one or more colormaps into a single array of decimal RGB colors
+
+    Required input:
+        cmaps = a matplotlib colormap, a list of them, or an array of RGB(A) values (0-1)
+                of shape (N, 3|4) or (M, N, 3|4), e.g. from `grad_brite(..., as_array=True)`
+    Optional input:
+        ncol (int) = number of colors each colormap is sampled at (default 256); arrays are used as they are
+
+    Output:
+        A numpy array of shape (M, N, 3)
+    '''
+    if isinstance(cmaps, np.ndarray):
+        rgb = cmaps[..., :3]
+    else:
+        if not isinstance(cmaps, (list, tuple)):
+            cmaps = [cmaps]
+        x = np.linspace(0, 1, ncol)
+        rgb = np.stack([c[..., :3] if isinstance(c, np.ndarray) else c(x)[:, :3] for c in cmaps])
+    return rgb.reshape((-1,) + rgb.shape[-2:]).astype(np.float64)
+
+
+def simulate_cvd(dec_array, cvd='deutan'):
+    '''
+    Simulates how decimal (0-1) RGB colors, array shape (..., 3), are seen with
+        color vision deficiency cvd = 'protan', 'deutan' or 'tritan'
+    '''
+    lin = gm.srgb_to_linear(dec_array) @ CVD_MATRICES[cvd].T
+    return gm.linear_to_srgb(np.clip(lin, 0.0, 1.0))
+
+
+def _path_metrics(lab):
+    # Color differences (CIE76 Delta E) between neighboring entries, and the total length of the path
+    de = np.linalg.norm(np.diff(lab, axis=-2), axis=-1)
+    return de, de.sum(axis=-1)
+
+
+def _uniformity(de):
+    # 1 - coefficient of variation of the neighboring Delta E, floored at 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.nan_to_num(np.clip(1 - de.std(axis=-1)/de.mean(axis=-1), 0.0, 1.0))
+
+
+def colormap_metrics(cmaps, ncol=256):
+    '''
+    Computes perceptual quality metrics for a batch of colormaps, all entries at once
+
+    Required input:
+        cmaps = a matplotlib colormap, a list of them, or an array of RGB(A) values (see `colormap_colors`)
+    Optional input:
+        ncol (int) = number of colors each colormap is sampled at (default 256)
+
+    Output:
+        A dictionary of numpy arrays, one value per colormap:
+            'lightness_0', 'lightness_1' = CIELAB L* (0-100) of the first and last color
+            'monotonicity'   = fraction of steps in which L* changes in the dominant direction
+                               (1.0 for strictly monotonic; diverging maps score about 0.5)
+            'reversals'      = number of times the sign of the L* change flips along the map
+            'delta_e_mean', 'delta_e_min', 'delta_e_max' = CIE76 Delta E between neighboring colors
+            'uniformity'     = 1 - coefficient of variation of the neighboring Delta E
+                               (1.0 for perfectly even steps, lower is less uniform, floor 0)
+            'cvd_protan', 'cvd_deutan', 'cvd_tritan' = total perceptual length of the map as seen
+                               with that deficiency, relative to normal vision
+                               (near 1.0 means the map stays just as distinguishable)
+    '''
+    rgb = colormap_colors(cmaps, ncol=ncol)
+    lab = gm.dec_to_cielab(rgb)
+    de, length = _path_metrics(lab)
+
+    dl = np.diff(lab[..., 0], axis=-1)
+    sign = np.where(np.abs(dl) > 1e-6, np.sign(dl), 0)      # Ignore round-off level changes
+    n_up = (sign > 0).sum(axis=-1)
+    n_down = (sign < 0).sum(axis=-1)
+    # Flat steps do not count as reversals: carry the last nonzero sign forward over them
+    last = np.maximum.accumulate(np.where(sign != 0, np.arange(sign.shape[-1]), 0), axis=-1)
+    sign_ff = np.take_along_axis(sign, last, axis=-1)
+    flips = (sign_ff[:, 1:] != sign_ff[:, :-1]) & (sign_ff[:, :-1] != 0)
+
+    metrics = {
+        'lightness_0':  lab[:, 0, 0],
+        'lightness_1':  lab[:, -1, 0],
+        'monotonicity': np.maximum(n_up, n_down) / dl.shape[-1],
+        'reversals':    flips.sum(axis=-1),
+        'delta_e_mean': de.mean(axis=-1),
+        'delta_e_min':  de.min(axis=-1),
+        'delta_e_max':  de.max(axis=-1),
+        'uniformity':   _uniformity(de),
+    }
+    for cvd in CVD_MATRICES:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            metrics['cvd_'+cvd] = _path_metrics(gm.dec_to_cielab(simulate_cvd(rgb, cvd)))[1] / length
+    return metrics
+
+
+def _continuous_rgb_batch(dec_anchors, pcols, ncol):
+    # Linear color gradients for many sets of anchor positions at once: pcols has shape (M, K)
+    x = np.linspace(0, 1, ncol)
+    ind = np.clip((pcols[:, None, :] < x[None, :, None]).sum(axis=-1), 1, pcols.shape[1]-1)
+    x0 = np.take_along_axis(pcols, ind-1, axis=1)
+    x1 = np.take_along_axis(pcols, ind, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        distance = ((x - x0) / (x1 - x0))[..., None]
+    return np.clip(dec_anchors[ind-1] + distance*(dec_anchors[ind] - dec_anchors[ind-1]), 0.0, 1.0)
+
+
+def optimize_grad_brite(xrgb, target='uniform', pcol=None, ncol=256, lite_model='luma', two_segments=True,
+                        search_pcol=False, n_candidates=2048, n_rounds=8, n_elite=64, seed=0):
+    '''
+    Searches for the `grad_brite` brightness parameters (and optionally color positions) that best
+        meet a lightness profile or perceptual-uniformity objective. Each round evaluates a whole batch
+        of candidate colormaps in array operations, then samples the next batch around the best ones
+        (cross-entropy method).
+        
+    Required input:
+        xrgb (list) = list of rgb hex strings giving the sequence of anchor colors, as for `grad_brite`
+        
+    Optional input:                 Default:
+        target         ['uniform'] = 'uniform' to maximize the uniformity score of `colormap_metrics`,
+                                     or the desired CIELAB lightness (L*/100, 0.0-1.0) along the map, given
+                                     as an array (resampled to ncol) or a function of position 0.0-1.0
+        pcol              [None]   = positions of the colors in xrgb (default equally spaced)
+        ncol               [256]   = number of colors in the colormap
+        lite_model      ['luma']   = lightness model passed to grad_brite
+        two_segments      [True]   = also search mid_lite and mid_spot (otherwise a single segment)
+        search_pcol      [False]   = also search the interior color positions (first and last stay at 0 and 1)
+        n_candidates      [2048]   = candidate colormaps evaluated per round
+        n_rounds             [8]   = number of rounds
+        n_elite             [64]   = number of best candidates the next round is sampled around
+        seed                 [0]   = seed of the random number generator
+        
+    Output:
+        params (dict) = keyword arguments for `grad_brite(**params)` giving the best colormap found
+        loss  (float) = its objective value (RMS lightness error, or 1 - uniformity)
+    '''
+    rng = np.random.default_rng(seed)
+    anchors = gm.rgb_to_dec_array(gm.hex_to_rgb_array(xrgb))
+    nanchor = len(anchors)
+    pcol_in = pcol
+    pcol = np.asarray(pcol if pcol else np.linspace(0, 1, nanchor), dtype=np.float64)
+    
+    if isinstance(target, str):
+        if target != 'uniform':
+            raise ValueError("Unknown optimization target: "+target)
+        target_lite = None
+    else:
+        x = np.linspace(0, 1, ncol)
+        target_lite = target(x) if callable(target) else \
+                      np.interp(x, np.linspace(0, 1, len(target)), np.asarray(target, dtype=np.float64))
+    
+    # Parameter vector per candidate: lite_0, lite_1 [, mid_lite, mid_spot] [, interior color positions]
+    names = ['lite_0', 'lite_1'] + (['mid_lite', 'mid_spot'] if two_segments else [])
+    n_brite = len(names)
+    n_pos = nanchor - 2 if search_pcol else 0
+    low = np.array([0.0]*n_brite + [0.0]*n_pos)
+    high = np.array([1.0]*n_brite + [1.0]*n_pos)
+    if two_segments:
+        low[2] = 1e-3                   # grad_brite takes mid_lite=0.0 as no intermediate brightness
+        low[3], high[3] = 0.02, 0.98
+    
+    def evaluate(cand):
+        if n_pos:
+            interior = np.sort(cand[:, n_brite:], axis=1)
+            pcols = np.concatenate([np.zeros((len(cand), 1)), interior, np.ones((len(cand), 1))], axis=1)
+            base = _continuous_rgb_batch(anchors, pcols, ncol)
+        else:
+            base = gm.continuous_rgb(xrgb, float_list=list(pcol), ncol=ncol)[None]
+        mid = (cand[:, 2], cand[:, 3]) if two_segments else (None, None)
+        lite = gm.brite_ramp(ncol, cand[:, 0], cand[:, 1], mid_lite=mid[0], mid_spot=mid[1])
+        rgb = gm.apply_brite(np.broadcast_to(base, lite.shape + (3,)), lite, lite_model=lite_model)
+        if target_lite is None:
+            return 1 - _uniformity(_path_metrics(gm.dec_to_cielab(rgb))[0])
+        measured = gm.dec_to_cielab(rgb)[..., 0] / 100
+        return np.sqrt(np.mean((measured - target_lite)**2, axis=-1))
+    
+    cand = rng.uniform(low, high, size=(n_candidates, len(low)))
+    best, best_loss = None, np.inf
+    for _ in range(n_rounds):
+        loss = np.nan_to_num(evaluate(cand), nan=np.inf)
+        order = np.argsort(loss)
+        if loss[order[0]] < best_loss:
+            best, best_loss = cand[order[0]].copy(), float(loss[order[0]])
+        elite = cand[order[:n_elite]]
+        mean, std = elite.mean(axis=0), elite.std(axis=0) + 1e-3
+        cand = np.clip(rng.normal(mean, std, size=cand.shape), low, high)
+        cand[0] = best                                  # Keep the best so far in the running
+    
+    params = dict(xrgb=list(xrgb), ncol=ncol, lite_model=lite_model)
+    params.update({name: float(best[i]) for i, name in enumerate(names)})
+    if n_pos:
+        params['pcol'] = [0.0] + np.sort(best[n_brite:]).tolist() + [1.0]
+    elif pcol_in:
+        params['pcol'] = list(pcol_in)
+    return params, best_loss
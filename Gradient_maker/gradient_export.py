@@ -0,0 +1,223 @@
+'''
+Bulk export of colormaps to the formats used by other visualization tools:
+GrADS `set rgb` scripts, ParaView XML, GMT .cpt, CSS gradients, and a packed binary bundle
+with a JSON index. Every exporter writes many colormaps in one pass, streaming its output
+to the files colormap by colormap rather than building large strings in memory.
+
+    import gradient_export as ge
+    ge.export_all(['icy', 'koster', 'loco'], 'palettes_out')     # named palettes from gradient_palettes
+    ge.export_cpt({'mine': gm.grad_brite(...)}, 'cpt_dir')       # or any colormaps, by name
+'''
+import os
+import json
+from xml.sax.saxutils import quoteattr
+import numpy as np
+
+import gradient_maker as gm
+
+
+def _named(cmaps):
+    # The dictionary of name: colormap for the cmaps argument of the exporters
+    if not isinstance(cmaps, dict):
+        import gradient_palettes as gp
+        cmaps = {name: gp.get_palette(name) for name in cmaps}
+    return cmaps
+
+
+def _extreme_colors(cmap):
+    # GMT colors (r/g/b, or - for a transparent color) of the under, over and bad values of a colormap;
+    #   an array gets matplotlib's defaults, as in `gm.cmap_to_lut`: the end colors and a transparent bad color
+    if isinstance(cmap, np.ndarray):
+        rgba = [cmap[0], cmap[-1], np.zeros(4)]
+    else:
+        rgba = [cmap.get_under(), cmap.get_over(), cmap.get_bad()]
+    rgba = gm.dec_to_uint8_array(rgba)
+    return ["-" if a == 0 else f"{r}/{g}/{b}" for r, g, b, a in rgba.tolist()]
+
+
+def palette_colors(cmaps, ncolors=None):
+    '''
+    Yields (name, RGB) for each colormap, RGB being a uint8 array of shape (N, 3)
+
+    Required input:
+        cmaps = a dictionary of name: colormap (matplotlib colormap, or RGB(A) array with values 0-1),
+                or a list of palette names from `gradient_palettes`
+    Optional input:
+        ncolors (int) = resample every colormap to this many colors (default: keep each colormap's own size)
+    '''
+    for name, cmap in _named(cmaps).items():
+        if isinstance(cmap, np.ndarray):
+            rgba = cmap if ncolors is None else \
+                   cmap[np.rint(np.linspace(0, len(cmap)-1, ncolors)).astype(int)]
+        else:
+            rgba = cmap(np.arange(cmap.N) if ncolors is None else np.linspace(0, 1, ncolors))
+        yield name, gm.dec_to_uint8_array(rgba)[:, :3]       # As colorize converts colors
+
+
+def export_grads(cmaps, directory, ncolors=None, first_color=16):
+    '''
+    Writes a GrADS script (name.gs) per colormap that defines its colors with `set rgb`
+        and sets them as the contour colors with `set rbcols`
+
+    Required input:
+        cmaps           = colormaps, as for `palette_colors`
+        directory (str) = output directory (created if needed)
+    Optional input:
+        ncolors     (int) = number of colors (default: the colormap's size, at most 256-first_color)
+        first_color (int) = first GrADS color number to define (default 16, the first user color)
+    Output:
+        List of the files written
+    '''
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    for name, rgb in palette_colors(cmaps, ncolors):
+        if len(rgb) > 256 - first_color:
+            rgb = rgb[np.rint(np.linspace(0, len(rgb)-1, 256-first_color)).astype(int)]
+        path = os.path.join(directory, name + ".gs")
+        with open(path, "w") as f:
+            f.write(f"* Colormap {name}: {len(rgb)} colors as GrADS colors {first_color}-{first_color+len(rgb)-1}\n")
+            f.writelines(f"'set rgb {first_color+i} {r} {g} {b}'\n" for i, (r, g, b) in enumerate(rgb.tolist()))
+            f.write("'set rbcols " + " ".join(str(first_color+i) for i in range(len(rgb))) + "'\n")
+        files.append(path)
+    return files
+
+
+def export_paraview(cmaps, filename, ncolors=None):
+    '''
+    Writes all colormaps into one ParaView color map XML file (import through the Color Map Editor)
+
+    Required input:
+        cmaps          = colormaps, as for `palette_colors`
+        filename (str) = output .xml file
+    Optional input:
+        ncolors  (int) = number of control points per colormap (default: the colormap's size)
+    '''
+    with open(filename, "w") as f:
+        f.write("<ColorMaps>\n")
+        for name, rgb in palette_colors(cmaps, ncolors):
+            f.write(f'<ColorMap name={quoteattr(name)} space="RGB">\n')
+            x = np.linspace(0, 1, len(rgb))
+            f.writelines(f'  <Point x="{xi:.6f}" o="1" r="{r/255:.6f}" g="{g/255:.6f}" b="{b/255:.6f}"/>\n'
+                         for xi, (r, g, b) in zip(x.tolist(), rgb.tolist()))
+            f.write("</ColorMap>\n")
+        f.write("</ColorMaps>\n")
+    return filename
+
+
+def export_cpt(cmaps, directory, vmin=0.0, vmax=1.0, ncolors=None):
+    '''
+    Writes a GMT color palette table (name.cpt) per colormap, one constant-color slice per color,
+        with the colormap's under, over and bad colors as its B, F and N colors
+
+    Required input:
+        cmaps           = colormaps, as for `palette_colors`
+        directory (str) = output directory (created if needed)
+    Optional input:
+        vmin, vmax (float) = data range covered by the table (default 0-1)
+        ncolors      (int) = number of slices (default: the colormap's size)
+    Output:
+        List of the files written
+    '''
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    cmaps = _named(cmaps)
+    for name, rgb in palette_colors(cmaps, ncolors):
+        z = np.linspace(vmin, vmax, len(rgb)+1).tolist()
+        path = os.path.join(directory, name + ".cpt")
+        with open(path, "w") as f:
+            f.write(f"# {name}\n# COLOR_MODEL = RGB\n")
+            f.writelines(f"{z[i]:.6g}\t{r}/{g}/{b}\t{z[i+1]:.6g}\t{r}/{g}/{b}\n"
+                         for i, (r, g, b) in enumerate(rgb.tolist()))
+            under, over, bad = _extreme_colors(cmaps[name])
+            f.write(f"B\t{under}\nF\t{over}\nN\t{bad}\n")
+        files.append(path)
+    return files
+
+
+def _css_identifier(name):
+    # name as a valid CSS identifier, escaped as the browsers' CSS.escape does: letters, digits, '-', '_'
+    #   and non-ASCII characters kept, anything else (or a digit starting the name) as a hex escape
+    out = []
+    for i, ch in enumerate(name):
+        if ch == "\0":
+            out.append("\ufffd")
+        elif ch.isascii() and ch.isdigit() and (i == 0 or (i == 1 and name[0] == "-")):
+            out.append(f"\\{ord(ch):x} ")
+        elif not ch.isascii() or ch.isalnum() or ch in "-_":
+            out.append(ch)
+        else:
+            out.append(f"\\{ord(ch):x} ")
+    return "\\-" if name == "-" else "".join(out)
+
+
+def export_css(cmaps, filename, nstops=32, prefix="gm-"):
+    '''
+    Writes all colormaps into one CSS file, each as a custom property holding a linear gradient
+        and a class using it as background, e.g. `var(--gm-icy)` and `.gm-icy`
+
+    Required input:
+        cmaps          = colormaps, as for `palette_colors`
+        filename (str) = output .css file
+    Optional input:
+        nstops   (int) = maximum number of color stops per gradient (default 32)
+        prefix   (str) = prefix of the property and class names (default 'gm-'); prefix+name is escaped
+                         where needed to make a valid CSS identifier
+    '''
+    with open(filename, "w") as f:
+        for name, rgb in palette_colors(cmaps):
+            if len(rgb) > nstops:
+                rgb = rgb[np.rint(np.linspace(0, len(rgb)-1, nstops)).astype(int)]
+            pct = np.linspace(0, 100, len(rgb)).tolist()
+            stops = ", ".join(f"{h} {p:.4g}%" for h, p in zip(gm.rgb_to_hex_array(rgb).tolist(), pct))
+            ident = _css_identifier(prefix + name)
+            f.write(f":root {{ --{ident}: linear-gradient(to right, {stops}); }}\n")
+            f.write(f".{ident} {{ background: var(--{ident}); }}\n")
+    return filename
+
+
+def export_bundle(cmaps, basename, ncolors=None):
+    '''
+    Writes all colormaps into a packed binary file (basename.bin) of uint8 RGB triplets,
+        one colormap after another, with a JSON index (basename.json) giving the name,
+        byte offset and number of colors of each
+
+    Required input:
+        cmaps          = colormaps, as for `palette_colors`
+        basename (str) = path of the output files, without extension
+    Optional input:
+        ncolors  (int) = resample every colormap to this many colors (default: the colormap's size)
+    '''
+    index = []
+    offset = 0
+    with open(basename + ".bin", "wb") as f:
+        for name, rgb in palette_colors(cmaps, ncolors):
+            f.write(rgb.tobytes())
+            index.append({"name": name, "offset": offset, "ncolors": len(rgb)})
+            offset += rgb.nbytes
+    with open(basename + ".json", "w") as f:
+        json.dump({"format": "uint8 RGB", "file": os.path.basename(basename) + ".bin", "colormaps": index}, f, indent=1)
+    return basename + ".bin", basename + ".json"
+
+
+def read_bundle(basename):
+    '''
+    Reads a bundle written by `export_bundle` back as a dictionary of name: uint8 RGB array (N, 3)
+    '''
+    with open(basename + ".json") as f:
+        index = json.load(f)["colormaps"]
+    data = np.fromfile(basename + ".bin", dtype=np.uint8)
+    return {c["name"]: data[c["offset"]:c["offset"]+3*c["ncolors"]].reshape(-1, 3) for c in index}
+
+
+def export_all(cmaps, directory):
+    '''
+    Exports the colormaps in every format into directory: grads/*.gs, cpt/*.cpt,
+        colormaps_paraview.xml, colormaps.css and colormaps.bin/.json
+    '''
+    cmaps = _named(cmaps)                   # Build named palettes once for all formats
+    os.makedirs(directory, exist_ok=True)
+    export_grads(cmaps, os.path.join(directory, "grads"))
+    export_cpt(cmaps, os.path.join(directory, "cpt"))
+    export_paraview(cmaps, os.path.join(directory, "colormaps_paraview.xml"))
+    export_css(cmaps, os.path.join(directory, "colormaps.css"))
+    export_bundle(cmaps, os.path.join(directory, "colormaps"))
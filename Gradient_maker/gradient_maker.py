@@ -1,7 +1,120 @@
-import sys
+import os
+import re
+import threading
+from collections import OrderedDict
+from itertools import repeat
+
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
+
+
+class PaletteSpecError(ValueError):
+    '''
+    Raised for an invalid palette specification (colors, positions, brightnesses) given to `grad_brite`
+    '''
+
+
+# Lookup table from unicode code points of hex digits to their integer values (16 for any other character)
+_HEX_VALUES = np.full(129, 16, dtype=np.uint8)
+for _i, _ch in enumerate("0123456789abcdef"):
+    _HEX_VALUES[ord(_ch)] = _i
+    _HEX_VALUES[ord(_ch.upper())] = _i
+# ...and the reverse, from integer values to code points of lowercase hex digits
+_HEX_DIGITS = np.array([ord(ch) for ch in "0123456789abcdef"], dtype=np.uint32)
+
+
+def hex_to_rgb_array(hex_array):
+    '''
+    Converts an array of hex strings to rgb colors in one vectorized pass
+    
+    Required input:
+        hex_array (array-like) = Strings of characters representing hex colors, any shape.
+                                 Each may or may not have a leading `#`
+                                 Any alpha value on the end will be stripped off
+    Output:
+        A numpy array of integers (range 0-255), shape (..., 3), of RGB values
+    
+    Raises ValueError if any string is not 3 or at least 6 hex digits long, or has other characters
+    '''
+    hexes = np.char.lstrip(np.asarray(hex_array, dtype=np.str_), "#")
+    shape = hexes.shape
+    lens = np.char.str_len(hexes).reshape(-1)
+    hexes = hexes.reshape(-1).astype("<U6")  # Drop any alpha value on the end
+    codes = np.ascontiguousarray(hexes).view(np.uint32).reshape(-1, 6)
+    nibs = _HEX_VALUES[np.minimum(codes, 128)].astype(np.int64)
+    short = lens < 6                             # One hex digit per color: 'rgb'
+    bad = (nibs[:, :3] > 15).any(axis=1) | (~short & (nibs[:, 3:] > 15).any(axis=1)) | (short & (lens != 3))
+    if bad.any():
+        raise ValueError(f"invalid hex color: {str(hexes[np.argmax(bad)])!r}")
+    rgb = nibs[:, 0::2] * 16 + nibs[:, 1::2]     # Two hex digits per color: 'rrggbb'
+    rgb[short] = nibs[short, :3]
+    return rgb.reshape(shape + (3,))
+
+
+def rgb_to_hex_array(rgb_array):
+    '''
+    Converts an array of rgb colors to hex strings in one vectorized pass
+    
+    Required input: 
+        rgb_array (array-like) = RGB values in decimal 0-255 range, shape (..., 3) or (..., 4);
+                                 any alpha values are dropped
+        
+    Output: 
+        A numpy array of 7-character strings representing hex colors, with leading hash.
+    
+    Raises ValueError if any value is outside the range 0-255
+    '''
+    rgb = np.asarray(rgb_array)[..., :3]
+    if rgb.size and not ((rgb >= 0) & (rgb <= 255)).all():
+        raise ValueError(f"RGB values must lie in the range 0-255, got {rgb.min()} to {rgb.max()}")
+    rgb = rgb.astype(np.int64)
+    shape = rgb.shape[:-1]
+    codes = np.empty(shape + (7,), dtype=np.uint32)
+    codes[..., 0] = ord("#")
+    codes[..., 1::2] = _HEX_DIGITS[(rgb >> 4) & 15]
+    codes[..., 2::2] = _HEX_DIGITS[rgb & 15]
+    return codes.view("<U7").reshape(shape)
+
+
+def rgb_to_dec_array(rgb_array):
+    '''
+    Converts an array of RGB (range 0-255) to decimal (range 0-1) colors
+    
+    Required input:
+        rgb_array (array-like): RGB values (range 0-255), shape (..., 3) or (..., 4);
+                                any alpha values are dropped
+        
+    Output:
+        A numpy float array, shape (..., 3), of decimal values (0-1)
+    '''
+    return np.asarray(rgb_array, dtype=np.float64)[..., :3] / 255
+
+
+def dec_to_rgb_array(dec_array):
+    '''
+    Converts an array of decimal (range 0-1) to RGB (range 0-255) colors
+    
+    Required input:
+        dec_array (array-like): decimal values (0-1), shape (..., 3) or (..., 4);
+                                any alpha values are dropped
+        
+    Output:
+        A numpy integer array, shape (..., 3), of RGB values (range 0-255)
+    '''
+    return np.rint(np.asarray(dec_array, dtype=np.float64)[..., :3] * 255).astype(np.int64)
+
+
+def dec_to_uint8_array(dec_array):
+    '''
+    Converts an array of decimal (range 0-1) colors to uint8 (range 0-255) by truncation, as matplotlib
+        does for `cmap(x, bytes=True)`; the conversion of `cmap_to_lut` and `colorize`
+    
+    Required input:
+        dec_array (array-like): decimal values (0-1), any shape (e.g. (..., 3) RGB or (..., 4) RGBA)
+        
+    Output:
+        A numpy uint8 array of the same shape
+    '''
+    return (np.asarray(dec_array, dtype=np.float64) * 255).astype(np.uint8)
 
 
 def hex_to_rgb(hex_string):
@@ -59,6 +172,240 @@ def dec_to_rgb(dec_list):
     return [int(round(v*255)) for v in dec_list[:3]]
 
 
+# Matrices for perceptual color spaces (sRGB primaries, D65 white point)
+_RGB_TO_XYZ = np.array([[0.4124564, 0.3575761, 0.1804375],
+                        [0.2126729, 0.7151522, 0.0721750],
+                        [0.0193339, 0.1191920, 0.9503041]])
+_XYZ_TO_RGB = np.linalg.inv(_RGB_TO_XYZ)
+_WHITE_D65 = _RGB_TO_XYZ.sum(axis=1)
+_RGB_TO_LMS = np.array([[0.4122214708, 0.5363325363, 0.0514459929],    # OKLab (Ottosson 2020)
+                        [0.2119034982, 0.6806995451, 0.1073969566],
+                        [0.0883024619, 0.2817188376, 0.6299787005]])
+_LMS_TO_OKLAB = np.array([[0.2104542553,  0.7936177850, -0.0040720468],
+                          [1.9779984951, -2.4285922050,  0.4505937099],
+                          [0.0259040371,  0.7827717662, -0.8086757660]])
+_LMS_TO_RGB = np.linalg.inv(_RGB_TO_LMS)
+_OKLAB_TO_LMS = np.linalg.inv(_LMS_TO_OKLAB)
+
+
+def srgb_to_linear(dec_array):
+    '''
+    Removes the sRGB gamma encoding from decimal (range 0-1) colors, array shape (..., 3)
+    '''
+    c = np.asarray(dec_array, dtype=np.float64)
+    return np.where(c <= 0.04045, c/12.92, ((c + 0.055)/1.055)**2.4)
+
+
+def linear_to_srgb(lin_array):
+    '''
+    Applies the sRGB gamma encoding to linear-light colors, array shape (..., 3)
+    '''
+    c = np.clip(np.asarray(lin_array, dtype=np.float64), 0.0, None)
+    return np.where(c <= 0.0031308, 12.92*c, 1.055*c**(1/2.4) - 0.055)
+
+
+def dec_to_oklab(dec_array):
+    '''
+    Converts decimal (range 0-1) sRGB colors, array shape (..., 3), to OKLab (L range 0-1)
+    '''
+    lms = srgb_to_linear(dec_array) @ _RGB_TO_LMS.T
+    return np.cbrt(lms) @ _LMS_TO_OKLAB.T
+
+
+def oklab_to_dec(lab_array):
+    '''
+    Converts OKLab colors, array shape (..., 3), to decimal sRGB; out-of-gamut values are not clipped
+    '''
+    lms = (np.asarray(lab_array, dtype=np.float64) @ _OKLAB_TO_LMS.T)**3
+    return _gamma_signed(lms @ _LMS_TO_RGB.T)
+
+
+def dec_to_cielab(dec_array):
+    '''
+    Converts decimal (range 0-1) sRGB colors, array shape (..., 3), to CIELAB (L* range 0-100)
+    '''
+    xyz = (srgb_to_linear(dec_array) @ _RGB_TO_XYZ.T) / _WHITE_D65
+    f = np.where(xyz > (6/29)**3, np.cbrt(xyz), xyz/(3*(6/29)**2) + 4/29)
+    return np.stack([116*f[..., 1] - 16, 500*(f[..., 0] - f[..., 1]), 200*(f[..., 1] - f[..., 2])], axis=-1)
+
+
+def cielab_to_dec(lab_array):
+    '''
+    Converts CIELAB colors, array shape (..., 3), to decimal sRGB; out-of-gamut values are not clipped
+    '''
+    lab = np.asarray(lab_array, dtype=np.float64)
+    fy = (lab[..., 0] + 16)/116
+    f = np.stack([fy + lab[..., 1]/500, fy, fy - lab[..., 2]/200], axis=-1)
+    xyz = np.where(f > 6/29, f**3, 3*(6/29)**2*(f - 4/29)) * _WHITE_D65
+    return _gamma_signed(xyz @ _XYZ_TO_RGB.T)
+
+
+def _gamma_signed(lin):
+    # sRGB encoding that keeps the sign of out-of-gamut (negative) values so they can be detected
+    return np.sign(lin) * linear_to_srgb(np.abs(lin))
+
+
+# Lightness models usable by grad_brite: (forward transform, inverse transform, L value of white)
+_LITE_MODELS = {"oklab":  (dec_to_oklab, oklab_to_dec, 1.0),
+                "cielab": (dec_to_cielab, cielab_to_dec, 100.0)}
+
+
+def match_lightness(dec_array, lite, lite_model="oklab", n_iter=24):
+    '''
+    Sets the perceptual lightness of every color in an array at once, keeping hue.
+        Colors that fall outside the sRGB gamut at the requested lightness are gamut-mapped
+        by reducing their chroma (bisection, all colors in parallel) rather than being clipped.
+        
+    Required input:
+        dec_array (array) = decimal (range 0-1) RGB colors, shape (..., 3)
+        lite      (array) = target lightness for each color on a scale 0.0-1.0, shape (...)
+        
+    Optional input:
+        lite_model  (str) = 'oklab' (default) or 'cielab'
+        n_iter      (int) = number of bisection steps for gamut mapping (default 24)
+        
+    Output:
+        A numpy array, shape (..., 3), of decimal RGB colors
+    '''
+    to_lab, from_lab, l_white = _LITE_MODELS[lite_model]
+    lab = to_lab(dec_array)
+    lab[..., 0] = np.clip(lite, 0.0, 1.0) * l_white
+    
+    def in_gamut(scale):
+        rgb = from_lab(np.concatenate([lab[..., :1], lab[..., 1:]*scale[..., None]], axis=-1))
+        return np.all((rgb >= -1e-9) & (rgb <= 1.0+1e-9), axis=-1), rgb
+    
+    ok, rgb = in_gamut(np.ones(lab.shape[:-1]))
+    if not ok.all():
+        lo = np.zeros(lab.shape[:-1]); hi = np.ones(lab.shape[:-1])   # Chroma scale factors bracketing the gamut edge
+        for _ in range(n_iter):
+            mid = 0.5*(lo + hi)
+            ok_mid = in_gamut(mid)[0]
+            lo = np.where(ok_mid, mid, lo)
+            hi = np.where(ok_mid, hi, mid)
+        rgb = np.where(ok[..., None], rgb, in_gamut(lo)[1])
+    return np.clip(rgb, 0.0, 1.0)
+
+
+def brite_ramp(ncol, lite_0, lite_1, mid_lite=None, mid_spot=None, dtype=np.float64):
+    '''
+    Target brightnesses along a colormap, in 1 or 2 linear segments, as used by `grad_brite`.
+        The brightness arguments may also be arrays of equal shape (...), one value per candidate
+        colormap, to build many ramps in one call.
+        
+    Required input:
+        ncol             (int) = number of colors in the colormap
+        lite_0, lite_1 (float) = brightness (0.0-1.0) of the first and last colors
+        
+    Optional input:
+        mid_lite, mid_spot (float) = intermediate brightness and its position (0.0-1.0) between the two segments
+        dtype          (data-type) = floating point type of the result (default float64)
+        
+    Output:
+        A numpy array of brightnesses, shape (..., ncol)
+    '''
+    i_col = np.arange(ncol, dtype=dtype)
+    lite_0 = np.asarray(lite_0, dtype=dtype)[..., None]
+    lite_1 = np.asarray(lite_1, dtype=dtype)[..., None]
+    if mid_lite is None:     # Only one segment
+        return lite_0 + (lite_1-lite_0)*i_col/dtype(ncol-1)
+    mid_lite = np.asarray(mid_lite, dtype=dtype)[..., None]
+    mid_x = np.rint(np.asarray(mid_spot)*(ncol-1)).astype(int)[..., None]
+    mid_x = np.maximum(np.minimum(mid_x,(ncol-2)),1).astype(dtype) # Ensures midpoint is not same as first or last point
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(i_col < mid_x, lite_0 + (mid_lite-lite_0)*i_col/mid_x,
+                        mid_lite + (lite_1-mid_lite)*(i_col-mid_x)/(ncol-mid_x-1))
+
+
+def apply_brite(dec_array, lite, lite_model='luma'):
+    '''
+    Adjusts colors to target brightnesses, as `grad_brite` does; works on many colormaps at once
+        
+    Required input:
+        dec_array (array) = decimal (range 0-1) RGB colors, shape (..., 3)
+        lite      (array) = target brightness (0.0-1.0) for each color, shape (...)
+        
+    Optional input:
+        lite_model  (str) = 'luma' (default), 'oklab' or 'cielab' - see `grad_brite`
+        
+    Output:
+        A numpy array, shape (..., 3), of decimal RGB colors
+    '''
+    if lite_model in _LITE_MODELS:
+        return match_lightness(dec_array, lite, lite_model=lite_model).astype(dec_array.dtype, copy=False)
+    if lite_model != 'luma':
+        raise PaletteSpecError("Unknown lightness model: "+str(lite_model))
+    luma = np.array([0.30, 0.59, 0.11], dtype=dec_array.dtype)      # NTSC luma perception weightings for R, G, B
+    # (stacked as 1x3 @ 3x1 products so each color sums exactly as a scalar np.dot does)
+    lite_rez = (dec_array[...,None,:] @ luma[:,None])[...,0,0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rgb = (lite/lite_rez)[...,None] * dec_array
+    return np.clip(rgb, 0.0, 1.0, out=rgb)
+
+
+# Largest number of colors grad_brite will produce
+MAX_NCOL = 65536
+
+_HEX_PATTERN = re.compile(r"#?([0-9a-fA-F]{3}|[0-9a-fA-F]{6}|[0-9a-fA-F]{8})")
+
+
+def _spec_number(name, value, lo=None, hi=None):
+    # A numeric grad_brite argument as a Python float, or PaletteSpecError if it is not a finite number in [lo, hi]
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise PaletteSpecError(f"{name} must be a number, not {value!r}") from None
+    if not np.isfinite(number) or (lo is not None and number < lo) or (hi is not None and number > hi):
+        raise PaletteSpecError(f"{name} out of range: {value!r}")
+    return number
+
+
+def check_palette_spec(xrgb, pcol=None, lite_0=0.0, lite_1=1.0, mid_lite=None, mid_spot=None, lite_model='luma',
+                       strict=False, **kwargs):
+    '''
+    Checks the arguments of a `grad_brite` call, raising PaletteSpecError for the first problem found.
+        Other keyword arguments of grad_brite are accepted and ignored.
+        
+    The checks grad_brite always makes are those it made with sys.exit (color positions starting at 0.0,
+        ending at 1.0 and one per color; mid_spot given with mid_lite), plus at least two colors and a known
+        lightness model. With strict=True (as in `grad_brite_many`), it also rejects colors that are not hex
+        strings, positions that decrease, brightnesses that are not finite numbers, and mid_lite or mid_spot
+        outside 0.0-1.0.
+        
+    Output:
+        With strict=True, dictionary of the brightness arguments as Python floats (lite_0, lite_1, and
+        mid_lite, mid_spot when given); otherwise None
+    '''
+    if isinstance(xrgb, str) or len(xrgb) < 2:
+        raise PaletteSpecError("At least two colors are needed.")
+    if strict:
+        bad = [x for x in xrgb if not (isinstance(x, str) and _HEX_PATTERN.fullmatch(x))]
+        if bad:
+            raise PaletteSpecError("Not hex color strings: "+", ".join(map(repr, bad)))
+    if pcol:
+        if pcol[0] != 0.0:
+            raise PaletteSpecError("First color position must be 0.0.")
+        if pcol[-1] != 1.0:
+            raise PaletteSpecError("Last color position must be 1.0.")
+        if len(xrgb) != len(pcol):
+            raise PaletteSpecError("List of positions is not the same length as list of colors.")
+        if strict and np.any(np.diff(pcol) < 0):
+            raise PaletteSpecError("Color positions must be in increasing order.")
+    if mid_lite and not mid_spot:
+        raise PaletteSpecError("Location for intermediate brightness unspecified.")
+    if lite_model != 'luma' and lite_model not in _LITE_MODELS:
+        raise PaletteSpecError("Unknown lightness model: "+str(lite_model))
+    if not strict:
+        return None
+    # lite_0 and lite_1 are clipped to 0-1 by grad_brite; the intermediate brightness and its position are not
+    numbers = {'lite_0': _spec_number('lite_0', lite_0), 'lite_1': _spec_number('lite_1', lite_1)}
+    if mid_lite:
+        numbers['mid_lite'] = _spec_number('mid_lite', mid_lite, 0.0, 1.0)
+    if mid_spot is not None:
+        numbers['mid_spot'] = _spec_number('mid_spot', mid_spot, 0.0, 1.0)
+    return numbers
+
+
 def get_continuous_cmap(hex_list, float_list=None, ncol=256):
     ''' 
     Creates and returns a color map that can be used in heat map figures.
@@ -87,12 +434,45 @@ def get_continuous_cmap(hex_list, float_list=None, ncol=256):
     for num, col in enumerate(['red', 'green', 'blue']):
         col_list = [[float_list[i], rgb_list[i][num], rgb_list[i][num]] for i in range(len(float_list))]
         cdict[col] = col_list
+    import matplotlib.colors as mcolors
     cmp = mcolors.LinearSegmentedColormap('my_cmp', segmentdata=cdict, N=ncol)
     return cmp
 
 
+def continuous_rgb(hex_list, float_list=None, ncol=256, dtype=np.float64):
+    '''
+    Same color gradient as `get_continuous_cmap`, computed with numpy alone (no matplotlib)
+        
+    Required input:
+        hex_list   (list): List of hex code strings
+        
+    Optional input:
+        float_list (list): List of floats between 0 and 1, same length as hex_list. Must start with 0 and end with 1.
+        ncol        (int): Number of colors in the final colormap - default is 256 (at least 2)
+        dtype (data-type): Floating point type of the computation and result - default is float64
+    
+    Output:
+        A numpy array of shape (ncol, 3) of decimal (0-1) RGB values; for float64, identical to
+        the colors of the `LinearSegmentedColormap` from `get_continuous_cmap`
+    '''
+    rgb = rgb_to_dec_array(hex_to_rgb_array(hex_list)).astype(dtype, copy=False)
+    if float_list:
+        x = np.asarray(float_list, dtype=dtype)
+    else:
+        x = np.linspace(0,1,len(rgb), dtype=dtype)
+        
+    # Linear interpolation between the colors, done the way matplotlib builds its lookup tables
+    x = x * (ncol-1)
+    xind = (ncol-1) * np.linspace(0,1,ncol, dtype=dtype)
+    ind = np.searchsorted(x, xind)[1:-1]
+    distance = (xind[1:-1] - x[ind-1]) / (x[ind] - x[ind-1])
+    lut = np.concatenate([rgb[:1], distance[:,None]*(rgb[ind] - rgb[ind-1]) + rgb[ind-1], rgb[-1:]])
+    return np.clip(lut, 0.0, 1.0)
+
+
 
-def grad_brite(xrgb,pcol=None,lite_0=0.0,lite_1=1.0,mid_lite=None,mid_spot=None, ncol=256):
+def grad_brite(xrgb,pcol=None,lite_0=0.0,lite_1=1.0,mid_lite=None,mid_spot=None, ncol=256, lite_model='luma',
+               as_array=False, dtype=np.float64):
     '''
     Remaps the color sequence xrgb (required) into a constant gradient of brightness 
         on the greyscale in 1 or 2 linear segments.
@@ -119,54 +499,427 @@ def grad_brite(xrgb,pcol=None,lite_0=0.0,lite_1=1.0,mid_lite=None,mid_spot=None,
         mid_spot (float) = position between 0.0 and 1.0 where mid_lite is placed;
                            ignored if mid_lite=None
                 
-        ncol       (int) = number of colors in the final colormap (default is 256)
+        ncol       (int) = number of colors in the final colormap (default is 256, at most MAX_NCOL = 65536)
         
-    The returned result is a ncol-stepped colormap to use as a cmap in plotting
+        lite_model (str) = how brightness is measured and imposed (default is 'luma'):
+                           'luma'   - NTSC luma, colors rescaled by a single factor (may clip at 1.0)
+                           'oklab'  - OKLab lightness L, hue kept, out-of-gamut colors lose chroma
+                           'cielab' - CIELAB lightness L*/100, as for 'oklab'
+        
+        as_array  (bool) = return a numpy array of shape (ncol, 4) of RGBA values (0.0-1.0) instead of
+                           a colormap; matplotlib is then never imported (default is False)
+        
+        dtype (data-type) = floating point type used for the computation and the colors (default is float64);
+                            np.float32 halves the memory of high-resolution maps (e.g. 65536 colors for 16-bit data)
+        
+    The returned result is a ncol-stepped colormap to use as a cmap in plotting.
+    A PaletteSpecError (a kind of ValueError) is raised for invalid colors, positions or options.
     '''
 
-    luma = [0.30, 0.59, 0.11]      # NTSC luma perception weightings for R, G, B
-        
     # Nip potential problems with inputs
+    check_palette_spec(xrgb, pcol=pcol, lite_0=lite_0, lite_1=lite_1, mid_lite=mid_lite, mid_spot=mid_spot,
+                       lite_model=lite_model)
     lite_0 = np.max([0.0,np.min([1.0,lite_0])]) # Range is 0-1
     lite_1 = np.min([1.0,np.max([0.0,lite_1])]) # Range is 0-1
-    ncol   = np.max([2,np.min([1024,ncol])])    # Range is 2-1024
+    ncol   = max(2,min(MAX_NCOL,int(ncol)))      # Range is 2-65536
     
     # Produce a preliminary color map, size ncol, from input colors - brightness will be adjusted below
     if pcol:
-        if pcol[0] != 0.0:
-            sys.exit("ERROR - First color position must be 0.0.")
-        if pcol[-1] != 1.0:
-            sys.exit("ERROR - Last color position must be 1.0.")
-        if len(xrgb) != len(pcol):
-            sys.exit("ERROR - List of positions is not the same length as list of colors.")
-        else:
-            rez = get_continuous_cmap(xrgb, float_list=pcol, ncol=ncol) # Produce color gradient - linear interp'd
+        rgb_rez = continuous_rgb(xrgb, float_list=pcol, ncol=ncol, dtype=dtype) # Produce color gradient - linear interp'd
     else:
-        rez = get_continuous_cmap(xrgb, ncol=ncol) # Produce color gradient - default to equally spaced
+        rgb_rez = continuous_rgb(xrgb, ncol=ncol, dtype=dtype) # Produce color gradient - default to equally spaced
 
-    # Find the brightnesses of the originally supplied/requested colormap
-    lite_rez = [np.dot(luma,rez(i)[:3]) for i in range(rez.N)]
-        
     # Map out the target brightesses for the color map based on inputs
     if mid_lite:         # Two linear segments to interpolate
-        if mid_spot:
-            mid_x = int(np.rint(mid_spot*(ncol-1)))
-            mid_x = np.max([np.min([mid_x,(ncol-2)]),1]) # Ensures midpoint is not same as first or last point
-            lite = [lite_0 + (mid_lite-lite_0)*i/mid_x for i in range(mid_x)] + [mid_lite + (lite_1-mid_lite)*i/(ncol-mid_x-1) for i in range(ncol-mid_x)]
-        else:
-            sys.exit("ERROR - Location for intermediate brightness unspecified.")
+        lite = brite_ramp(ncol, lite_0, lite_1, mid_lite=mid_lite, mid_spot=mid_spot, dtype=dtype)
     else:                # Only one segment
-        lite = [lite_0 + (lite_1-lite_0)*i/(ncol-1) for i in range(ncol)] 
+        lite = brite_ramp(ncol, lite_0, lite_1, dtype=dtype)
 
     # Rescaling of brightnesses at each point to produce perceptually uniform gradients
-    fact = np.array(lite)/np.array(lite_rez)    
-    fact3 = np.repeat(fact, repeats=3).reshape(ncol,3)   # Expand out to 3 array elements for array multiplication
-    nurez3 = np.multiply(fact3,rez(range(ncol))[:,:3])   # Scaled values into a numpy array
-    nurez3 = np.where(nurez3>1.0,1.0,np.where(nurez3<0.0,0.0,nurez3))
-    nurez4 = np.ones((ncol,4)) ; nurez4[:,:-1] = nurez3  # Tack the alphas back on (all set to opaque)
+    nurez4 = np.ones((ncol,4), dtype=dtype)              # Alphas all set to opaque
+    nurez4[:,:3] = apply_brite(rgb_rez, lite, lite_model=lite_model)
+    
+    if as_array:
+        return nurez4
     
     # Create a matplotlib colormap list for output
+    import matplotlib.colors as mcolors
     cmp = mcolors.ListedColormap(nurez4)
     
     return cmp
 
+
+def grad_brite_many(specs, as_array=False, dtype=np.float64):
+    '''
+    Builds many `grad_brite` colormaps at once. All specs are validated up front, strictly (see
+        `check_palette_spec`); the valid ones are grouped by colors, positions, size and lightness model,
+        and each group is built in one vectorized pass over its brightness parameters. A bad spec is
+        reported and skipped rather than stopping the batch.
+    
+    Required input:
+        specs (list) = list of dictionaries of grad_brite keyword arguments (xrgb, pcol, lite_0, lite_1,
+                       mid_lite, mid_spot, ncol, lite_model)
+    
+    Optional input:
+        as_array  (bool) = return numpy RGBA arrays instead of colormaps (default is False)
+        dtype (data-type) = floating point type used for the computation (default is float64)
+    
+    Output:
+        cmaps  (list) = colormaps (or arrays), same order as specs; None where a spec failed
+        errors (list) = None for each spec that succeeded, otherwise the exception it raised
+    '''
+    cmaps = [None] * len(specs)
+    errors = [None] * len(specs)
+    numbers = [None] * len(specs)
+    groups = {}
+    for k, spec in enumerate(specs):
+        try:
+            numbers[k] = check_palette_spec(**spec, strict=True)
+            bad = set(spec) - {'xrgb','pcol','lite_0','lite_1','mid_lite','mid_spot','ncol','lite_model'}
+            if bad:
+                raise PaletteSpecError("Unknown arguments: "+", ".join(sorted(bad)))
+            ncol = max(2,min(MAX_NCOL,int(spec.get('ncol', 256))))
+            pcol = spec.get('pcol')
+            key = (tuple(spec['xrgb']), tuple(pcol) if pcol else None, ncol,
+                   spec.get('lite_model', 'luma'), bool(spec.get('mid_lite')))
+        except Exception as err:
+            errors[k] = err
+            continue
+        groups.setdefault(key, []).append(k)
+    
+    for (xrgb, pcol, ncol, lite_model, two_seg), members in groups.items():
+        try:
+            rgb_rez = continuous_rgb(list(xrgb), float_list=list(pcol) if pcol else None, ncol=ncol, dtype=dtype)
+            get = lambda name, default: np.array([numbers[k].get(name, default) for k in members], dtype=np.float64)
+            lite_0 = np.clip(get('lite_0', 0.0), 0.0, 1.0)
+            lite_1 = np.clip(get('lite_1', 1.0), 0.0, 1.0)
+            if two_seg:
+                lite = brite_ramp(ncol, lite_0, lite_1, mid_lite=get('mid_lite', 0.0), mid_spot=get('mid_spot', 0.0),
+                                  dtype=dtype)
+            else:
+                lite = brite_ramp(ncol, lite_0, lite_1, dtype=dtype)
+            nurez4 = np.ones((len(members), ncol, 4), dtype=dtype)
+            nurez4[..., :3] = apply_brite(np.broadcast_to(rgb_rez, lite.shape + (3,)), lite, lite_model=lite_model)
+        except Exception as err:
+            for k in members:
+                errors[k] = err
+            continue
+        for k, rgba in zip(members, nurez4):
+            if as_array:
+                cmaps[k] = rgba
+            else:
+                import matplotlib.colors as mcolors
+                cmaps[k] = mcolors.ListedColormap(rgba)
+    return cmaps, errors
+
+
+
+def _key_float(x):
+    # A number as a plain Python float for cache keys, so that e.g. np.float64(0.5) and 0.5 give the same key
+    #   (and the same file name in a cache directory); None and non-numbers are kept as they are
+    try:
+        return None if x is None else float(x)
+    except (TypeError, ValueError):
+        return x
+
+
+def _key_floats(xs):
+    # A list of numbers for cache keys (None if empty)
+    return tuple(_key_float(x) for x in xs) if xs is not None and len(xs) else None
+
+
+class CmapCache:
+    '''
+    Keyed cache of colormaps produced by `grad_brite` and `get_continuous_cmap`, with a bounded
+        LRU (least recently used) eviction policy. The same parameters return the same colormap object.
+        
+    Optional input:
+        maxsize    (int) = maximum number of colormaps held in memory (default 128)
+        cache_dir  (str) = if given, `grad_brite` colormaps are also saved there as .npy files
+                           so that other (or restarted) processes can reuse them (default None)
+        
+    Attributes:
+        hits, misses (int) = counts of lookups served from the cache / built from scratch
+    '''
+    def __init__(self, maxsize=128, cache_dir=None):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._cmaps = OrderedDict()
+        self._lock = threading.Lock()            # Guards _cmaps and the counters; colormaps are built outside it
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._cmaps)
+
+    def clear(self):
+        '''
+        Empties the in-memory cache and resets the hit/miss counters (files in cache_dir are kept)
+        '''
+        with self._lock:
+            self._cmaps.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _lookup(self, key, build):
+        with self._lock:
+            if key in self._cmaps:
+                self.hits += 1
+                self._cmaps.move_to_end(key)
+                return self._cmaps[key]
+            self.misses += 1
+        cmp = build()
+        with self._lock:
+            cmp = self._cmaps.setdefault(key, cmp)   # A thread that built the same colormap meanwhile wins
+            self._cmaps.move_to_end(key)
+            if len(self._cmaps) > self.maxsize:
+                self._cmaps.popitem(last=False)      # Evict the least recently used
+        return cmp
+
+    def _disk_path(self, key):
+        import hashlib
+        return os.path.join(self.cache_dir, hashlib.sha1(repr(key).encode()).hexdigest() + ".npy")
+
+    def _build_listed(self, key, build):
+        # Look for the colors on disk first, save them there after building otherwise
+        if not self.cache_dir:
+            return build()
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            import matplotlib.colors as mcolors
+            return mcolors.ListedColormap(np.load(path))
+        cmp = build()
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, cmp.colors)
+        os.replace(tmp, path)                    # Atomic, so concurrent workers never see a partial file
+        return cmp
+
+    def grad_brite(self, xrgb, pcol=None, lite_0=0.0, lite_1=1.0, mid_lite=None, mid_spot=None, ncol=256,
+                   lite_model='luma', dtype=np.float64):
+        '''
+        Cached `grad_brite` - same arguments and result (colormaps only, not as_array)
+        '''
+        key = ("grad_brite", tuple(map(str, xrgb)), _key_floats(pcol), _key_float(lite_0), _key_float(lite_1),
+               _key_float(mid_lite), _key_float(mid_spot), int(ncol), str(lite_model), np.dtype(dtype).str)
+        build = lambda: grad_brite(xrgb, pcol=pcol, lite_0=lite_0, lite_1=lite_1, mid_lite=mid_lite,
+                                   mid_spot=mid_spot, ncol=ncol, lite_model=lite_model, dtype=dtype)
+        return self._lookup(key, lambda: self._build_listed(key, build))
+
+    def get_continuous_cmap(self, hex_list, float_list=None, ncol=256):
+        '''
+        Cached `get_continuous_cmap` - same arguments and result (held in memory only)
+        '''
+        key = ("get_continuous_cmap", tuple(map(str, hex_list)), _key_floats(float_list), int(ncol))
+        return self._lookup(key, lambda: get_continuous_cmap(hex_list, float_list=float_list, ncol=ncol))
+
+
+# Default process-wide cache
+cmap_cache = CmapCache()
+
+
+def cmap_to_lut(cmap):
+    '''
+    Converts a matplotlib colormap into a compact uint8 lookup table
+    
+    Required input:
+        cmap (Colormap or array) = colormap, e.g. as returned by `grad_brite` or `get_continuous_cmap`,
+                                   or an (N, 4) array of RGBA values 0.0-1.0 from `grad_brite(..., as_array=True)`;
+                                   an array gets matplotlib's defaults: under/over are the end colors, bad is transparent
+        
+    Output:
+        A numpy uint8 array of shape (N+3, 4): the N RGBA colors of the colormap (0-255),
+        followed by the colors for under-range, over-range and bad (NaN/masked) values
+    '''
+    if isinstance(cmap, np.ndarray):
+        rgba = np.concatenate([cmap, cmap[:1], cmap[-1:], np.zeros((1, 4))])
+    else:
+        rgba = np.concatenate([cmap(np.arange(cmap.N)),
+                               [cmap.get_under(), cmap.get_over(), cmap.get_bad()]])
+    return dec_to_uint8_array(rgba)
+
+
+def colorize(field, cmap, vmin=None, vmax=None, out=None, chunk_size=1048576):
+    '''
+    Maps a (large) gridded field straight to uint8 RGBA colors through a colormap lookup table,
+        working through the field in chunks so that memory use stays close to the output size.
+        Equivalent to `cmap(Normalize(vmin, vmax)(field), bytes=True)`, up to float32 rounding
+        exactly at color boundaries (float64 and wide integer fields are normalized in float64).
+    
+    Required input:
+        field  (array) = data values of any shape; float32 is the most efficient.
+                         NaNs and masked values (numpy masked array) get the colormap's bad color
+        cmap (Colormap or array) = colormap, RGBA array from `grad_brite(..., as_array=True)`,
+                                   or a uint8 lookup table from `cmap_to_lut`
+        
+    Optional input:
+        vmin, vmax (float) = data values mapped to the bottom and top of the colormap;
+                             values outside get the under/over colors (default: data min/max)
+        out        (array) = preallocated C-contiguous uint8 array of shape field.shape+(4,) to fill
+        chunk_size   (int) = number of values processed at a time (default 2**20)
+        
+    Output:
+        The uint8 RGBA array (out, if given)
+    '''
+    lut = cmap if isinstance(cmap, np.ndarray) and cmap.dtype == np.uint8 else cmap_to_lut(cmap)
+    ncol = len(lut) - 3
+    i_under, i_over, i_bad = ncol, ncol+1, ncol+2
+    
+    data = np.ma.getdata(field)
+    mask = np.ma.getmask(field)
+    if vmin is None:
+        vmin = float(np.nanmin(field))
+    if vmax is None:
+        vmax = float(np.nanmax(field))
+    scale = ncol/(vmax-vmin) if vmax > vmin else 0.0
+    
+    if out is None:
+        out = np.empty(data.shape + (4,), dtype=np.uint8)
+    flat = data.reshape(-1)
+    flat_mask = None if mask is np.ma.nomask else mask.reshape(-1)
+    flat_out = out.reshape(-1, 4)
+    
+    # Work arrays reused for every chunk
+    size = flat.size
+    chunk_size = min(chunk_size, max(size, 1))
+    xbuf = np.empty(chunk_size, dtype=np.result_type(data.dtype, np.float32))  # float64 data stays float64
+    ibuf = np.empty(chunk_size, dtype=np.intp)
+    for start in range(0, size, chunk_size):
+        stop = min(start+chunk_size, size)
+        x = xbuf[:stop-start]
+        ii = ibuf[:stop-start]
+        np.subtract(flat[start:stop], vmin, out=x, casting='unsafe')
+        np.multiply(x, scale, out=x)
+        under = x < 0
+        over = x > ncol
+        bad = np.isnan(x)
+        if flat_mask is not None:
+            bad |= flat_mask[start:stop]
+        np.clip(x, 0, ncol-1, out=x)             # A value of exactly vmax belongs to the top color
+        x[bad] = 0
+        np.copyto(ii, x, casting='unsafe')       # Truncation to the color index
+        ii[under] = i_under
+        ii[over] = i_over
+        ii[bad] = i_bad
+        np.take(lut, ii, axis=0, out=flat_out[start:stop])
+    return out
+
+
+def _colorize_tile(src, out, tile, lut, vmin, vmax, lock=None):
+    # Colorize one tile of src into the same region of out; reads from non-numpy sources are serialized
+    if lock is not None:
+        with lock:
+            block = np.asarray(src[tile])
+    else:
+        block = src[tile]
+    tile_out = out[tile]
+    if tile_out.flags.c_contiguous:
+        colorize(block, lut, vmin, vmax, out=tile_out)
+    else:
+        tile_out[...] = colorize(block, lut, vmin, vmax)
+
+
+def _colorize_tile_file(src_path, out_path, tile, lut, vmin, vmax):
+    # Process-pool version: each worker memory-maps the input and output .npy files itself
+    src = np.load(src_path, mmap_mode='r')
+    out = np.lib.format.open_memmap(out_path, mode='r+')
+    _colorize_tile(src, out, tile, lut, vmin, vmax)
+    out.flush()
+
+
+def _tile_range(src, tile, lock=None):
+    # NaN-aware min and max of one tile, for finding the data range in parallel
+    if lock is not None:
+        with lock:
+            block = np.asarray(src[tile])
+    else:
+        block = src[tile]
+    block = np.ma.filled(np.ma.asarray(block, dtype=np.float32), np.nan)
+    return np.nanmin(block), np.nanmax(block)
+
+
+def colorize_tiled(field, cmap, vmin=None, vmax=None, out=None, tile_shape=(1024, 1024),
+                   max_workers=None, processes=False):
+    '''
+    Colorizes a large 2-D field tile by tile in a pool of threads or processes, each writing its
+        tiles into one shared uint8 RGBA output buffer (see `colorize` for the colormapping itself).
+    
+    Required input:
+        field (array or str) = 2-D data: a numpy array, memory-mapped array, or anything that can be
+                               sliced like one (e.g. a netCDF4 or xarray variable), or the path of a
+                               .npy file, which is then memory-mapped
+        cmap (Colormap or array) = as for `colorize`
+        
+    Optional input:
+        vmin, vmax   (float) = data values mapped to the bottom and top of the colormap (default: data min/max)
+        out   (array or str) = preallocated uint8 array of shape field.shape+(4,), or the path of a .npy file
+                               to be created as a memory-mapped output (required form when processes=True;
+                               a temporary file is used if not given)
+        tile_shape   (tuple) = (rows, columns) of each tile (default (1024, 1024))
+        max_workers    (int) = size of the pool (default: number of CPUs)
+        processes     (bool) = use a process pool instead of threads (default False). Threads are usually
+                               enough, as numpy releases the GIL; processes need field given as a .npy path
+        
+    Output:
+        The uint8 RGBA array (a memory-mapped array if out was a path or processes=True)
+    '''
+    # Pools are only imported when needed, to keep importing this module fast
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+    
+    lut = cmap if isinstance(cmap, np.ndarray) and cmap.dtype == np.uint8 else cmap_to_lut(cmap)
+    src_path = field if isinstance(field, (str, os.PathLike)) else None
+    if src_path is not None:
+        field = np.load(src_path, mmap_mode='r')
+    if processes and src_path is None:
+        raise ValueError("A process pool needs the field as the path of a .npy file.")
+    if processes and not (out is None or isinstance(out, (str, os.PathLike))):
+        raise ValueError("A process pool needs the output as the path of a .npy file.")
+    ny, nx = field.shape
+    tiles = [(slice(j, min(j+tile_shape[0], ny)), slice(i, min(i+tile_shape[1], nx)))
+             for j in range(0, ny, tile_shape[0]) for i in range(0, nx, tile_shape[1])]
+    # netCDF and similar libraries are not thread-safe, so their reads are serialized
+    lock = None if isinstance(field, np.ndarray) else threading.Lock()
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        if vmin is None or vmax is None:
+            ranges = np.array(list(pool.map(lambda t: _tile_range(field, t, lock), tiles)))
+            vmin = float(np.nanmin(ranges[:, 0])) if vmin is None else vmin
+            vmax = float(np.nanmax(ranges[:, 1])) if vmax is None else vmax
+        
+        if processes or isinstance(out, (str, os.PathLike)):
+            if out is None:
+                import tempfile
+                out = tempfile.NamedTemporaryFile(suffix=".npy", delete=False).name
+            out_path = out
+            out = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.uint8, shape=(ny, nx, 4))
+        elif out is None:
+            out = np.empty((ny, nx, 4), dtype=np.uint8)
+        
+        if processes:
+            out.flush()
+            with ProcessPoolExecutor(max_workers=max_workers) as ppool:
+                list(ppool.map(_colorize_tile_file, repeat(src_path), repeat(out_path), tiles,
+                               repeat(lut), repeat(vmin), repeat(vmax)))
+            out = np.lib.format.open_memmap(out_path, mode='r+')
+        else:
+            list(pool.map(lambda t: _colorize_tile(field, out, t, lut, vmin, vmax, lock), tiles))
+    return out
+
+
+def write_image(rgba, filename, **kwargs):
+    '''
+    Writes a uint8 RGBA array (e.g. from `colorize` or `colorize_tiled`) to an image file
+        
+    Required input:
+        rgba    (array) = uint8 array of shape (rows, columns, 4); row 0 is the top of the image
+        filename  (str) = output file; the format follows the extension (.png, .jpg, ...).
+                          Formats without transparency (JPEG) get the RGB channels only
+    Optional input:
+        **kwargs        = passed on to `PIL.Image.save`, e.g. quality=90 or compress_level=1
+    '''
+    from PIL import Image
+    if os.path.splitext(filename)[1].lower() in (".jpg", ".jpeg", ".bmp"):
+        rgba = rgba[..., :3]
+    Image.fromarray(np.ascontiguousarray(rgba)).save(filename, **kwargs)
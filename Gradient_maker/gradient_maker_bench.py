@@ -0,0 +1,180 @@
+'''
+Simple timing benchmarks for the gradient_maker module.
+
+Run from this directory:
+    python gradient_maker_bench.py
+'''
+import os
+import sys
+import time
+import subprocess
+import tracemalloc
+import numpy as np
+
+import gradient_maker as gm
+
+
+def _timeit(func, repeat=3):
+    '''
+    Returns the best wall-clock time (seconds) of `repeat` calls to func()
+    '''
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_conversions(ncolors=1000000):
+    '''
+    Throughput of the vectorized color conversions for ncolors colors
+    '''
+    rng = np.random.default_rng(0)
+    rgb = rng.integers(0, 256, size=(ncolors, 3))
+    hexes = gm.rgb_to_hex_array(rgb)
+    dec = gm.rgb_to_dec_array(rgb)
+
+    print(f"Color conversions, {ncolors:.0e} colors:")
+    for name, func in [("rgb_to_hex_array", lambda: gm.rgb_to_hex_array(rgb)),
+                       ("hex_to_rgb_array", lambda: gm.hex_to_rgb_array(hexes)),
+                       ("rgb_to_dec_array", lambda: gm.rgb_to_dec_array(rgb)),
+                       ("dec_to_rgb_array", lambda: gm.dec_to_rgb_array(dec))]:
+        t = _timeit(func)
+        print(f"  {name:20s} {t*1e3:9.1f} ms   {ncolors/t/1e6:8.1f} Mcolors/s")
+
+    # The scalar functions, one color at a time, for comparison
+    nscalar = min(ncolors, 20000)
+    t = _timeit(lambda: [gm.rgb_to_hex(c) for c in rgb[:nscalar]], repeat=1)
+    print(f"  {'rgb_to_hex (scalar)':20s} {t*1e3*ncolors/nscalar:9.1f} ms   {nscalar/t/1e6:8.1f} Mcolors/s (extrapolated)")
+
+
+def bench_grad_brite(nmaps=1000):
+    '''
+    Time to build one colormap with grad_brite at several sizes, and nmaps of them in a row
+    '''
+    x_koster = ['#0336CE', '#74FBFD', '#e6e6e6', '#e6e6e6','#F7F952', '#C1281B']
+    p_koster = [0.0, 0.45, 0.451, 0.549, 0.55, 1.0]
+    kw = dict(pcol=p_koster, lite_0=0.22, lite_1=0.22, mid_lite=0.96, mid_spot=0.5)
+
+    print("grad_brite:")
+    for ncol in [16, 256, 1024]:
+        t = _timeit(lambda: gm.grad_brite(x_koster, ncol=ncol, **kw), repeat=20)
+        print(f"  ncol={ncol:<6d} {t*1e3:9.3f} ms per map")
+    for ncol in [4096, 16384, 65536]:
+        for dtype in [np.float64, np.float32]:
+            t = _timeit(lambda: gm.grad_brite(x_koster, ncol=ncol, as_array=True, dtype=dtype, **kw), repeat=5)
+            print(f"  ncol={ncol:<6d} {dtype.__name__:8s} {t*1e3:9.3f} ms per map (array)")
+    specs = [dict(xrgb=x_koster, ncol=256, **dict(kw, lite_0=lite_0)) for lite_0 in np.linspace(0, 1, nmaps)]
+    t = _timeit(lambda: gm.grad_brite_many(specs, as_array=True), repeat=1)
+    print(f"  {nmaps} maps, ncol=256, grad_brite_many: {t:.3f} s   ({nmaps/t:.0f} maps/s)")
+    for lite_model in ["luma", "oklab", "cielab"]:
+        t = _timeit(lambda: [gm.grad_brite(x_koster, ncol=256, lite_model=lite_model, **kw) for _ in range(nmaps)], repeat=1)
+        print(f"  {nmaps} maps, ncol=256, lite_model={lite_model:6s}: {t:.3f} s   ({nmaps/t:.0f} maps/s)")
+
+
+def _peak_mb(func):
+    '''
+    Returns the peak memory (MB) allocated while running func()
+    '''
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak/1e6
+
+
+def bench_colorize(shape=(4000, 5000)):
+    '''
+    Time and peak memory of colorize() versus matplotlib's normalize->colormap path on a float32 grid
+    '''
+    import matplotlib.colors as mcolors
+    field = np.random.default_rng(0).normal(size=shape).astype(np.float32)
+    field[::7, ::11] = np.nan
+    cmap = gm.grad_brite(['#0336CE', '#74FBFD', '#F7F952', '#C1281B'], lite_0=0.2, lite_1=0.9)
+    out = np.empty(shape + (4,), dtype=np.uint8)
+
+    print(f"Colorizing a {shape[0]}x{shape[1]} float32 field (output {out.nbytes/1e6:.0f} MB):")
+    for name, func in [("colorize", lambda: gm.colorize(field, cmap, -3, 3, out=out)),
+                       ("matplotlib", lambda: cmap(mcolors.Normalize(-3, 3)(field), bytes=True))]:
+        t = _timeit(func)
+        print(f"  {name:12s} {t*1e3:8.1f} ms   peak extra memory {_peak_mb(func):8.1f} MB")
+
+
+def bench_colorize_tiled(shape=(8000, 8000)):
+    '''
+    Scaling of colorize_tiled with the number of worker threads
+    '''
+    field = np.random.default_rng(0).normal(size=shape).astype(np.float32)
+    cmap = gm.grad_brite(['#0336CE', '#74FBFD', '#F7F952', '#C1281B'], lite_0=0.2, lite_1=0.9)
+    out = np.empty(shape + (4,), dtype=np.uint8)
+
+    print(f"Tiled colorizing of a {shape[0]}x{shape[1]} float32 field ({os.cpu_count()} CPUs):")
+    t1 = None
+    for workers in sorted({1, 2, 4, os.cpu_count()}):
+        t = _timeit(lambda: gm.colorize_tiled(field, cmap, -3, 3, out=out, max_workers=workers), repeat=2)
+        t1 = t1 or t
+        print(f"  {workers:3d} threads {t*1e3:8.1f} ms   speedup {t1/t:5.2f}")
+
+
+def bench_import(repeat=5):
+    '''
+    Time to import gradient_maker in a fresh interpreter, and whether that pulls in matplotlib
+    '''
+    code = ("import sys, time; t0 = time.perf_counter(); import numpy; t1 = time.perf_counter(); "
+            "import gradient_maker; t2 = time.perf_counter(); "
+            "print(t1-t0, t2-t1, 'matplotlib' in sys.modules)")
+    here = os.path.dirname(os.path.abspath(__file__))
+    runs = [subprocess.run([sys.executable, "-c", code], cwd=here, capture_output=True, text=True).stdout.split()
+            for _ in range(repeat)]
+    t_np = min(float(r[0]) for r in runs)
+    t_gm = min(float(r[1]) for r in runs)
+    print(f"Import: numpy {t_np*1e3:.1f} ms, then gradient_maker {t_gm*1e3:.1f} ms (matplotlib loaded: {runs[0][2]})")
+
+
+def bench_metrics(nmaps=2000):
+    '''
+    Time to score nmaps candidate colormaps with gradient_analysis.colormap_metrics
+    '''
+    import gradient_analysis as ga
+    maps = np.stack([gm.grad_brite(['#0336CE', '#74FBFD', '#F7F952', '#C1281B'], lite_0=lite_0, lite_1=0.9,
+                                   as_array=True) for lite_0 in np.linspace(0, 1, nmaps)])
+    t = _timeit(lambda: ga.colormap_metrics(maps))
+    print(f"Colormap metrics: {nmaps} maps of 256 colors in {t:.3f} s")
+
+
+def bench_optimizer():
+    '''
+    Time for optimize_grad_brite to fit a linear lightness ramp and a uniformity objective
+    '''
+    import gradient_analysis as ga
+    xrgb = ['#0336CE', '#74FBFD', '#F7F952', '#C1281B']
+    for label, kw in [("linear L* ramp", dict(target=lambda x: 0.2 + 0.7*x, two_segments=False)),
+                      ("peaked L* profile", dict(target=[0.3, 0.9, 0.3])),
+                      ("uniformity", dict(target='uniform'))]:
+        t0 = time.perf_counter()
+        params, loss = ga.optimize_grad_brite(xrgb, **kw)
+        print(f"Optimizer, {label:18s}: {time.perf_counter()-t0:6.2f} s, loss {loss:.4f}")
+
+
+def bench_export():
+    '''
+    Time to export the whole gradient_palettes catalog in every format of gradient_export
+    '''
+    import tempfile
+    import gradient_export as ge
+    import gradient_palettes as gp
+    with tempfile.TemporaryDirectory() as tmp:
+        t = _timeit(lambda: ge.export_all(list(gp.PALETTES), tmp))
+    print(f"Export of {len(gp.PALETTES)} palettes to all formats: {t:.3f} s")
+
+
+if __name__ == "__main__":
+    bench_import()
+    bench_conversions()
+    bench_grad_brite()
+    bench_colorize()
+    bench_colorize_tiled()
+    bench_metrics()
+    bench_optimizer()
+    bench_export()
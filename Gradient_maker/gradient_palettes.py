@@ -0,0 +1,182 @@
+'''
+Registry of named palettes made with `gradient_maker.grad_brite`.
+
+The parameter sets below are those of the example notebook (Gradient_maker_example.ipynb).
+Their colors are precomputed as uint8 tables in a single bundle file (gradient_palettes.npz)
+and only turned into matplotlib colormaps when first asked for:
+
+    import gradient_palettes as gp
+    cmap = gp.get_palette('icy')
+    gp.register_palettes()           # then e.g. plt.imshow(z, cmap='gm_icy')
+
+After changing PALETTES, rebuild the bundle with `gp.build_palette_bundle()`.
+'''
+import os
+import numpy as np
+
+_BUNDLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gradient_palettes.npz")
+
+_RAINBOW_GRADS = ['#a000c8', '#8200dc', '#1e3cff', '#00a0ff', '#00c8c8', '#00d28c', '#00dc00',
+                  '#a0e632', '#e6dc32', '#e6af2d', '#f08228', '#fa3c3c', '#f00082']
+
+# Parameters for grad_brite, by palette name
+PALETTES = {
+    ### Various scales from GrADS...
+    # The classic rainbow color scale from GrADS, 13 discrete colors
+    'grads':    dict(xrgb=_RAINBOW_GRADS, lite_0=0.25, lite_1=0.30, mid_lite=0.88, mid_spot=0.65, ncol=13),
+    # Rainbow color scale from GrADS rendered as a continuous scale
+    'cgrads':   dict(xrgb=_RAINBOW_GRADS, lite_0=0.25, lite_1=0.30, mid_lite=0.88, mid_spot=0.65),
+    # Blue-white-red color scale from GrADS as a continuous scale
+    'bwrgrads': dict(xrgb=['#0000ff', '#dcdcff', '#ffffff', '#ffdcdc', '#ff0000'], pcol=[0.0, 0.41, 0.50, 0.59, 1.0],
+                     lite_0=0.11, lite_1=0.30, mid_lite=1.00, mid_spot=0.50),
+    # GrADS blue-white-red color scale with brightnesses reversed (i.e., blue deep-violet red)
+    'bkr':      dict(xrgb=['#c8c8ff', '#1414c0', '#600080', '#ff0000', '#ffc8c8'], pcol=[0.0, 0.45, 0.50, 0.55, 1.0],
+                     lite_0=0.90, lite_1=0.90, mid_lite=0.10, mid_spot=0.50),
+    
+    ### Various monotonic scales...
+    'icy':      dict(xrgb=['#FFF7FB', '#D1D2E6', '#56A9CD', '#007E89', '#00695A'], pcol=[0.0, 0.25, 0.50, 0.75, 1.0],
+                     lite_0=0.99, lite_1=0.10, mid_lite=0.6, mid_spot=0.5),
+    'beachy':   dict(xrgb=['#50635A', '#8188F6', '#FF87BB'], pcol=[0.0, 0.70, 1.0],
+                     lite_0=0.99, lite_1=0.10, mid_lite=0.5, mid_spot=0.5),
+    'toasty':   dict(xrgb=['#FFF6C0', '#ef3018', '#6C2610'], pcol=[0.0, 0.50, 1.0],
+                     lite_0=0.99, lite_1=0.10, mid_lite=0.5, mid_spot=0.5),
+    'fleshy':   dict(xrgb=['#ffd8e0', '#f48a6f', '#704401'], pcol=[0.0, 0.50, 1.0],
+                     lite_0=0.99, lite_1=0.10, mid_lite=0.5, mid_spot=0.5),
+    'guacky':   dict(xrgb=['#ffffac', '#538e14', '#1a3f11', '#54402a'], pcol=[0.0, 0.35, 0.70, 1.0],
+                     lite_0=0.99, lite_1=0.20, mid_lite=0.5, mid_spot=0.5),
+    'leafy':    dict(xrgb=['#E7DFD4', '#CEBBA9', '#61BE68', '#3C653F'], pcol=[0.0, 0.3, 0.55, 1.0],
+                     lite_0=0.97, lite_1=0.15, mid_lite=0.55, mid_spot=0.5),
+    'woody':    dict(xrgb=['#fafad6', '#b3642f', '#87502E', '#4a002c'], pcol=[0.0, 0.2, 0.7, 1.0],
+                     lite_0=0.97, lite_1=0.10, mid_lite=0.55, mid_spot=0.5),
+    'dusky':    dict(xrgb=['#ffe5cb', '#d997ba', '#7c5089', '#0d0026'], pcol=[0.0, 0.2, 0.5, 1.0],
+                     lite_0=0.97, lite_1=0.10, mid_lite=0.55, mid_spot=0.5),
+    # Guo et al. (2006; https://doi.org/10.1175/JHM511.1) - GLACE coupling metric
+    'glace':    dict(xrgb=['#FFFFFF', '#D9DD76', '#E8CC3E', '#D5883A', '#C1462E', '#8A3729'],
+                     pcol=[0.0, 0.12, 0.25, 0.625, 0.875, 1.0], lite_0=1.00, lite_1=0.30),
+    
+    ### Various divergent scales...
+    # Koster et al. (2010; https://doi.org/10.1029/2009GL041677) - forecast skill
+    'koster':   dict(xrgb=['#0336CE', '#74FBFD', '#e6e6e6', '#e6e6e6', '#F7F952', '#C1281B'],
+                     pcol=[0.0, 0.45, 0.451, 0.549, 0.55, 1.0], lite_0=0.22, lite_1=0.22, mid_lite=0.96, mid_spot=0.5),
+    # Dirmeyer et al. (2013; https://doi.org/10.1175/JHM-D-12-0107.1) - CMIP model consensus
+    'cmip':     dict(xrgb=['#00153F', '#435FA5', '#E0E0EC', '#D0D3D3', '#F6E1DF', '#DA483D', '#8A2A2B'],
+                     pcol=[0.0, 0.12, 0.49, 0.50, 0.51, 0.88, 1.0], lite_0=0.10, lite_1=0.15, mid_lite=0.94, mid_spot=0.50),
+    # Badger & Dirmeyer (2015; https://doi.org/10.5194/hess-19-4547-2015)
+    'badger':   dict(xrgb=['#993404', '#FEE391', '#D0D1E6', '#045A8D'], pcol=[0.0, 0.496, 0.504, 1.0],
+                     lite_0=0.30, lite_1=0.30, mid_lite=0.95, mid_spot=0.5),
+    'badger2':  dict(xrgb=['#00441B', '#CCECE6', '#D0D1E6', '#045A8D'], pcol=[0.0, 0.496, 0.504, 1.0],
+                     lite_0=0.30, lite_1=0.30, mid_lite=0.95, mid_spot=0.5),     # NOT GOOD FOR TRITANOPIA
+    'badger3':  dict(xrgb=['#993404', '#FEE391', '#CCECE6', '#00441B'], pcol=[0.0, 0.496, 0.504, 1.0],
+                     lite_0=0.30, lite_1=0.30, mid_lite=0.95, mid_spot=0.5),     # NOT GOOD FOR PROTANOPIA, DEUTERANOPIA
+    # Dirmeyer (2013; https://doi.org/10.1007/s00382-013-1866-x) - hydrologic, dry to normal to wet
+    'hydro':    dict(xrgb=['#582510', '#EBCC90', '#FDF3C3', '#DDFCD2', '#7CB8A0', '#1E3B58'],
+                     pcol=[0.0, 0.25, 0.42, 0.58, 0.75, 1.0], lite_0=0.20, lite_1=0.20, mid_lite=1.0, mid_spot=0.5),
+    # Dirmeyer et al. (2013; https://doi.org/10.1175/JCLI-D-13-00029.1)
+    'isi':      dict(xrgb=['#642B80', '#372D81', '#B1CDEA', '#ECfCEC', '#F3EA85', '#D44435', '#882018'],
+                     pcol=[0.0, 0.12, 0.46, 0.50, 0.54, 0.88, 1.0], lite_0=0.25, lite_1=0.25, mid_lite=0.99, mid_spot=0.50),
+    # Dirmeyer & Kinter (2010; https://doi.org/0.1175/2010JHM1196.1) - water vapor transport anomalies
+    'maya':     dict(xrgb=['#8B241C', '#756650', '#CDC5B5', '#BBc9cE', '#31569F', '#893C8C'],
+                     pcol=[0.0, 0.08, 0.42, 0.58, 0.90, 1.0], lite_0=0.25, lite_1=0.25, mid_lite=0.97, mid_spot=0.5),
+    # Dirmeyer et al. (2011; https://doi.org/10.1007/s00382-011-1127-9) - very similar to DEUTERANOPIA vision
+    'athena':   dict(xrgb=['#6F4E19', '#6F4E19', '#DDDDDD', '#ABAFF6', '#3940AD', '#382074'],
+                     pcol=[0.0, 0.48, 0.52, 0.61, 0.89, 1.0], lite_0=0.25, lite_1=0.25, mid_lite=0.99, mid_spot=0.50),
+    # Kumar et al. (2013; https://doi.org/10.1175/JCLI-D-12-00535.1) - purple to pomegranate
+    'kumar':    dict(xrgb=['#512C7A', '#D7C6DD', '#FAF2CA', '#F4B14F', '#dB4C3C'], pcol=[0.0, 0.499, 0.501, 0.80, 1.0],
+                     lite_0=0.24, lite_1=0.48, mid_lite=0.96, mid_spot=0.5),
+    
+    ### Various tailed scales...
+    # Dirmeyer & Brubaker (2007; https://doi.org/10.1175/JHM557.1) - water vapor back trajectory sources
+    'brubaker': dict(xrgb=['#F7F8D6', '#ACD1BD', '#52ACC6', '#2F4C9C', '#7E4F9B', '#A67BB0'],
+                     pcol=[0.0, 0.25, 0.50, 0.75, 0.875, 1.0], lite_0=0.96, lite_1=0.7, mid_lite=0.2, mid_spot=0.9),
+    # Dirmeyer et al. (2018; https://doi.org/10.1029/2018JD029103) - harvested predictability
+    'halder':   dict(xrgb=['#E6E6E6', '#F3F692', '#5FCDAC', '#3460B4', '#704387', '#B4264A'],
+                     pcol=[0.0, 0.12, 0.60, 0.82, 0.93, 1.0], lite_0=0.98, lite_1=0.45, mid_lite=0.25, mid_spot=0.9),
+    # Two-legged land-atmosphere coupling metrics
+    'loco':     dict(xrgb=['#523C7D', '#434C88', '#50B5DC', '#CAE1D6', '#E5DD5D', '#E7AE52', '#CC5042', '#85243D'],
+                     pcol=[0.0, 0.05, 0.20, 0.30, 0.35, 0.55, 0.75, 1.0], lite_0=0.40, lite_1=0.20, mid_lite=0.96, mid_spot=0.3),
+}
+
+_tables = None       # The bundle, opened on first use
+_palettes = {}       # Colormaps already materialized, by name
+_LazyPalette = None  # Class of the colormaps registered with matplotlib, defined on first registration
+
+
+def palette_table(name):
+    '''
+    Returns the uint8 table (shape (ncol, 3), range 0-255) of a named palette,
+        from the bundle if it is there, otherwise computed with grad_brite
+    '''
+    global _tables
+    if _tables is None:
+        _tables = np.load(_BUNDLE) if os.path.exists(_BUNDLE) else {}
+    if name in _tables:
+        return _tables[name]
+    if name not in PALETTES:
+        raise KeyError(f"Unknown palette '{name}'; available: {', '.join(PALETTES)}")
+    import gradient_maker as gm
+    return gm.dec_to_rgb_array(gm.grad_brite(**PALETTES[name]).colors).astype(np.uint8)
+
+
+def get_palette(name):
+    '''
+    Returns the named palette as a matplotlib `ListedColormap`, materialized on first access
+    '''
+    if name not in _palettes:
+        import matplotlib.colors as mcolors
+        _palettes[name] = mcolors.ListedColormap(palette_table(name)/255, name=name)
+    return _palettes[name]
+
+
+def _registered_palette(palette, name):
+    # A colormap for matplotlib's registry that reads its colors only when first drawn with;
+    #   the class is defined here so that matplotlib is only imported when needed
+    global _LazyPalette
+    if _LazyPalette is None:
+        import matplotlib.colors as mcolors
+
+        class _LazyPalette(mcolors.ListedColormap):
+            def __init__(self, palette, name):
+                self._palette = palette
+                # ListedColormap.__init__ would need the colors; the size is known from the parameters
+                mcolors.Colormap.__init__(self, name, PALETTES[palette].get('ncol', 256))
+
+            @property
+            def colors(self):
+                if '_colors' not in self.__dict__:
+                    self._colors = get_palette(self._palette).colors
+                return self._colors
+
+            @colors.setter
+            def colors(self, value):
+                self._colors = value
+
+            def __reduce__(self):
+                # Pickled by palette name and state, as the class is not importable from the module
+                return _registered_palette, (self._palette, self.name), self.__dict__
+
+    return _LazyPalette(palette, name)
+
+
+def register_palettes(prefix="gm_"):
+    '''
+    Registers all palettes with matplotlib's colormap registry as prefix+name (e.g. 'gm_icy'),
+        so they can be used as cmap='gm_icy'. Palettes already registered are left alone.
+        Registering is cheap: each palette's colors are only read when it is first used.
+    '''
+    import matplotlib
+    for name in PALETTES:
+        if prefix+name not in matplotlib.colormaps:
+            matplotlib.colormaps.register(_registered_palette(name, prefix+name), name=prefix+name)
+
+
+def build_palette_bundle(path=_BUNDLE):
+    '''
+    (Re)computes all palettes in PALETTES with grad_brite and saves their uint8 tables in one bundle file
+    '''
+    global _tables
+    import gradient_maker as gm
+    tables = {name: gm.dec_to_rgb_array(gm.grad_brite(**spec).colors).astype(np.uint8)
+              for name, spec in PALETTES.items()}
+    np.savez_compressed(path, **tables)
+    _tables = None
+    _palettes.clear()
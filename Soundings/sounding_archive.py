@@ -0,0 +1,200 @@
+'''
+Local archive of soundings, for working offline and with many thousands of soundings.
+
+An archive is a directory holding one float32 file per sounding column (all levels of all
+soundings, one sounding after another), read through memory maps, and an index of
+(station, time, first level, number of levels) sorted by station and time:
+
+    archive/
+        archive.json        format, version and columns
+        index.npy           structured array of the soundings
+        pressure.f32, height.f32, temperature.f32, dewpoint.f32, direction.f32, speed.f32
+
+Nothing is parsed when a sounding is read: finding it is a binary search in the index, and
+its columns are slices of the memory maps.
+
+    import sounding_archive as sa
+    arc = sa.SoundingArchive('soundings.arc')
+    arc.append(df)                                  # e.g. a DataFrame from WyomingUpperAir
+    sp.plot_skewt(arc.get('IAD', '2021-07-07 00:00'))
+'''
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+ARCHIVE_VERSION = 1
+COLUMNS = ('pressure', 'height', 'temperature', 'dewpoint', 'direction', 'speed')
+INDEX_DTYPE = np.dtype([('station', 'U16'), ('time', 'datetime64[s]'), ('start', 'i8'), ('nlev', 'i4')])
+STATION_LENGTH = INDEX_DTYPE['station'].itemsize // 4      # Longest station id the index can hold
+
+
+def _as_time(time):
+    # Any datetime-like value as a numpy datetime64 in seconds, the resolution of the index
+    if isinstance(time, np.datetime64):
+        return time.astype('datetime64[s]')
+    return np.datetime64(pd.Timestamp(time).to_datetime64(), 's')
+
+
+class SoundingArchive:
+    '''
+    A directory of memory-mapped sounding columns with an index keyed by (station, time)
+
+    Required input:
+        path (str) = archive directory (created if it does not exist)
+
+    Soundings are added with `append` and read with `get` (a DataFrame) or `arrays` (a dictionary
+        of float32 views into the memory maps, no copy). `len(arc)`, `(station, time) in arc` and
+        `arc.index` (the structured index array) describe the contents.
+    '''
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        meta_file = os.path.join(path, "archive.json")
+        if os.path.exists(meta_file):
+            with open(meta_file) as f:
+                meta = json.load(f)
+            if meta.get("version") != ARCHIVE_VERSION or tuple(meta.get("columns", ())) != COLUMNS:
+                raise ValueError(f"Unsupported sounding archive format in {path}: {meta}")
+        else:
+            with open(meta_file, "w") as f:
+                json.dump({"format": "sounding archive", "version": ARCHIVE_VERSION,
+                           "dtype": "float32", "columns": list(COLUMNS)}, f, indent=1)
+        index_file = os.path.join(path, "index.npy")
+        self._set_index(np.load(index_file) if os.path.exists(index_file) else np.empty(0, INDEX_DTYPE))
+        self._maps = None
+
+    def _set_index(self, index):
+        # Keeps the index sorted by station and time, with the index range of each station
+        self.index = index[np.lexsort((index['time'], index['station']))]
+        self._times = self.index['time'].copy()
+        self._starts = self.index['start'].tolist()
+        self._nlevs = self.index['nlev'].tolist()
+        stations, first, count = np.unique(self.index['station'], return_index=True, return_counts=True)
+        self._stations = {s: (i, i+n) for s, i, n in zip(stations.tolist(), first.tolist(), count.tolist())}
+
+    def _columns(self):
+        # Memory maps of the column files, opened on first use
+        if self._maps is None:
+            self._maps = {}
+            for col in COLUMNS:
+                name = os.path.join(self.path, col + ".f32")
+                size = os.path.getsize(name) if os.path.exists(name) else 0
+                # Plain ndarray views of the maps, as slicing np.memmap objects is comparatively slow
+                self._maps[col] = np.asarray(np.memmap(name, dtype=np.float32, mode='r')) if size \
+                                  else np.empty(0, np.float32)
+        return self._maps
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return self._locate(*key) is not None
+
+    def stations(self):
+        '''
+        List of the stations in the archive
+        '''
+        return list(self._stations)
+
+    def _locate(self, station, time):
+        # Position of (station, time) in the index, or None
+        lo, hi = self._stations.get(station, (0, 0))
+        t = _as_time(time)
+        i = lo + int(self._times[lo:hi].searchsorted(t))
+        return i if i < hi and self._times[i] == t else None
+
+    def find(self, station=None, start=None, end=None):
+        '''
+        Index entries of the soundings of one station (or all) with start <= time <= end (either may be None)
+        '''
+        lo, hi = self._stations.get(station, (0, 0)) if station is not None else (0, len(self.index))
+        entries = self.index[lo:hi]
+        if start is not None:
+            entries = entries[entries['time'] >= _as_time(start)]
+        if end is not None:
+            entries = entries[entries['time'] <= _as_time(end)]
+        return entries
+
+    def arrays(self, station, time):
+        '''
+        The columns of one sounding as a dictionary of read-only float32 arrays (views of the memory maps)
+        '''
+        i = self._locate(station, time)
+        if i is None:
+            raise KeyError((station, time))
+        start, nlev = self._starts[i], self._nlevs[i]
+        return {col: m[start:start+nlev] for col, m in self._columns().items()}
+
+    def get(self, station, time):
+        '''
+        One sounding as a DataFrame in the layout of WyomingUpperAir, ready for plot_skewt and compute_diagnostics
+        '''
+        df = pd.DataFrame(self.arrays(station, time), copy=False)
+        df['station'] = station
+        df['time'] = pd.Timestamp(_as_time(time))
+        return df
+
+    def soundings(self, station=None, start=None, end=None):
+        '''
+        Yields the DataFrames of the soundings selected as for `find`, in station and time order
+        '''
+        for entry in self.find(station, start, end):
+            yield self.get(entry['station'], entry['time'])
+
+    def append(self, soundings):
+        '''
+        Adds one sounding DataFrame, or an iterable of them, to the archive. Each needs 'station' and 'time'
+            columns; a sounding already in the archive under the same station and time is replaced.
+            Columns missing from a DataFrame are stored as nan. Station ids longer than STATION_LENGTH
+            characters raise ValueError. If any sounding cannot be added, none are: the column files
+            are cut back to their previous length and the index is left as it was.
+        '''
+        if isinstance(soundings, pd.DataFrame):
+            soundings = [soundings]
+        files = {col: open(os.path.join(self.path, col + ".f32"), "ab") for col in COLUMNS}
+        sizes = {col: f.seek(0, os.SEEK_END) for col, f in files.items()}
+        previous = self.index
+        try:
+            offset = sizes['pressure'] // 4
+            new = []
+            for df in soundings:
+                station = df['station'].iloc[0]
+                if len(str(station)) > STATION_LENGTH:
+                    raise ValueError(f"Station id longer than {STATION_LENGTH} characters: {station!r}")
+                nlev = len(df)
+                for col, f in files.items():
+                    values = df[col].values if col in df else np.full(nlev, np.nan)
+                    f.write(np.asarray(values, dtype=np.float32).tobytes())
+                new.append((station, _as_time(df['time'].iloc[0]), offset, nlev))
+                offset += nlev
+            for f in files.values():
+                f.flush()
+            # The index only refers to the new levels once all columns are written
+            new = np.array(new, dtype=INDEX_DTYPE)
+            # Drop older entries for the same keys (their levels stay in the files, unreferenced)
+            keys = self._keys(new)
+            _, last = np.unique(keys[::-1], return_index=True)
+            new = new[np.sort(len(new)-1-last)]
+            old = self.index[~np.isin(self._keys(self.index), keys)]
+            self._set_index(np.concatenate([old, new]))
+            tmp = os.path.join(self.path, "index.tmp.npy")
+            np.save(tmp, self.index)
+            os.replace(tmp, os.path.join(self.path, "index.npy"))
+        except BaseException:
+            # Columns of equal length again, as the next offset is taken from the pressure file
+            for col, f in files.items():
+                f.truncate(sizes[col])
+            self._set_index(previous)
+            raise
+        finally:
+            for f in files.values():
+                f.close()
+        self._maps = None
+        return len(new)
+
+    @staticmethod
+    def _keys(index):
+        # One string key per index entry, for matching entries between indexes
+        return np.char.add(np.char.add(index['station'], '|'), index['time'].astype(str))
@@ -0,0 +1,232 @@
+'''
+Batch processing of many soundings into a climatology table.
+
+Each sounding is reduced by `sounding_plotter.compute_diagnostics` to one row of key indices
+(CAPE, CIN, LCL, LFC, EL, PW) and a histogram of its stability codes. The soundings are spread
+over a pool of worker processes, in chunks so that each task carries many soundings:
+
+    import sounding_climatology as scl
+    table = scl.climatology('soundings_dir', output='climatology.parquet')
+    table.groupby('station')['cape'].describe()
+'''
+import os
+import glob
+import itertools
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+import pandas as pd
+
+import sounding_plotter as sp
+import sounding_archive as sa
+
+SOUNDING_EXTENSIONS = ('.csv', '.pkl', '.parquet', '.feather')
+
+_archives = {}          # Archives opened by this (worker) process, by path
+
+
+def read_sounding(path):
+    '''
+    Reads one sounding DataFrame from a .csv, .pkl, .parquet or .feather file
+    '''
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return pd.read_csv(path, parse_dates=['time'])
+    if ext == '.pkl':
+        return pd.read_pickle(path)
+    if ext == '.parquet':
+        return pd.read_parquet(path)
+    if ext == '.feather':
+        return pd.read_feather(path)
+    raise ValueError("Unknown sounding file type: "+path)
+
+
+def read_sounding_key(path):
+    '''
+    (station, time) of the sounding in a .csv, .pkl, .parquet or .feather file, reading as little
+        of the file as the format allows (only the first row, or only those columns)
+    '''
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        df = pd.read_csv(path, usecols=['station', 'time'], parse_dates=['time'], nrows=1)
+    elif ext == '.parquet':
+        df = pd.read_parquet(path, columns=['station', 'time'])
+    elif ext == '.feather':
+        df = pd.read_feather(path, columns=['station', 'time'])
+    else:
+        df = read_sounding(path)
+    return df['station'].iloc[0], pd.Timestamp(df['time'].iloc[0])
+
+
+def iter_sounding_items(sources):
+    '''
+    The soundings of sources as items for load_sounding, one at a time: DataFrames, file paths, and
+        (archive path, station, time) for the soundings of a sounding_archive.SoundingArchive
+
+    Required input:
+        sources = a directory of sounding files (.csv, .pkl, .parquet, .feather; see read_sounding),
+                  a SoundingArchive, or an iterable of sounding DataFrames and/or file paths
+                  (consumed lazily, e.g. a generator)
+    '''
+    if isinstance(sources, sa.SoundingArchive):
+        return ((sources.path, station, time) for station, time in
+                zip(sources.index['station'].tolist(), sources.index['time']))
+    if isinstance(sources, (str, os.PathLike)):
+        return iter(sorted(f for f in glob.glob(os.path.join(sources, '*'))
+                           if f.lower().endswith(SOUNDING_EXTENSIONS)))
+    return iter(sources)
+
+
+def sounding_items(sources):
+    '''
+    The soundings of sources as a list of items for load_sounding (see iter_sounding_items)
+    '''
+    return list(iter_sounding_items(sources))
+
+
+def item_source(item):
+    '''
+    Where a sounding item comes from: the file or archive path (None for a DataFrame)
+    '''
+    if isinstance(item, tuple):
+        return item[0]
+    return os.fspath(item) if isinstance(item, (str, os.PathLike)) else None
+
+
+def load_sounding(item):
+    '''
+    The DataFrame of one sounding item (see sounding_items). Archives are opened once per process.
+    '''
+    if isinstance(item, tuple):
+        if item[0] not in _archives:
+            _archives[item[0]] = sa.SoundingArchive(item[0])
+        return _archives[item[0]].get(item[1], item[2])
+    if isinstance(item, (str, os.PathLike)):
+        return read_sounding(item)
+    return item
+
+
+def sounding_summary(df, abs_tol=1.0, method='metpy'):
+    '''
+    Reduces one sounding to a dictionary of plain numbers: the key indices of compute_diagnostics
+        and the number of profile intervals with each stability code ('stab_0' ... 'stab_6')
+
+    Required input:
+        df (Pandas dataframe) = sounding data, as for sounding_plotter.plot_skewt
+    Optional inputs:
+        abs_tol (float) [1.0]     = The ± temperature lapse rate range [K/km] for defining isothermal & adiabatic intervals
+        method    (str) ['metpy'] = 'metpy' or 'numpy', as for sounding_plotter.compute_diagnostics
+    '''
+    diag = sp.compute_diagnostics(df, abs_tol=abs_tol, method=method)
+    row = {'station': diag['station'], 'time': diag['time'], 'nlev': len(diag['p']),
+           'p_sfc': diag['p'][0].m_as('hPa'), 'T_sfc': diag['T'][0].m_as('degC'), 'Td_sfc': diag['Td'][0].m_as('degC'),
+           'cape': diag['cape'].m_as('J/kg'), 'cin': diag['cin'].m_as('J/kg'), 'pw': diag['pw'].m_as('mm'),
+           'lcl_p': diag['lcl_pressure'].m_as('hPa'), 'lcl_t': diag['lcl_temperature'].m_as('degC'),
+           'lcl_z': diag['lcl_height'].m_as('m'),
+           'lfc_p': diag['lfc_pressure'].m_as('hPa'), 'lfc_t': diag['lfc_temperature'].m_as('degC'),
+           'el_p': diag['el_pressure'].m_as('hPa'), 'el_t': diag['el_temperature'].m_as('degC')}
+    counts = np.bincount(diag['stability'], minlength=len(sp.STABILITY_NAMES))
+    row.update({f'stab_{i}': int(n) for i, n in enumerate(counts)})
+    return row
+
+
+# Columns of a sounding_summary row
+SUMMARY_COLUMNS = (['station', 'time', 'nlev', 'p_sfc', 'T_sfc', 'Td_sfc', 'cape', 'cin', 'pw', 'lcl_p', 'lcl_t', 'lcl_z',
+                    'lfc_p', 'lfc_t', 'el_p', 'el_t'] + [f'stab_{i}' for i in range(len(sp.STABILITY_NAMES))])
+
+
+def _summary_or_error(item, abs_tol=1.0, method='metpy'):
+    # Worker task: a sounding item (see sounding_items) to its summary row, or a row holding the error
+    try:
+        row = sounding_summary(load_sounding(item), abs_tol=abs_tol, method=method)
+        row['error'] = None
+    except Exception as err:
+        row = {'error': f"{type(err).__name__}: {err}"}
+    row['source'] = item_source(item)
+    return row
+
+
+def _summary_chunk(items, abs_tol=1.0, method='metpy'):
+    # One task of the process pool: a whole chunk of soundings
+    return [_summary_or_error(item, abs_tol=abs_tol, method=method) for item in items]
+
+
+def run_tasks(func, tasks, max_workers, *args):
+    '''
+    Runs func(task, *args) for every task of an iterable in a pool of worker processes (in this process
+        if max_workers is 1) and yields the results as they complete. At most 2*max_workers tasks are
+        queued at a time, so the tasks are taken from the iterable as they are needed and their inputs
+        are not all held in memory at once.
+    '''
+    if max_workers == 1:
+        for task in tasks:
+            yield func(task, *args)
+        return
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        pending = set()
+        for task in tasks:
+            if len(pending) >= 2*max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(pool.submit(func, task, *args))
+        for future in wait(pending).done:
+            yield future.result()
+
+
+def climatology(sources, output=None, max_workers=None, chunksize=None, abs_tol=1.0, method='metpy'):
+    '''
+    Computes sounding_summary for many soundings in a pool of worker processes and collects
+        the results into one table, optionally written to a Parquet, Feather or CSV file
+
+    Required input:
+        sources = a directory of sounding files (.csv, .pkl, .parquet, .feather; see read_sounding),
+                  a sounding_archive.SoundingArchive (each worker reads its soundings from the archive files),
+                  or an iterable of sounding DataFrames and/or file paths
+
+    Optional input:         Default:
+        output       [None]   = file to write the table to; the format follows the extension
+                                (.parquet, .feather or .csv)
+        max_workers  [None]   = number of worker processes (default: number of CPUs; 1 runs in this process)
+        chunksize    [None]   = number of soundings per task (default: enough for about 4 tasks per worker
+                                when the number of soundings is known, otherwise 16)
+        abs_tol       [1.0]   = The ± temperature lapse rate range [K/km] for the stability codes
+        method    ['metpy']   = 'metpy' or 'numpy' (several times faster), as for sounding_plotter.compute_diagnostics
+
+    Output:
+        table (Pandas dataframe) = one row per sounding, sorted by station and time. Soundings that could
+                                   not be processed keep a row with the message in column 'error'
+                                   ('source' is the file path, if read from a file)
+    '''
+    max_workers = max_workers or os.cpu_count()
+    if not chunksize:
+        # The number of soundings is known for an archive or a list, but not for a directory or a generator
+        nitems = len(sources) if hasattr(sources, '__len__') and not isinstance(sources, (str, os.PathLike)) else None
+        chunksize = max(1, -(-nitems // (4*max_workers))) if nitems is not None else 16
+    # Chunks are taken from the items as the pool needs them, rather than listing all items first
+    items = iter_sounding_items(sources)
+    chunks = iter(lambda: list(itertools.islice(items, chunksize)), [])
+    rows = [row for result in run_tasks(_summary_chunk, chunks, max_workers, abs_tol, method) for row in result]
+
+    table = pd.DataFrame(rows, columns=SUMMARY_COLUMNS + ['error', 'source'])
+    if len(table):
+        table = table.sort_values(['station', 'time'], kind='stable', ignore_index=True)
+    if output:
+        write_table(table, output)
+    return table
+
+
+def write_table(table, filename):
+    '''
+    Writes a climatology table to a Parquet, Feather or CSV file, chosen by the extension of filename
+    '''
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.parquet':
+        table.to_parquet(filename, index=False)
+    elif ext == '.feather':
+        table.to_feather(filename)
+    elif ext == '.csv':
+        table.to_csv(filename, index=False)
+    else:
+        raise ValueError("Unknown table file type: "+filename)
+    return filename
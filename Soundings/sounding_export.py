@@ -0,0 +1,176 @@
+'''
+Export of many Skew-T diagrams to image files, rendered in a pool of worker processes.
+
+Each worker keeps one `sounding_plotter.SkewTRenderer`, so the diagram background is drawn only
+once per process. Soundings go either to individual PNG files (STATION_YYYYmmdd_HHMM.png), each
+encoded in a background thread while the worker renders the next one, or to one multi-page PDF
+per station and month (STATION_YYYYmm.pdf). Only a few tasks are queued at a time, so memory
+stays bounded however many soundings are exported:
+
+    import sounding_export as se
+    written, errors = se.export_soundings(sa.SoundingArchive('soundings.arc'), 'plots', fmt='pdf')
+'''
+import os
+import itertools
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import sounding_plotter as sp
+import sounding_climatology as scl
+
+_renderers = {}         # SkewTRenderer of this (worker) process, by plot options
+
+
+def _renderer(options):
+    # The renderer for these plot options, created on first use in each process
+    key = tuple(sorted(options.items()))
+    if key not in _renderers:
+        kwargs = dict(options)
+        dpi = kwargs.pop('dpi')
+        _renderers[key] = sp.SkewTRenderer(**kwargs)
+        _renderers[key].fig.set_dpi(dpi)
+    return _renderers[key]
+
+
+def _item_key(item):
+    # (station, time) of a sounding item (see sounding_climatology.sounding_items), without loading
+    #   the sounding of a file or archive
+    if isinstance(item, tuple):
+        return item[1], pd.Timestamp(item[2])
+    if isinstance(item, (str, os.PathLike)):
+        return scl.read_sounding_key(item)
+    return item['station'].iloc[0], pd.Timestamp(item['time'].iloc[0])
+
+
+def _label(item):
+    # Short description of a sounding item for error messages
+    if isinstance(item, tuple):
+        return f"{item[1]} {pd.Timestamp(item[2]):%Y-%m-%d %H:%M}"
+    if isinstance(item, pd.DataFrame) and 'station' in item and 'time' in item:
+        return f"{item['station'].iloc[0]} {pd.Timestamp(item['time'].iloc[0]):%Y-%m-%d %H:%M}"
+    return str(scl.item_source(item))
+
+
+def _write_png(rgba, filename, dpi):
+    from PIL import Image
+    Image.fromarray(rgba).save(filename, dpi=(dpi, dpi))
+    return filename
+
+
+def _png_task(items, output_dir, options):
+    # One worker task: renders a chunk of soundings to PNG files. At most one image waits for
+    #   its encoding thread while the next sounding is being rendered.
+    renderer = _renderer(options)
+    written, errors = [], {}
+    with ThreadPoolExecutor(max_workers=1) as encoder:
+        pending = None
+        for item in items + [None]:
+            rgba = None
+            if item is not None:
+                try:
+                    diag = sp.compute_diagnostics(scl.load_sounding(item), abs_tol=options['abs_tol'])
+                    renderer.render(diag=diag)
+                    renderer.fig.canvas.draw()
+                    rgba = np.asarray(renderer.fig.canvas.buffer_rgba()).copy()
+                    filename = os.path.join(output_dir, f"{diag['station']}_{diag['time']:%Y%m%d_%H%M}.png")
+                except Exception as err:
+                    errors[_label(item)] = f"{type(err).__name__}: {err}"
+            if pending is not None:
+                try:
+                    written.append(pending[0].result())
+                except Exception as err:
+                    errors[pending[1]] = f"{type(err).__name__}: {err}"
+                pending = None
+            if rgba is not None:
+                pending = (encoder.submit(_write_png, rgba, filename, options['dpi']), _label(item))
+    return written, errors
+
+
+def _pdf_task(group, output_dir, options):
+    # One worker task: renders the soundings of one station and month, in time order, to a multi-page PDF
+    from matplotlib.backends.backend_pdf import PdfPages
+    (station, month), items = group         # items: (label, sounding item) in time order
+    renderer = _renderer(options)
+    filename = os.path.join(output_dir, f"{station}_{month}.pdf")
+    errors = {}
+    pdf = None              # Opened with the first page, so no file is written if every sounding fails
+    try:
+        for label, item in items:
+            try:
+                renderer.render(scl.load_sounding(item))
+                if pdf is None:
+                    pdf = PdfPages(filename)
+                pdf.savefig(renderer.fig)
+            except Exception as err:
+                errors[label] = f"{type(err).__name__}: {err}"
+    finally:
+        if pdf is not None:
+            pdf.close()
+    return ([filename] if pdf is not None else []), errors
+
+
+def export_soundings(sources, output_dir='.', fmt='png', max_workers=None, chunksize=8, dpi=100,
+                     plot_stability=True, plot_cin_cape=True, plot_indices=True, abs_tol=1.0):
+    '''
+    Renders annotated Skew-T diagrams of many soundings in worker processes and writes them to files
+
+    Required input:
+        sources = soundings, as for sounding_climatology.climatology: a directory of sounding files,
+                  a sounding_archive.SoundingArchive, or an iterable of DataFrames and/or file paths
+
+    Optional input:         Default:
+        output_dir      ['.']   = directory for the files (created if needed)
+        fmt           ['png']   = 'png' for one STATION_YYYYmmdd_HHMM.png per sounding, or
+                                  'pdf' for one multi-page STATION_YYYYmm.pdf per station and month
+                                  (DataFrames wait in temporary files until their PDF is rendered)
+        max_workers    [None]   = number of worker processes (default: number of CPUs; 1 runs in this process)
+        chunksize         [8]   = soundings per task for PNG files (a PDF file is always one task)
+        dpi             [100]   = resolution of PNG files
+        plot_stability, plot_cin_cape, plot_indices, abs_tol = as for sounding_plotter.plot_skewt
+
+    Output:
+        written (list) = the files written (no PDF file for a station and month none of whose soundings could be plotted)
+        errors  (dict) = description of the sounding: error message, for soundings that could not be plotted
+    '''
+    if fmt not in ('png', 'pdf'):
+        raise ValueError("Unknown export format: "+str(fmt))
+    os.makedirs(output_dir, exist_ok=True)
+    max_workers = max_workers or os.cpu_count()
+    options = dict(plot_stability=plot_stability, plot_cin_cape=plot_cin_cape, plot_indices=plot_indices,
+                   abs_tol=abs_tol, dpi=dpi)
+    items = scl.iter_sounding_items(sources)
+
+    written, errors = [], {}
+    if fmt == 'png':
+        chunks = iter(lambda: list(itertools.islice(items, chunksize)), [])
+        for files, errs in scl.run_tasks(_png_task, chunks, max_workers, output_dir, options):
+            written.extend(files)
+            errors.update(errs)
+        return written, errors
+
+    # PDF: only lightweight (station, time, label, item) entries are sorted and grouped, and each group's
+    #   soundings are loaded by its task. DataFrames given in memory are pickled to a temporary directory
+    #   as they arrive, so that they are not all held until their station and month come up.
+    with tempfile.TemporaryDirectory(prefix="sounding_export_") as spill:
+        keyed = []
+        for n, item in enumerate(items):
+            try:
+                station, time = _item_key(item)
+                label = _label(item)
+                if isinstance(item, pd.DataFrame):
+                    path = os.path.join(spill, f"{n}.pkl")
+                    item.to_pickle(path)
+                    item = path
+                keyed.append((station, time, label, item))
+            except Exception as err:
+                errors[_label(item)] = f"{type(err).__name__}: {err}"
+        keyed.sort(key=lambda k: (k[0], k[1]))
+        groups = (((station, month), [(label, item) for _, _, label, item in group]) for (station, month), group in
+                  itertools.groupby(keyed, key=lambda k: (k[0], f"{k[1]:%Y%m}")))
+        for files, errs in scl.run_tasks(_pdf_task, groups, max_workers, output_dir, options):
+            written.extend(files)
+            errors.update(errs)
+    return written, errors
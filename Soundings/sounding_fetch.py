@@ -0,0 +1,162 @@
+'''
+Cached retrieval of soundings from a remote service, by default the University of Wyoming
+upper air archive (through siphon's WyomingUpperAir).
+
+Every sounding fetched is kept on disk, one pickle file per (station, time), so re-plotting
+a case does not repeat the network request. The cache is bounded in size: the least recently
+used files are deleted first. Many soundings can be prefetched concurrently:
+
+    import sounding_fetch as sf
+    soundings = sf.SoundingCache('sounding_cache')
+    df = soundings.fetch('IAD', datetime(2021, 7, 7, 0))
+    fetched, errors = soundings.prefetch([('IAD', t) for t in times])
+'''
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+
+def wyoming_remote(url=None):
+    '''
+    Returns a function remote(time, station) -> DataFrame that requests a sounding from the
+        University of Wyoming upper air service, or from another server with the same interface
+        at url (e.g. a local test server)
+    '''
+    from siphon.simplewebservice.wyoming import WyomingUpperAir
+    if url is None:
+        return WyomingUpperAir.request_data
+
+    class _Endpoint(WyomingUpperAir):
+        def __init__(self):
+            super(WyomingUpperAir, self).__init__(url)
+    return _Endpoint.request_data
+
+
+class SoundingCache:
+    '''
+    Disk cache of soundings keyed by (station, time), in front of a remote service
+
+    Optional input:
+        cache_dir   (str) = directory of the cached soundings (default 'sounding_cache', created if needed)
+        max_bytes (float) = maximum total size of the cached files; the least recently used are
+                            deleted beyond it (default 500 MB)
+        remote (function) = remote(time, station) returning a sounding DataFrame, with the arguments of
+                            WyomingUpperAir.request_data (default: wyoming_remote())
+        max_workers (int) = number of concurrent requests in `prefetch` (default 8)
+
+    Attributes:
+        hits, misses (int) = counts of soundings served from the cache / fetched from the remote
+    '''
+    def __init__(self, cache_dir='sounding_cache', max_bytes=500e6, remote=None, max_workers=8):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.remote = remote
+        self.max_workers = max_workers
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._bytes = sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        # (last use, size, path) of every cached sounding
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pkl"):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:           # Evicted by another process meanwhile
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def __len__(self):
+        return len(self._entries())
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(*key))
+
+    def _path(self, station, time):
+        return os.path.join(self.cache_dir, f"{station}_{pd.Timestamp(time):%Y%m%d_%H%M}.pkl")
+
+    def clear(self):
+        '''
+        Deletes all cached soundings and resets the hit/miss counters
+        '''
+        with self._lock:
+            for _, _, path in self._entries():
+                os.remove(path)
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def fetch(self, station, time):
+        '''
+        Returns the sounding DataFrame of station at time, from the cache if it is there,
+            otherwise from the remote (and then caches it)
+        '''
+        path = self._path(station, time)
+        try:
+            df = pd.read_pickle(path)
+            os.utime(path)                          # Mark as recently used
+            with self._lock:
+                self.hits += 1
+            return df
+        except FileNotFoundError:
+            pass
+        remote = self.remote or wyoming_remote()
+        df = remote(pd.Timestamp(time).to_pydatetime(), station)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_pickle(tmp)
+        os.replace(tmp, path)                       # Atomic, so concurrent readers never see a partial file
+        with self._lock:
+            self.misses += 1
+            self._bytes += os.path.getsize(path)
+            if self._bytes > self.max_bytes:
+                self._evict()
+        return df
+
+    def _evict(self):
+        # Deletes the least recently used files until the cache fits in max_bytes (called with the lock held)
+        entries = sorted(self._entries())
+        self._bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._bytes -= size
+
+    def prefetch(self, keys, max_workers=None):
+        '''
+        Fetches many soundings concurrently into the cache (those already cached are not requested again)
+
+        Required input:
+            keys = iterable of (station, time) pairs
+        Optional input:
+            max_workers (int) = number of concurrent requests (default: the cache's max_workers)
+
+        Output:
+            fetched (list) = the (station, time) pairs fetched or found in the cache (those beyond max_bytes
+                             may already have been evicted again)
+            errors  (dict) = (station, time): exception, for the soundings that could not be fetched
+        '''
+        fetched, errors = [], {}
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_workers) as pool:
+            futures = {}
+            for station, time in keys:
+                if (station, time) in self:
+                    fetched.append((station, time))
+                else:
+                    futures[pool.submit(self.fetch, station, time)] = (station, time)
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    fetched.append(futures[future])
+                except Exception as err:
+                    errors[futures[future]] = err
+        return fetched, errors
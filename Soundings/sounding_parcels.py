@@ -0,0 +1,232 @@
+'''
+CAPE and CIN of many lifted parcels at once: the surface, mixed-layer and most-unstable parcels,
+and a profile of CAPE/CIN for a parcel starting at every level of the sounding (e.g. for
+convective initiation studies).
+
+All parcels are lifted together as one array: dry adiabatically to their LCLs and then along moist
+adiabats interpolated from the shared table of sounding_thermo.moist_adiabat_table, so no ODE is
+solved per parcel. CAPE and CIN follow metpy.calc.cape_cin as called by compute_diagnostics
+(virtual temperatures, lowest LFC, highest EL; levels without dewpoint skipped). The mixed-layer
+and most-unstable parcels are chosen as by metpy.calc.mixed_parcel and most_unstable_parcel; unlike
+metpy's mixed_layer_cape_cin and most_unstable_cape_cin, no extra level is inserted at the LCL.
+
+    import sounding_parcels as spc
+    parcels, profile = spc.convective_parcels(df)
+    parcels.loc['most_unstable', 'cape']
+    profile.plot(x='cape', y='pressure')
+'''
+import numpy as np
+import pandas as pd
+
+import sounding_thermo as st
+from sounding_thermo import n
+
+PARCEL_NAMES = ('surface', 'mixed_layer', 'most_unstable')
+
+
+def lift_parcels(p, T_0, Td_0, p_0):
+    '''
+    Temperatures [K] of parcels lifted from (p_0, T_0, Td_0): dry adiabatic to their LCL, then moist
+        adiabatic from the lookup table; nan below the starting pressure of each parcel
+
+    Required input:
+        p                  (array) = pressures [Pa] of the profile (N, decreasing)
+        T_0, Td_0, p_0     (arrays) = starting temperature, dewpoint [K] and pressure [Pa] of each parcel (P)
+    Output:
+        T (P, N), p_lcl (P) = parcel temperatures, and pressure of the LCL of each parcel
+    '''
+    T_0, Td_0, p_0 = (np.atleast_1d(x).astype(np.float64) for x in (T_0, Td_0, p_0))
+    p_lcl, _ = st.lcl(p_0, T_0, Td_0)
+    pp = p[np.newaxis, :]
+    dry = st.dry_lapse(pp, T_0[:, np.newaxis], p_0[:, np.newaxis])
+    # As metpy, the moist adiabat starts from the dry adiabat at the LCL pressure
+    moist = st.moist_lapse_table(p, st.dry_lapse(p_lcl, T_0, p_0), p_lcl)
+    T = np.where(pp >= p_lcl[:, np.newaxis], dry, moist)
+    T[pp > p_0[:, np.newaxis] * (1 + 1e-10)] = np.nan
+    return T, p_lcl
+
+
+def _cape_cin_rows(p, Tv, T_parcel, p_lcl, w_0, p_lcl_v):
+    # CAPE, CIN, LFC and EL pressures of a block of parcels (rows of T_parcel) in the environment p, Tv.
+    #   As in metpy.calc.cape_cin, the LFC and EL are sought above the LCL recomputed from the virtual
+    #   temperature at the start (p_lcl_v); p_lcl is the parcel's own LCL
+    Rd = n.Rd
+    lnp = np.log(p)
+    dx = lnp[:-1] - lnp[1:]
+    rows = np.arange(len(p_lcl))
+    pp = p[np.newaxis, :]
+    w_parcel = np.where(pp > p_lcl[:, np.newaxis], w_0[:, np.newaxis], st.saturation_mixing_ratio(pp, T_parcel))
+    y = st.virtual_temperature(T_parcel, w_parcel) - Tv[np.newaxis, :]
+
+    # Cumulative area from the bottom (0 below the start of each parcel); the trapezoid rule is exact
+    #   for the linear interpolation, so crossings only need to be inserted at the LFC and EL
+    y0, y1 = y[:, :-1], y[:, 1:]
+    area = np.concatenate([np.zeros((len(rows), 1)),
+                           np.cumsum(np.nan_to_num(Rd * (y0 + y1) / 2 * dx), axis=1)], axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        s0, s1 = np.sign(y0), np.sign(y1)
+        f = y0 / (y0 - y1)
+        x_cross = lnp[:-1] + f * (lnp[1:] - lnp[:-1])
+        area_cross = area[:, :-1] + Rd * y0 / 2 * f * dx
+        up = (s0 != s1) & (s0 != 0) & (s1 > s0)
+        down = (s0 != s1) & (s0 != 0) & (s1 < s0)
+
+    # LFC: the lowest crossing into buoyancy above the LCL. Without one, the LCL itself if the parcel
+    #   is buoyant somewhere above it (or, after crossings below the LCL, unless it has lost its
+    #   buoyancy again below the LCL)
+    x_lcl = np.log(p_lcl_v)[:, np.newaxis]
+    up_above = up & (x_cross < x_lcl)
+    has_up = up_above.any(axis=1)
+    i = np.argmax(up_above, axis=1)
+    x_lfc = np.where(has_up, x_cross[rows, i], np.nan)
+    area_lfc = np.where(has_up, area_cross[rows, i], np.nan)
+    with np.errstate(invalid='ignore'):
+        buoyant_above = np.any((y > 0) & (pp < p_lcl_v[:, np.newaxis]), axis=1)
+    any_up = up.any(axis=1)
+    lost_below = down.any(axis=1) & ~np.any(down & (x_cross <= x_lcl), axis=1)
+    at_lcl = ~has_up & np.where(any_up, ~lost_below, buoyant_above)
+    x_lfc[at_lcl] = np.log(p_lcl_v[at_lcl])
+    # Such an LFC is not a level of the integration (as in metpy): CIN ends at the last level below it,
+    #   CAPE starts from the first level above it
+    m = np.clip(np.sum(pp >= p_lcl_v[:, np.newaxis], axis=1) - 1, 0, len(p)-2)
+    area_cape = area_lfc.copy()
+    area_lfc[at_lcl] = area[rows, m][at_lcl]
+    area_cape[at_lcl] = area[rows, m+1][at_lcl]
+
+    # EL: the highest crossing out of buoyancy, if above the LCL; the top of the sounding if there is
+    #   none or the parcel is still buoyant there
+    has_down = down.any(axis=1)
+    i = len(p) - 2 - np.argmax(down[:, ::-1], axis=1)
+    x_top = x_cross[rows, i]
+    has_el = has_down & (x_top < np.log(p_lcl_v)) & ~(y[:, -1] > 0)
+    x_el = np.where(has_el, x_top, np.nan)
+    area_el = np.where(has_el, area_cross[rows, i], area[:, -1])
+
+    has_lfc = np.isfinite(x_lfc)
+    # No CAPE if the EL is below the LFC
+    cape = np.where(has_lfc & ~(x_el > x_lfc), area_el - area_cape, 0.0)
+    cin = np.where(has_lfc, np.minimum(area_lfc, 0.0), 0.0)
+    return cape, cin, np.exp(x_lfc), np.exp(x_el)
+
+
+def parcel_cape_cin(p, T, Td, T_0, Td_0, p_0, max_block=1_000_000):
+    '''
+    CAPE and CIN of many parcels in one environmental profile, all computed together
+
+    Required input:
+        p, T, Td        (arrays) = profile of pressure [Pa], temperature and dewpoint [K] (decreasing pressure);
+                                   levels with missing values are skipped
+        T_0, Td_0, p_0  (arrays) = starting temperature, dewpoint [K] and pressure [Pa] of each parcel
+    Optional input:
+        max_block (int) = largest number of parcel-levels handled at once (bounds memory use)
+
+    Output:
+        Dictionary of arrays, one value per parcel: 'cape', 'cin' [J/kg], 'lcl_pressure',
+        'lfc_pressure', 'el_pressure' [Pa] (nan if there is no LFC or EL)
+    '''
+    ok = np.isfinite(p) & np.isfinite(T) & np.isfinite(Td)
+    p, T, Td = p[ok], T[ok], Td[ok]
+    Tv = st.virtual_temperature(T, st.saturation_mixing_ratio(p, Td))
+    T_0, Td_0, p_0 = (np.atleast_1d(x).astype(np.float64) for x in (T_0, Td_0, p_0))
+    out = {k: np.full(len(T_0), np.nan) for k in ('cape', 'cin', 'lcl_pressure', 'lfc_pressure', 'el_pressure')}
+    block = max(1, max_block // max(len(p), 1))
+    for b in range(0, len(T_0), block):
+        s = slice(b, b + block)
+        valid = np.isfinite(T_0[s]) & np.isfinite(Td_0[s]) & np.isfinite(p_0[s])
+        idx = np.arange(len(T_0))[s][valid]
+        if len(idx) == 0:
+            continue
+        T_parcel, p_lcl = lift_parcels(p, T_0[idx], Td_0[idx], p_0[idx])
+        w_0 = st.saturation_mixing_ratio(p_0[idx], Td_0[idx])
+        p_lcl_v, _ = st.lcl(p_0[idx], st.virtual_temperature(T_0[idx], w_0), Td_0[idx])
+        cape, cin, p_lfc, p_el = _cape_cin_rows(p, Tv, T_parcel, p_lcl, w_0, p_lcl_v)
+        out['cape'][idx], out['cin'][idx] = cape, cin
+        out['lcl_pressure'][idx], out['lfc_pressure'][idx], out['el_pressure'][idx] = p_lcl, p_lfc, p_el
+    return out
+
+
+def mixed_parcel(p, T, Td, depth=10000.0):
+    '''
+    Temperature and dewpoint [K] at p[0] of the parcel with the mean potential temperature and mixing ratio
+        of the lowest depth [Pa] of the profile (as metpy.calc.mixed_parcel)
+    '''
+    ok = np.isfinite(p) & np.isfinite(T) & np.isfinite(Td)
+    p, T, Td = p[ok], T[ok], Td[ok]
+    theta, w = st.potential_temperature(p, T), st.saturation_mixing_ratio(p, Td)
+    p_top = p[0] - depth
+    inside = p >= p_top
+    # The layer, closed at its top by values interpolated in ln(p)
+    lnp = np.log(p)
+    p_layer = np.r_[p[inside], p_top]
+    theta_layer = np.r_[theta[inside], np.interp(-np.log(p_top), -lnp, theta)]
+    w_layer = np.r_[w[inside], np.interp(-np.log(p_top), -lnp, w)]
+    keep = np.r_[True, np.diff(p_layer) != 0]
+    p_layer, theta_layer, w_layer = p_layer[keep], theta_layer[keep], w_layer[keep]
+    dp = p_layer[:-1] - p_layer[1:]
+    mean_theta = np.sum((theta_layer[:-1] + theta_layer[1:]) / 2 * dp) / depth
+    mean_w = np.sum((w_layer[:-1] + w_layer[1:]) / 2 * dp) / depth
+    return mean_theta * (p[0] / 1e5) ** n.kappa, st.dewpoint(p[0] * mean_w / (n.epsilon + mean_w))
+
+
+def most_unstable_level(p, T, Td, depth=30000.0):
+    '''
+    Index of the level with the highest equivalent potential temperature within depth [Pa] of
+        the bottom of the profile (as metpy.calc.most_unstable_parcel)
+    '''
+    inside = p >= p[0] - depth
+    return int(np.nanargmax(st.equivalent_potential_temperature(p[inside], T[inside], Td[inside])))
+
+
+def convective_parcels(df, mixed_layer_depth=100, most_unstable_depth=300, cape_profile=True):
+    '''
+    CAPE and CIN of the surface, mixed-layer and most-unstable parcels of a sounding, and of a parcel
+        starting at every level, all lifted together
+
+    Required input:
+        df (Pandas dataframe) = sounding data, as for sounding_plotter.plot_skewt
+    Optional input:                 Default:
+        mixed_layer_depth   (float) [100]  = depth [hPa] of the mixed layer
+        most_unstable_depth (float) [300]  = depth [hPa] above the surface searched for the most unstable parcel
+        cape_profile         (bool) [True] = also compute the profile of CAPE/CIN for every starting level
+
+    Outputs:
+        parcels (Pandas dataframe) = one row per parcel (index 'surface', 'mixed_layer', 'most_unstable') with
+                                     the starting 'pressure' [hPa], 'temperature', 'dewpoint' [˚C], and 'cape',
+                                     'cin' [J/kg], 'lcl_pressure', 'lfc_pressure', 'el_pressure' [hPa]
+        profile (Pandas dataframe) = the same columns (and 'height') for a parcel from every level of the
+                                     sounding (None if cape_profile is False)
+    '''
+    df = df.drop_duplicates(subset=['pressure'])
+    p = df['pressure'].values.astype(np.float64) * 100.0
+    T = df['temperature'].values.astype(np.float64) + n.zero_degc
+    Td = df['dewpoint'].values.astype(np.float64) + n.zero_degc
+
+    ok = np.isfinite(p) & np.isfinite(T) & np.isfinite(Td)
+    k_sfc = np.flatnonzero(ok)[0]
+    k_mu = np.flatnonzero(ok)[most_unstable_level(p[ok], T[ok], Td[ok], depth=most_unstable_depth * 100.0)]
+    T_0, Td_0, p_0 = np.array([T[k_sfc], T[k_mu]]), np.array([Td[k_sfc], Td[k_mu]]), np.array([p[k_sfc], p[k_mu]])
+    if cape_profile:
+        T_0, Td_0, p_0 = np.r_[T_0, T], np.r_[Td_0, Td], np.r_[p_0, p]
+    result = parcel_cape_cin(p, T, Td, T_0, Td_0, p_0)
+
+    # As metpy.calc.mixed_layer_cape_cin, the mixed-layer parcel replaces the environment within the layer
+    depth = mixed_layer_depth * 100.0
+    T_ml, Td_ml = mixed_parcel(p, T, Td, depth=depth)
+    above = p < p[k_sfc] - depth
+    ml = parcel_cape_cin(np.r_[p[k_sfc], p[above]], np.r_[T_ml, T[above]], np.r_[Td_ml, Td[above]],
+                         T_ml, Td_ml, p[k_sfc])
+    order = np.r_[0, len(p_0), 1:len(p_0)]          # surface, mixed layer, most unstable, profile
+    T_0, Td_0, p_0 = np.r_[T_0, T_ml][order], np.r_[Td_0, Td_ml][order], np.r_[p_0, p[k_sfc]][order]
+    result = {k: np.r_[v, ml[k]][order] for k, v in result.items()}
+
+    table = pd.DataFrame({'pressure': p_0 / 100.0, 'temperature': T_0 - n.zero_degc,
+                          'dewpoint': Td_0 - n.zero_degc, 'cape': result['cape'], 'cin': result['cin'],
+                          'lcl_pressure': result['lcl_pressure'] / 100.0,
+                          'lfc_pressure': result['lfc_pressure'] / 100.0,
+                          'el_pressure': result['el_pressure'] / 100.0})
+    parcels = table.iloc[:len(PARCEL_NAMES)].set_index(pd.Index(PARCEL_NAMES))
+    profile = None
+    if cape_profile:
+        profile = table.iloc[len(PARCEL_NAMES):].reset_index(drop=True)
+        profile.insert(1, 'height', df['height'].values)
+    return parcels, profile
@@ -1,15 +1,13 @@
-from math import isclose
-
 import pandas as pd
 import numpy as np
 
-import matplotlib.pyplot as plt
-
 import metpy.calc as mpcalc
 import metpy.constants as c
-from metpy.plots import add_metpy_logo, add_timestamp, SkewT
 from metpy.units import units
 
+import sounding_thermo as st
+import sounding_tables
+
 from datetime import datetime
 
 import warnings
@@ -17,8 +15,159 @@ warnings.filterwarnings("ignore", category=RuntimeWarning)
 warnings.filterwarnings("ignore", category=FutureWarning)
 
 
+# Stability codes for each interval of a profile, and the colors used to show them
+#  0 = inversion
+#  1 = isothermal (±abs_tol)
+#  2 = stable
+#  3 = moist adiabatic (±abs_tol)
+#  4 = conditionally unstable
+#  5 = neutral or adiabatic (±abs_tol)
+#  6 = absolutely unstable
+STABILITY_NAMES = ["Inversion","Isothermal","Stable","Moist Adiabatic","Conditionally Unstable",
+                   "Neutral or Adiabatic","Unstable"]
+STABILITY_COLORS = ["indigo","silver","cadetblue","turquoise","yellowgreen","gold","deeppink"]
+
+TEXT_EDGE = 0.75        # Left edge of the text column right of the diagram (figure coordinates)
+
+
+def _magnitude(x, unit):
+    # Plain numpy values of x in the given unit; arrays without units are assumed to be in that unit already
+    if hasattr(x, 'm_as'):
+        return np.asarray(x.m_as(unit), dtype=np.float64)
+    return np.asarray(x, dtype=np.float64)
+
+
+def stability_codes(p, T, z, abs_tol=1.0):
+    '''
+    Classifies the stability of every interval between levels of a profile, all intervals at once
+
+    Required input:
+        p (array) = pressure [hPa]        (metpy quantities are converted, plain arrays are taken
+        T (array) = temperature [˚C]       to be in these units)
+        z (array) = height [m]
+    Optional input:
+        abs_tol (float) [1.0] = The ± temperature lapse rate range [K/km] for defining isothermal & adiabatic intervals
+
+    Output:
+        Integer array with len(p)-1 stability codes (see STABILITY_NAMES)
+    '''
+    p = _magnitude(p, 'hPa') * 100
+    T = _magnitude(T, 'degC') + c.nounit.zero_degc
+    z = _magnitude(z, 'm')
+    tol = abs_tol * 1e-3
+
+    t_inv, t_dry, t_moi = st.lapse_rates(p, T, z)  # t_inv negative is inversion
+                                                    # t_dry negative is dry stable, positive unstable
+                                                    # t_moi negative is stable,
+                                                    #   positive while t_dry negative is conditionally unstable
+                                                    #   both positive is moist adiabatic
+
+    # Later tests override earlier ones, as in the original interval by interval classification
+    t_type = np.full(len(p)-1, 2, dtype=np.int8)    # Default is generic "stable"
+    t_type[t_inv <= 0] = 0                          # inversion
+    t_type[t_dry > 0] = 6                           # unstable
+    t_type[(t_dry < 0) & (t_moi > 0)] = 4           # conditionally unstable
+    t_type[np.abs(t_moi) <= tol] = 3                # moist adiabatic
+    t_type[np.abs(t_dry) <= tol] = 5                # neutral or adiabatic
+    t_type[np.abs(t_inv) <= tol] = 1                # isothermal
+    return t_type
+
+
+def compute_diagnostics(df, abs_tol=1.0, method='metpy'):
+    """
+    Calculates the profile variables and key indices of a sounding, each once, without any plotting
+    (matplotlib is not imported)
+    
+    Required inputs:
+        df (Pandas dataframe) = sounding data, as for plot_skewt
+    Optional inputs:         Default:
+        abs_tol       (float) [1.0]   = The ± temperature lapse rate range [K/km] for defining isothermal & adiabatic profile intervals
+        method          (str) ['metpy'] = 'metpy' to use metpy.calc with units throughout, or 'numpy' for the unit-free
+                                        core of sounding_thermo (units only on input and output; much faster for long
+                                        profiles, same definitions except that the EL is the highest one, not 'most_cape')
+
+    Outputs:
+        diag           (dict)         = Dictionary of metpy quantities:
+            'p', 'z', 'T', 'Td', 'u', 'v'     = the profile, duplicate pressures removed
+            'Td_filled'                       = dewpoint with missing upper-level values filled in
+            'parcel'                          = surface parcel temperature profile [K]
+            'lcl_pressure', 'lcl_temperature', 'lcl_height'
+            'lfc_pressure', 'lfc_temperature' (nan if there is no LFC)
+            'el_pressure', 'el_temperature'   (nan if there is no EL)
+            'cape', 'cin', 'pw'
+        and 'stability' = integer array of stability codes per interval (see stability_codes),
+            'station', 'time' = from the first row of df (None if the columns are missing)
+    """
+    df = df.drop_duplicates(subset=['pressure'])
+
+    # We will pull the data out of the sounding data into individual variables and assign units.
+    p = df['pressure'].values * units.hPa
+    z = df['height'].values * units.m
+    T = df['temperature'].values * units.degC
+    Td = df['dewpoint'].values * units.degC
+    wind_speed = df['speed'].values * units.knots
+    wind_dir = df['direction'].values * units.degrees
+    u, v = mpcalc.wind_components(wind_speed, wind_dir)
+    
+    # Older soundings are missing upper-level dewpoints - fill in some bogus values to make some calculations work
+    Td_filled = df['dewpoint'].fillna(value=(1-np.exp(1-(df['pressure']/1000))-1)*40).values  * units.degC
+
+    if method == 'numpy':
+        indices = _thermo_indices(p.m_as('Pa'), T.m_as('K'), Td.m_as('K'))
+    elif method == 'metpy':
+        indices = _metpy_indices(p, T, Td, Td_filled)
+    else:
+        raise ValueError("Unknown method: "+str(method))
+
+    return {
+        'p': p, 'z': z, 'T': T, 'Td': Td, 'u': u, 'v': v, 'Td_filled': Td_filled,
+        **indices,
+        'lcl_height': ((T[0]-Td[0]) * (125 * units.m / units.degK)).to_base_units(),
+        'stability': stability_codes(p, T, z, abs_tol=abs_tol),
+        'station': df['station'].iloc[0] if 'station' in df else None,
+        'time': df['time'].iloc[0] if 'time' in df else None,
+    }
+
+
+def _metpy_indices(p, T, Td, Td_filled):
+    # Lifted surface parcel profile, and the levels and indices that depend on it, from metpy.calc
+    t_parcel = mpcalc.parcel_profile(p, T[0], Td[0])
+    lcl_p, lcl_t = mpcalc.lcl(p[0], T[0], Td[0], max_iters=50, eps=1e-05)
+    lfc_p, lfc_t = mpcalc.lfc(p, T, Td_filled, t_parcel)
+    el_p, el_t = mpcalc.el(p, T, Td, which='most_cape')
+    cape, cin = mpcalc.cape_cin(p, T, Td, t_parcel, which_lfc='bottom', which_el='top')
+
+    return {
+        'parcel': t_parcel,
+        'lcl_pressure': lcl_p, 'lcl_temperature': lcl_t,
+        'lfc_pressure': lfc_p, 'lfc_temperature': lfc_t.to(units.degC),
+        'el_pressure': el_p, 'el_temperature': el_t,
+        'cape': cape, 'cin': cin,
+        'pw': mpcalc.precipitable_water(p, Td),
+    }
+
+
+def _thermo_indices(p, T, Td):
+    # The same as _metpy_indices from plain SI arrays (sounding_thermo), with units put on the results,
+    #   in the units metpy returns them
+    t_parcel = st.parcel_profile(p, T[0], Td[0])
+    lcl_p, lcl_t = st.lcl(p[0], T[0], Td[0])
+    lfc_p, lfc_t = st.lfc(p, T, t_parcel, lcl_p, lcl_t)
+    ok = np.isfinite(Td)
+    el_p, el_t = st.el(p[ok], T[ok], t_parcel[ok], st.lcl(p[ok][0], T[ok][0], Td[ok][0])[0])
+    cape, cin = st.cape_cin(p, T, Td, t_parcel)
+    return {
+        'parcel': t_parcel * units.K,
+        'lcl_pressure': (lcl_p * units.Pa).to(units.hPa), 'lcl_temperature': (lcl_t * units.K).to(units.degC),
+        'lfc_pressure': (lfc_p * units.Pa).to(units.hPa), 'lfc_temperature': (lfc_t * units.K).to(units.degC),
+        'el_pressure': (el_p * units.Pa).to(units.hPa), 'el_temperature': (el_t * units.K).to(units.degC),
+        'cape': cape * units('J/kg'), 'cin': cin * units('J/kg'),
+        'pw': st.precipitable_water(p, Td) * units.mm,
+    }
+
+
 def plot_skewt(df,plot_stability=True,plot_cin_cape=True,plot_indices=True,
-               output_pdf=False,output_display=True,abs_tol=1.0):
+               output_pdf=False,output_display=True,abs_tol=1.0,diag=None):
     """
     Plots annotated Skew-T log-P diagram using metpy module, given a meteorological profile
     
@@ -33,12 +182,16 @@ def plot_skewt(df,plot_stability=True,plot_cin_cape=True,plot_indices=True,
         output_pdf     (bool) [False] = Produce a PDF file of the plot in current directory
         output_display (bool) [True]  = Generate a plot interactively on the screen
         abs_tol       (float) [1.0]   = The ± temperature lapse rate range [K/km] for defining isothermal & adiabatic profile intervals
+        diag           (dict) [None]  = Result of compute_diagnostics(df) if already at hand (otherwise computed here)
         
 
     Outputs:
         skew         (object)         = The generated plot as an object
     """
     
+    import matplotlib.pyplot as plt
+    from metpy.plots import SkewT
+
     ###############################################################
     ### Set up interctive display
     plt.close()
@@ -48,20 +201,9 @@ def plot_skewt(df,plot_stability=True,plot_cin_cape=True,plot_indices=True,
         plt.ioff()
     
     ###############################################################
-    ### Parse meteorological variables
-    df = df.drop_duplicates(subset=['pressure'])
-
-    # We will pull the data out of the sounding data into individual variables and assign units.
-    p = df['pressure'].values * units.hPa
-    z = df['height'].values * units.m
-    T = df['temperature'].values * units.degC
-    Td = df['dewpoint'].values * units.degC
-    wind_speed = df['speed'].values * units.knots
-    wind_dir = df['direction'].values * units.degrees
-    u, v = mpcalc.wind_components(wind_speed, wind_dir)
-    
-    # Older soundings are missing upper-level dewpoints - fill in some bogus values to make some calculations work
-    Td_filled = df['dewpoint'].fillna(value=(1-np.exp(1-(df['pressure']/1000))-1)*40).values  * units.degC
+    ### Meteorological variables and indices
+    if diag is None:
+        diag = compute_diagnostics(df, abs_tol=abs_tol)
     
     ###############################################################
     ### Initialize plot
@@ -70,172 +212,239 @@ def plot_skewt(df,plot_stability=True,plot_cin_cape=True,plot_indices=True,
     fig = plt.figure(figsize=(14, 10))
     skew = SkewT(fig,rect=(0.05,0.1,0.7,0.8),rotation=45) # `rotation` sets the slope of the isotherms
 ###    skew = SkewT(fig, rotation=45) # `rotation` sets the slope of the isotherms
-    text_edge = 0.75
+
+    _draw_background(fig, skew, plot_stability)
+    _draw_profile(fig, skew, diag, plot_stability, plot_cin_cape, plot_indices)
+
 
     ###############################################################
-    ### Block for calculating and plotting stability
+    ### Produce a PDF file of the plot
+    if output_pdf:
+        filename = diag['station']+"_"+'{dt:%Y%m%d_%H%M}'.format(dt=diag['time'])+".pdf"
+        plt.savefig(filename)
+    
+    return skew
+
+
+def _add_lines(skew, x, p, **kwargs):
+    # One family of background curves (rows of x [˚C] at pressures p [hPa]) as a LineCollection,
+    #   with the defaults of the SkewT.plot_* methods
+    from matplotlib.collections import LineCollection
+    from matplotlib.lines import Line2D
+    kwargs.setdefault('linestyles', 'dashed')
+    kwargs.setdefault('zorder', Line2D.zorder - 0.001)
+    return skew.ax.add_collection(LineCollection([np.vstack((xi, p)).T for xi in x], **kwargs))
+
+
+def _draw_background(fig, skew, plot_stability=True):
+    # The parts of the diagram that are the same for every sounding: axis limits, the 0 isotherm,
+    #   dry and moist adiabats, mixing ratio lines and their labels, and the stability legend
+    text_edge = TEXT_EDGE
+    before = set(skew.ax.get_children())
+
+    skew.ax.set_ylim(*sounding_tables.PRESSURE_LIMITS)      # set pressure level range
+    skew.ax.set_xlim(*sounding_tables.TEMPERATURE_LIMITS)   # set temperature range on bottom of plot
+
+    # An example of a slanted line at constant T -- in this case the 0
+    # isotherm
+    skew.ax.axvline(0, color='grey', linestyle='-.', linewidth=1)
+
+    if plot_stability:
+        c_stab = STABILITY_COLORS
+        fig.text(text_edge, 0.68,"Unstable", ha='left', va='center',fontsize=19,c=c_stab[6])
+        fig.text(text_edge, 0.71,"Neutral or Adiabatic", ha='left', va='center',fontsize=19,c=c_stab[5])
+        fig.text(text_edge, 0.74,"Conditionally Unstable", ha='left', va='center',fontsize=19,c=c_stab[4])
+        fig.text(text_edge, 0.77,"Moist Adiabatic", ha='left', va='center',fontsize=19,c=c_stab[3])
+        fig.text(text_edge, 0.80,"Stable", ha='left', va='center',fontsize=19,c=c_stab[2])
+        fig.text(text_edge, 0.83,"Isothermal", ha='left', va='center',fontsize=19,c=c_stab[1])
+        fig.text(text_edge, 0.86,"Inversion", ha='left', va='center',fontsize=19,c=c_stab[0])
+
+    ###############################################################
+    ### Plot the relevant thermodynamic lines, precomputed in sounding_tables
+    #   (the same curves and styles SkewT.plot_dry_adiabats, plot_moist_adiabats and plot_mixing_lines draw)
+    bg = sounding_tables.tables()
+    p_adiabat = bg['adiabat_pressure']
+    # Red: the color='orangered' once passed to plot_dry_adiabats lost to its default colors='r'
+    skew.dry_adiabats = _add_lines(skew, bg['dry_adiabats'], p_adiabat, colors='r', alpha=0.25)
+    skew.moist_adiabats = _add_lines(skew, bg['moist_adiabats'], p_adiabat, colors='tab:green', alpha=0.25)
+    skew.mixing_lines = _add_lines(skew, bg['mixing_lines'], bg['mixing_pressure'], linestyle='dotted',
+                                   colors='tab:blue', alpha=0.8)
+
+    for pw,w in enumerate(bg['mixing_ratios']):
+        s_mixrat = f"{1000*w:.2g}"
+        if w == 0.002:
+            s_mixrat = s_mixrat+" g/kg"
+        skew.ax.text(bg['label_temperature'][pw], bg['label_pressure'][pw], s_mixrat, color='tab:blue',
+                     rotation=50+pw, rotation_mode='anchor', ha='left', va='bottom')
+
+    skew.ax.tick_params(axis = 'y', which = 'major', labelsize = 16)
+    skew.ax.tick_params(axis = 'x', which = 'major', labelsize = 16, labelrotation=45)
+
+    # The background goes on top of profile artists of equal z-order, as if drawn after them
+    for artist in set(skew.ax.get_children()) - before:
+        artist.set_zorder(artist.get_zorder() + 0.001)
+
+
+def _draw_profile(fig, skew, diag, plot_stability=True, plot_cin_cape=True, plot_indices=True):
+    # The parts of the diagram that show one sounding: stability shading, profiles, parcel, wind barbs,
+    #   LCL/LFC/EL markers, indices, CAPE and CIN shading, time and station
+    from metpy.plots import add_timestamp
+    text_edge = TEXT_EDGE
+    p, T, Td, u, v = (diag[k] for k in ('p', 'T', 'Td', 'u', 'v'))
+    t_parcel = diag['parcel']
+    # Plain arrays in the units of the axes for most artists: matplotlib probes its inputs with hasattr,
+    #   which is slow on metpy quantities
+    p_hpa, T_c, Td_c, parcel_c = p.m_as('hPa'), T.m_as('degC'), Td.m_as('degC'), t_parcel.m_as('degC')
+
+    ###############################################################
+    ### Block for plotting stability
     
     if plot_stability:
         
         # For showing stability categories - color choices
-        c_stab = ["indigo","silver","cadetblue","turquoise","yellowgreen","gold","deeppink"]
+        c_stab = STABILITY_COLORS
 
-        # Other profile quantities needed to estimate stability in each interval
-        t_inv = -(T[:len(p)-1] - T[1:]) / \
-                (z[:len(p)-1] - z[1:]) # Negative is inversion
-        
-        t_dry = [np.nan] * (len(p)-1)  # Negative is dry stable, positive unstable
-        t_moi = [np.nan] * (len(p)-1)  # Negative is stable
-                                       #   positive while t_dry negative is conditionally unstable
-                                       #   both positive is moist adiabatic
-        for i in range(len(p)-1):     # Every interval between measurements in the sounding...
-            t_dry[i] = (mpcalc.dry_lapse(p[i+1],T[i],reference_pressure=p[i]) - T[i+1]) / \
-                       (z[i+1] - z[i])
-            t_moi[i] = (mpcalc.moist_lapse(p[i+1:i+2],T[i],reference_pressure=p[i]) - T[i+1]) / \
-                       (z[i+1] - z[i])
-
-            t_type = [2] * (len(p)-1) # Codes for stability; default is generic "stable"
-
-        # Here we use codes for profiles in each interval:
-        #  0 = inversion
-        #  1 = isothermal (±abs_tol)
-        #  2 = stable
-        #  3 = moist adiabatic (±abs_tol)
-        #  4 = conditionally unstable
-        #  5 = neutral or adiabatic (±abs_tol)
-        #  6 = absolutely unstable
-        for i in range(len(p)-1):     # Every interval between measurements in the sounding...
-            if t_inv[i] <= 0:
-                t_type[i] = 0         # inversion
-            if t_dry[i] > 0:
-                t_type[i] = 6         # unstable
-            if t_moi[i].size == 1:
-                if t_dry[i] < 0 and t_moi[i] > 0:
-                    t_type[i] = 4     # conditionally unstable
-                if isclose(t_moi[i].magnitude, 0, abs_tol=abs_tol*1e-3):
-                    t_type[i] = 3     # moist adiabatic
-            if isclose(t_dry[i].magnitude, 0, abs_tol=abs_tol*1e-3):
-                t_type[i] = 5         # neutral or adiabatic
-            if isclose(t_inv[i].magnitude, 0, abs_tol=abs_tol*1e-3):
-                t_type[i] = 1         # isothermal    
-
-        for i in range(len(p)-1):     # Plot stability shading in each interval
-            y = [p[i],p[i+1]]
-            x1 = [T[i],T[i+1]]
-            x2 = [(50.0 * units.degC),(50.0 * units.degC)]
-            skew.shade_area(y, x1, x2, which='both', facecolor=c_stab[t_type[i]])
-
-        plt.figtext(text_edge, 0.68,"Unstable", ha='left', va='center',fontsize=19,c=c_stab[6])
-        plt.figtext(text_edge, 0.71,"Neutral or Adiabatic", ha='left', va='center',fontsize=19,c=c_stab[5])
-        plt.figtext(text_edge, 0.74,"Conditionally Unstable", ha='left', va='center',fontsize=19,c=c_stab[4])
-        plt.figtext(text_edge, 0.77,"Moist Adiabatic", ha='left', va='center',fontsize=19,c=c_stab[3])
-        plt.figtext(text_edge, 0.80,"Stable", ha='left', va='center',fontsize=19,c=c_stab[2])
-        plt.figtext(text_edge, 0.83,"Isothermal", ha='left', va='center',fontsize=19,c=c_stab[1])
-        plt.figtext(text_edge, 0.86,"Inversion", ha='left', va='center',fontsize=19,c=c_stab[0])
+        # Stability code of each interval between measurements in the sounding
+        t_type = diag['stability']
+
+        # Plot stability shading (the area between the profile and 50˚C) as one collection of
+        #   polygons, one per run of intervals with the same code
+        from matplotlib.collections import PolyCollection
+        edges = np.flatnonzero(np.diff(t_type)) + 1
+        runs = list(zip(np.r_[0, edges], np.r_[edges, len(t_type)]))
+        polys = [np.column_stack([np.r_[T_c[i:j+1], 50.0, 50.0], np.r_[p_hpa[i:j+1], p_hpa[j], p_hpa[i]]])
+                 for i, j in runs]
+        polys = [poly[np.isfinite(poly).all(axis=1)] for poly in polys]     # Skip missing levels
+        skew.ax.add_collection(PolyCollection(polys, facecolors=[c_stab[t_type[i]] for i, _ in runs], alpha=0.4))
+        # No unit labels on the axes when the stability shading is shown, as with SkewT.shade_area
+        skew.ax.set_xlabel('')
+        skew.ax.set_ylabel('')
 
 
     ###############################################################
     ### Standard sounding plot
 
-    skew.ax.set_ylim(1050, 100) # set pressure level range
-    skew.ax.set_xlim(-40, 50)   # set temperature range on bottom of plot
     skew.plot(p, T, 'crimson')
-    skew.plot(p, Td, 'teal')
-    p_top = np.where(p.magnitude>=100.0)[0][-1] # truncate at top of plot
-    skew.plot_barbs(p[:p_top], u[:p_top], v[:p_top])
+    skew.plot(p_hpa, Td_c, 'teal')
+    p_top = np.where(p_hpa>=100.0)[0][-1] # truncate at top of plot
+    skew.plot_barbs(p_hpa[:p_top], u[:p_top].m, v[:p_top].m)
    
-    # Calculate LCL height and plot as black dot
-    lcl_pressure, lcl_temperature = mpcalc.lcl(p[0], T[0], Td[0])
-    skew.plot(lcl_pressure, lcl_temperature, 'ko', markerfacecolor='black')
+    # Plot LCL as black dot
+    skew.plot(diag['lcl_pressure'], diag['lcl_temperature'], 'ko', markerfacecolor='black')
    
     # Place markers at surface values of T, Td
     skew.plot(p[0], T[0], color='maroon', marker='x')
     skew.plot(p[0], Td[0], color='darkslategrey', marker='x')
 
-    # Calculate full lifted parcel profile and add to plot as black line
-    prof = mpcalc.parcel_profile(p, T[0], Td[0]).to('degC')
-    skew.plot(p, prof, 'k', linewidth=1)
+    # Add full lifted parcel profile to plot as black line
+    skew.plot(p_hpa, parcel_c, 'k', linewidth=1)
     
     # Mark the LFC, EL
-    t_parcel = mpcalc.parcel_profile(p, T[0], Td[0]) 
-    lfc_pressure,lfc_temperature = mpcalc.lfc(p, T, Td_filled, t_parcel)
-    skew.plot(lfc_pressure, lfc_temperature, 'wo', markerfacecolor='red')
-    el_pressure,el_temperature = mpcalc.el(p, T, Td, which='most_cape')
-    skew.plot(el_pressure, el_temperature, 'wo', markerfacecolor='sienna')
-
-    
-    # An example of a slanted line at constant T -- in this case the 0
-    # isotherm
-    skew.ax.axvline(0, color='grey', linestyle='-.', linewidth=1)
+    skew.plot(diag['lfc_pressure'], diag['lfc_temperature'], 'wo', markerfacecolor='red')
+    skew.plot(diag['el_pressure'], diag['el_temperature'], 'wo', markerfacecolor='sienna')
     
 
     ###############################################################
     ### Plot stability indices, other statistics 
     if plot_indices:
-        c_cape,c_cin = mpcalc.cape_cin(p, T, Td, t_parcel, which_lfc='bottom', which_el='top')
-        c_lcl_p,c_lcl_t = mpcalc.lcl(p[0], T[0], Td[0], max_iters=50, eps=1e-05)
-        c_lcl_z = ((T[0]-Td[0]) * (125 * units.m / units.degK)).to_base_units()
-        c_el_p,c_el_t = mpcalc.el(p, T, Td, which='most_cape')
-        c_pw = mpcalc.precipitable_water(p,Td)
-        c_lfc_p,c_lfc_t = mpcalc.lfc(p, T, Td_filled, t_parcel)
-        c_lfc_t = c_lfc_t.to(units.degC)
+        c_cape,c_cin = diag['cape'],diag['cin']
+        c_lcl_p,c_lcl_t = diag['lcl_pressure'],diag['lcl_temperature']
+        c_el_p,c_el_t = diag['el_pressure'],diag['el_temperature']
+        c_pw = diag['pw']
+        c_lfc_p,c_lfc_t = diag['lfc_pressure'],diag['lfc_temperature']
 
         if not np.isnan(c_el_p.magnitude):
-            plt.figtext(text_edge, 0.47,f"EL: {c_el_p.magnitude:.0f} hPa", ha='left', va='center',fontsize=19,c='sienna')
-            plt.figtext(text_edge, 0.44,f"EL: {c_el_t.magnitude:.1f}˚C", ha='left', va='center',fontsize=19,c='sienna')
+            fig.text(text_edge, 0.47,f"EL: {c_el_p.magnitude:.0f} hPa", ha='left', va='center',fontsize=19,c='sienna')
+            fig.text(text_edge, 0.44,f"EL: {c_el_t.magnitude:.1f}˚C", ha='left', va='center',fontsize=19,c='sienna')
         if not np.isnan(c_lfc_p.magnitude):
-            plt.figtext(text_edge, 0.39,f"LFC: {c_lfc_p.magnitude:.1f} hPa", ha='left', va='center',fontsize=19,c='tab:red')
-            plt.figtext(text_edge, 0.36,f"LFC: {c_lfc_t.magnitude:.1f}˚C", ha='left', va='center',fontsize=19,c='tab:red')
-        plt.figtext(text_edge, 0.305,f"CAPE: {c_cape.magnitude:.0f} J/kg", ha='left', va='center',fontsize=19,c='firebrick')
-        plt.figtext(text_edge, 0.265,f"CIN: {c_cin.magnitude:.0f} J/kg", ha='left', va='center',fontsize=19,c='blue')
-        plt.figtext(text_edge, 0.21,f"PW: {c_pw.magnitude:.0f} mm", ha='left', va='center',fontsize=19,c='lightseagreen')
-        plt.figtext(text_edge, 0.16,f"LCL: {c_lcl_p.magnitude:.0f} hPa", ha='left', va='center',fontsize=19,c='black')
-        plt.figtext(text_edge, 0.13,f"LCL: {c_lcl_t.magnitude:.1f}˚C", ha='left', va='center',fontsize=19,c='black')
+            fig.text(text_edge, 0.39,f"LFC: {c_lfc_p.magnitude:.1f} hPa", ha='left', va='center',fontsize=19,c='tab:red')
+            fig.text(text_edge, 0.36,f"LFC: {c_lfc_t.magnitude:.1f}˚C", ha='left', va='center',fontsize=19,c='tab:red')
+        fig.text(text_edge, 0.305,f"CAPE: {c_cape.magnitude:.0f} J/kg", ha='left', va='center',fontsize=19,c='firebrick')
+        fig.text(text_edge, 0.265,f"CIN: {c_cin.magnitude:.0f} J/kg", ha='left', va='center',fontsize=19,c='blue')
+        fig.text(text_edge, 0.21,f"PW: {c_pw.magnitude:.0f} mm", ha='left', va='center',fontsize=19,c='lightseagreen')
+        fig.text(text_edge, 0.16,f"LCL: {c_lcl_p.magnitude:.0f} hPa", ha='left', va='center',fontsize=19,c='black')
+        fig.text(text_edge, 0.13,f"LCL: {c_lcl_t.magnitude:.1f}˚C", ha='left', va='center',fontsize=19,c='black')
        
-        plt.figtext(text_edge, 0.61,"Station: ", ha='left', va='center',fontsize=19,c='black')
-        plt.figtext(text_edge, 0.58,f"  Pressure: {p[0].magnitude:.0f} hPa", ha='left', va='center',fontsize=19,c='black')
-        plt.figtext(text_edge, 0.55,f"  Temperature: {T[0].magnitude:.1f}˚C", ha='left', va='center',fontsize=19,c='black')
-        plt.figtext(text_edge, 0.52,f"  Dew Point: {Td[0].magnitude:.1f}˚C", ha='left', va='center',fontsize=19,c='black')
+        fig.text(text_edge, 0.61,"Station: ", ha='left', va='center',fontsize=19,c='black')
+        fig.text(text_edge, 0.58,f"  Pressure: {p[0].magnitude:.0f} hPa", ha='left', va='center',fontsize=19,c='black')
+        fig.text(text_edge, 0.55,f"  Temperature: {T[0].magnitude:.1f}˚C", ha='left', va='center',fontsize=19,c='black')
+        fig.text(text_edge, 0.52,f"  Dew Point: {Td[0].magnitude:.1f}˚C", ha='left', va='center',fontsize=19,c='black')
     
 
     ###############################################################
     ### Shade areas of CAPE and CIN, plot stats   
-    if plot_cin_cape and c_cape.magnitude > 0:
-        skew.shade_cin(p, T, t_parcel)
-        skew.shade_cape(p, T, t_parcel)
-
-        
-    ###############################################################
-    ### Plot the relevant thermodynamic lines
-    skew.plot_dry_adiabats(t0=list(range(-40,85,10))*units.degC, alpha=0.25, color='orangered')
-    skew.plot_moist_adiabats(alpha=0.25, colors='tab:green')
-    mixrats = [2e-6,1e-5,3e-5,8e-5,2e-4,5e-4,0.001,0.002,0.004,0.007,0.01,0.016,0.024,0.032]
-    p_at_ws = [120,120,120,120,120,120,120,120,165,220,268,367,497,645] * units.hPa
-    skew.plot_mixing_lines(pressure=np.arange(1050, 80, -20) * units.hPa,linestyle='dotted', colors='tab:blue',
-            mixing_ratio=np.array(mixrats).reshape(-1, 1))
-    
-    for pw,w in enumerate(mixrats):        
-        s_mixrat = f"{1000*w:.2g}"
-        if w == 0.002:
-            s_mixrat = s_mixrat+" g/kg"
-        # aaa = skew.plot(p_at_ws[pw], mpcalc.dewpoint(mpcalc.vapor_pressure(p_at_ws[pw], w)), color='tab:blue', marker='o')
-        skew.ax.text(mpcalc.dewpoint(mpcalc.vapor_pressure(p_at_ws[pw], w)).m, p_at_ws[pw].m, s_mixrat, color='tab:blue',
-                     rotation=50+pw, rotation_mode='anchor', ha='left', va='bottom')
-
-    plt.tick_params(axis = 'y', which = 'major', labelsize = 16)
-    plt.tick_params(axis = 'x', which = 'major', labelsize = 16, labelrotation=45)
+    if plot_cin_cape and diag['cape'].magnitude > 0:
+        skew.shade_cin(p_hpa, T_c, parcel_c)
+        skew.shade_cape(p_hpa, T_c, parcel_c)
 
     # Add the timestamp for the data to the plot
-    s_site = df['station'][0]
-    s_time = '{dt:%Y%m%d_%H%M}'.format(dt=df['time'][0])
+    s_site = diag['station']
+    s_time = '{dt:%Y%m%d_%H%M}'.format(dt=diag['time'])
     add_timestamp(skew.ax, datetime.strptime(s_time, '%Y%m%d_%H%M'), pretext='Valid: ', y=1.02, x=0.01, ha='left', fontsize=17)
     skew.ax.set_title(s_site,fontsize=28,x=0.66)
 
 
-    ###############################################################
-    ### Produce a PDF file of the plot
-    if output_pdf:
-        filename = s_site+"_"+s_time+".pdf"
-        plt.savefig(filename)
+class SkewTRenderer:
+    """
+    Renders many annotated Skew-T diagrams to image files without a display, reusing one figure:
+    the background (adiabats, mixing lines and their labels, axis limits, legend) is drawn once, and
+    for each sounding only the profile, shading and text are swapped in. The images look the same
+    as those of plot_skewt.
+
+        renderer = SkewTRenderer()
+        for df in soundings:
+            renderer.render(df, f"{df['station'][0]}_{df['time'][0]:%Y%m%d_%H%M}.png")
     
-    return skew
\ No newline at end of file
+    Optional inputs:         Default:
+        plot_stability (bool) [True]  = Include/exclude shading that shows stability in each interval of profile
+        plot_cin_cape  (bool) [True]  = Include/exclude shading that shows CIN and CAPE
+        plot_indices   (bool) [True]  = Include/exclude values for key indices estimated from profile
+        abs_tol       (float) [1.0]   = The ± temperature lapse rate range [K/km] for defining isothermal & adiabatic profile intervals
+
+    Attributes:
+        fig, skew                     = The matplotlib figure and metpy SkewT plot
+    """
+    def __init__(self, plot_stability=True, plot_cin_cape=True, plot_indices=True, abs_tol=1.0):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from metpy.plots import SkewT
+
+        self.plot_stability = plot_stability
+        self.plot_cin_cape = plot_cin_cape
+        self.plot_indices = plot_indices
+        self.abs_tol = abs_tol
+
+        # A figure outside pyplot, on the non-interactive Agg canvas
+        self.fig = Figure(figsize=(14, 10))
+        FigureCanvasAgg(self.fig)
+        self.skew = SkewT(self.fig,rect=(0.05,0.1,0.7,0.8),rotation=45)
+        _draw_background(self.fig, self.skew, plot_stability)
+        self._static = set(self.skew.ax.get_children()) | set(self.fig.get_children())
+
+    def clear(self):
+        """
+        Removes the artists of the last sounding, leaving the background
+        """
+        for artist in self.skew.ax.get_children() + self.fig.get_children():
+            if artist not in self._static:
+                artist.remove()
+
+    def render(self, df=None, filename=None, diag=None, **kwargs):
+        """
+        Draws one sounding and optionally saves it
+
+        Optional inputs:
+            df (Pandas dataframe) = sounding data, as for plot_skewt
+            filename        (str) = image file to write; the format follows the extension (.png, .pdf, .svg, ...)
+            diag           (dict) = Result of compute_diagnostics(df) if already at hand (otherwise computed here)
+            kwargs                = further arguments of Figure.savefig, e.g. dpi
+        Outputs:
+            fig                   = The figure, showing this sounding until the next call
+        """
+        self.clear()
+        if diag is None:
+            diag = compute_diagnostics(df, abs_tol=self.abs_tol)
+        _draw_profile(self.fig, self.skew, diag, self.plot_stability, self.plot_cin_cape, self.plot_indices)
+        if filename:
+            self.fig.savefig(filename, **kwargs)
+        return self.fig
@@ -0,0 +1,347 @@
+'''
+Simple timing benchmarks for the sounding_plotter module, on synthetic soundings
+(no network access needed).
+
+Run from this directory:
+    python sounding_plotter_bench.py
+'''
+import time
+from math import isclose
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import metpy.calc as mpcalc
+from metpy.units import units
+
+import sounding_plotter as sp
+
+
+def _timeit(func, repeat=3):
+    '''
+    Returns the best wall-clock time (seconds) of `repeat` calls to func()
+    '''
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def synthetic_sounding(nlev=100, seed=0, station='XXX', time=datetime(2021, 7, 7, 0)):
+    '''
+    A made-up but plausible sounding DataFrame with nlev levels, in the layout of
+        siphon's WyomingUpperAir (pressure, height, temperature, dewpoint, direction, speed, station, time)
+    '''
+    rng = np.random.default_rng(seed)
+    p = np.geomspace(1000.0, 20.0, nlev)
+    z = -7400.0 * np.log(p/1013.0)
+    T = 28.0 - 6.5e-3*np.minimum(z, 12000.0) + rng.normal(0, 0.3, nlev)
+    Td = T - np.clip(2.0 + 2e-3*z + rng.normal(0, 1.5, nlev), 0.1, 40.0)
+    Td[z > 15000] = np.nan                      # Older soundings lack upper-level dewpoints
+    return pd.DataFrame({'pressure': p, 'height': z, 'temperature': T, 'dewpoint': Td,
+                         'direction': rng.uniform(0, 360, nlev), 'speed': rng.uniform(0, 60, nlev),
+                         'station': station, 'time': time})
+
+
+def _stability_loop(p, T, z, abs_tol=1.0):
+    # The former interval by interval classification in plot_skewt, for comparison
+    t_inv = -(T[:len(p)-1] - T[1:]) / (z[:len(p)-1] - z[1:])
+    t_type = [2] * (len(p)-1)
+    for i in range(len(p)-1):
+        t_dry = (mpcalc.dry_lapse(p[i+1],T[i],reference_pressure=p[i]) - T[i+1]) / (z[i+1] - z[i])
+        t_moi = (mpcalc.moist_lapse(p[i+1:i+2],T[i],reference_pressure=p[i]) - T[i+1]) / (z[i+1] - z[i])
+        if t_inv[i] <= 0:
+            t_type[i] = 0
+        if t_dry > 0:
+            t_type[i] = 6
+        if t_dry < 0 and t_moi > 0:
+            t_type[i] = 4
+        if isclose(t_moi.magnitude, 0, abs_tol=abs_tol*1e-3):
+            t_type[i] = 3
+        if isclose(t_dry.magnitude, 0, abs_tol=abs_tol*1e-3):
+            t_type[i] = 5
+        if isclose(t_inv[i].magnitude, 0, abs_tol=abs_tol*1e-3):
+            t_type[i] = 1
+    return np.array(t_type)
+
+
+def bench_stability(nlevs=(100, 1000, 5000)):
+    '''
+    Time of the vectorized stability_codes versus the per-interval metpy loop
+    '''
+    print("Stability classification:")
+    for nlev in nlevs:
+        df = synthetic_sounding(nlev)
+        p = df['pressure'].values * units.hPa
+        T = df['temperature'].values * units.degC
+        z = df['height'].values * units.m
+        t = _timeit(lambda: sp.stability_codes(p, T, z))
+        n_loop = min(nlev, 200)             # The loop is extrapolated from its first intervals
+        t_loop = _timeit(lambda: _stability_loop(p[:n_loop+1], T[:n_loop+1], z[:n_loop+1]), repeat=1)
+        t_loop *= (nlev-1) / n_loop
+        same = np.array_equal(sp.stability_codes(p[:n_loop+1], T[:n_loop+1], z[:n_loop+1]),
+                              _stability_loop(p[:n_loop+1], T[:n_loop+1], z[:n_loop+1]))
+        print(f"  {nlev:5d} levels: vectorized {t*1e3:8.2f} ms, loop {t_loop*1e3:9.1f} ms "
+              f"(speedup {t_loop/t:6.0f}, same codes: {same})")
+
+
+def bench_diagnostics(nlev=100, nsound=20):
+    '''
+    Time of compute_diagnostics alone, and of a full plot_skewt on a non-interactive backend
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+    dfs = [synthetic_sounding(nlev, seed=i) for i in range(nsound)]
+    t = _timeit(lambda: [sp.compute_diagnostics(df) for df in dfs], repeat=1)
+    print(f"compute_diagnostics, {nlev} levels: {t/nsound*1e3:7.1f} ms per sounding")
+    t = _timeit(lambda: sp.plot_skewt(dfs[0], output_display=False))
+    print(f"plot_skewt, {nlev} levels:          {t*1e3:7.1f} ms per sounding")
+
+
+def bench_climatology(nsound=64, nlev=100):
+    '''
+    Scaling of sounding_climatology.climatology with the number of worker processes
+    '''
+    import os
+    import sounding_climatology as scl
+    dfs = [synthetic_sounding(nlev, seed=i) for i in range(nsound)]
+    print(f"Climatology of {nsound} soundings, {nlev} levels ({os.cpu_count()} CPUs):")
+    t1 = None
+    for workers in sorted({1, 2, 4, os.cpu_count()}):
+        t = _timeit(lambda: scl.climatology(dfs, max_workers=workers), repeat=1)
+        t1 = t1 or t
+        print(f"  {workers:3d} processes {t:7.2f} s   speedup {t1/t:5.2f}")
+
+
+def bench_archive(nsound=2000, nlev=100):
+    '''
+    Time to fill a sounding_archive with nsound soundings, and to look one up
+    '''
+    import tempfile
+    import sounding_archive as sa
+    dfs = [synthetic_sounding(nlev, seed=i % 50, station=f"S{i % 20:03d}",
+                              time=datetime(2000, 1, 1) + i//20 * timedelta(hours=12))
+           for i in range(nsound)]
+    with tempfile.TemporaryDirectory() as tmp:
+        arc = sa.SoundingArchive(tmp)
+        t = _timeit(lambda: arc.append(dfs), repeat=1)
+        print(f"Archive: {nsound} soundings written in {t:.2f} s")
+        key = (dfs[nsound//2]['station'][0], np.datetime64(dfs[nsound//2]['time'][0], 's'))
+        t = _timeit(lambda: [arc.arrays(*key) for _ in range(10000)]) / 10000
+        print(f"  lookup of one sounding as arrays:    {t*1e6:7.1f} us")
+        t = _timeit(lambda: [arc.get(*key) for _ in range(100)]) / 100
+        print(f"  lookup of one sounding as DataFrame: {t*1e6:7.1f} us")
+
+
+def bench_render(nsound=10, nlev=100):
+    '''
+    Time per PNG of plot_skewt + savefig versus SkewTRenderer, which reuses the figure and background
+    '''
+    import tempfile
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    diags = [sp.compute_diagnostics(synthetic_sounding(nlev, seed=i)) for i in range(nsound)]
+    with tempfile.TemporaryDirectory() as tmp:
+        def plot_each():
+            for i, diag in enumerate(diags):
+                sp.plot_skewt(None, diag=diag, output_display=False)
+                plt.savefig(f"{tmp}/plot_{i}.png", dpi=72)
+        renderer = sp.SkewTRenderer()
+        t_plot = _timeit(plot_each, repeat=1) / nsound
+        t_render = _timeit(lambda: [renderer.render(diag=diag, filename=f"{tmp}/render_{i}.png", dpi=72)
+                                    for i, diag in enumerate(diags)], repeat=1) / nsound
+    print(f"Rendering PNGs (diagnostics precomputed): plot_skewt {t_plot*1e3:6.0f} ms, "
+          f"SkewTRenderer {t_render*1e3:6.0f} ms per sounding (speedup {t_plot/t_render:4.1f})")
+
+
+def bench_export(nsound=24, nlev=100):
+    '''
+    Throughput of sounding_export.export_soundings to PNG files and monthly PDFs
+    '''
+    import os
+    import tempfile
+    import sounding_export as se
+    dfs = [synthetic_sounding(nlev, seed=i, station=f"S{i % 3:03d}", time=datetime(2000, 1+i//12, 1+i % 12))
+           for i in range(nsound)]
+    print(f"Export of {nsound} soundings ({os.cpu_count()} CPUs):")
+    for fmt in ['png', 'pdf']:
+        for workers in sorted({1, os.cpu_count()}):
+            with tempfile.TemporaryDirectory() as tmp:
+                t = _timeit(lambda: se.export_soundings(dfs, tmp, fmt=fmt, max_workers=workers), repeat=1)
+            print(f"  {fmt}, {workers:3d} processes: {t/nsound*1e3:6.0f} ms per sounding")
+
+
+def bench_stream(nlev=5000):
+    '''
+    Cost per level of sounding_stream.SoundingStream as a sounding arrives, early and late in the ascent
+    '''
+    import sounding_stream as ss
+    levels = synthetic_sounding(nlev)[list(ss._FIELDS)].to_dict('records')
+    stream = ss.SoundingStream()
+    times = np.empty(nlev)
+    for i, level in enumerate(levels):
+        t0 = time.perf_counter()
+        stream.add_level(**level)
+        times[i] = time.perf_counter() - t0
+    print(f"Streaming ingest of {nlev} levels: {np.median(times[1:501])*1e3:.2f} ms per level for the first 500, "
+          f"{np.median(times[-500:])*1e3:.2f} ms for the last 500")
+
+
+def bench_core(nlev=5000, nsound=5):
+    '''
+    Time of the unit-free sounding_thermo core versus metpy.calc with units, piece by piece and for the
+        whole of compute_diagnostics, on long profiles
+    '''
+    import sounding_thermo as st
+    dfs = [synthetic_sounding(nlev, seed=i) for i in range(nsound)]
+    df = dfs[0]
+    p, T, Td = df['pressure'].values, df['temperature'].values, df['dewpoint'].values
+    pq, Tq, Tdq = p * units.hPa, T * units.degC, Td * units.degC
+    p_si, T_si, Td_si = p * 100.0, T + 273.15, Td + 273.15
+    parcel_q = mpcalc.parcel_profile(pq, Tq[0], Tdq[0])
+    parcel_si = st.parcel_profile(p_si, T_si[0], Td_si[0])
+    print(f"Unit-free core versus metpy with units, {nlev} levels:")
+    for name, f_metpy, f_core in [
+            ("parcel profile", lambda: mpcalc.parcel_profile(pq, Tq[0], Tdq[0]),
+                               lambda: st.parcel_profile(p_si, T_si[0], Td_si[0])),
+            ("CAPE/CIN", lambda: mpcalc.cape_cin(pq, Tq, Tdq, parcel_q, which_lfc='bottom', which_el='top'),
+                         lambda: st.cape_cin(p_si, T_si, Td_si, parcel_si)),
+            ("precipitable water", lambda: mpcalc.precipitable_water(pq, Tdq),
+                                   lambda: st.precipitable_water(p_si, Td_si)),
+            ("compute_diagnostics", lambda: [sp.compute_diagnostics(df) for df in dfs],
+                                    lambda: [sp.compute_diagnostics(df, method='numpy') for df in dfs])]:
+        t_metpy, t_core = _timeit(f_metpy), _timeit(f_core)
+        if name == "compute_diagnostics":
+            t_metpy, t_core = t_metpy / nsound, t_core / nsound
+        print(f"  {name:20s} metpy {t_metpy*1e3:8.2f} ms, core {t_core*1e3:8.2f} ms (speedup {t_metpy/t_core:5.1f})")
+    a, b = sp.compute_diagnostics(df), sp.compute_diagnostics(df, method='numpy')
+    print(f"  CAPE {a['cape'].m:.3f} / {b['cape'].m:.3f} J/kg, "
+          f"largest parcel difference {np.max(np.abs(a['parcel'].m - b['parcel'].m)):.1e} K")
+
+
+def bench_parcels(nlevs=(1000, 5000), nsample=20):
+    '''
+    Time of the CAPE/CIN profile of sounding_parcels (a parcel from every level, all lifted together)
+        versus lifting each parcel separately with sounding_thermo (extrapolated from nsample parcels)
+    '''
+    import sounding_thermo as st
+    import sounding_parcels as spc
+    st.moist_adiabat_table()
+    print("CAPE/CIN of a parcel from every level:")
+    for nlev in nlevs:
+        df = synthetic_sounding(nlev)
+        p, T, Td = df['pressure'].values * 100.0, df['temperature'].values + 273.15, df['dewpoint'].values + 273.15
+        t = _timeit(lambda: spc.convective_parcels(df), repeat=1)
+
+        def one_by_one():
+            for k in range(nsample):
+                ok = np.isfinite(Td[k:])
+                parcel = np.full(nlev-k, np.nan)
+                parcel[ok] = st.parcel_profile(p[k:][ok], T[k], Td[k])
+                st.cape_cin(p[k:], T[k:], Td[k:], parcel)
+        t_each = _timeit(one_by_one, repeat=1) / nsample * nlev
+        print(f"  {nlev:5d} levels: all parcels at once {t:6.2f} s, one at a time {t_each:6.1f} s "
+              f"(speedup {t_each/t:4.0f})")
+
+
+def bench_tables(nfig=5):
+    '''
+    Time to get the precomputed tables of sounding_tables (read from file versus recomputed), and time to draw
+        the curves of the diagram background from them versus with the SkewT.plot_* methods of metpy
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+    from metpy.plots import SkewT
+    import sounding_tables
+
+    def load():
+        sounding_tables._tables = None
+        sounding_tables.tables()
+    t_load = _timeit(load)
+    t_build = _timeit(sounding_tables.build_tables, repeat=1)
+
+    bg = sounding_tables.tables()
+    def from_metpy(skew):
+        skew.plot_dry_adiabats(t0=list(range(-40, 85, 10))*units.degC, alpha=0.25, color='orangered')
+        skew.plot_moist_adiabats(alpha=0.25, colors='tab:green')
+        skew.plot_mixing_lines(pressure=np.arange(1050, 80, -20) * units.hPa, linestyle='dotted', colors='tab:blue',
+                               mixing_ratio=bg['mixing_ratios'].reshape(-1, 1))
+        for p, w in zip(bg['label_pressure'], bg['mixing_ratios']):
+            skew.ax.text(mpcalc.dewpoint(mpcalc.vapor_pressure(p * units.hPa, w)).m, p, f"{1000*w:.2g}")
+    def from_tables(skew):
+        sp._add_lines(skew, bg['dry_adiabats'], bg['adiabat_pressure'], colors='r', alpha=0.25)
+        sp._add_lines(skew, bg['moist_adiabats'], bg['adiabat_pressure'], colors='tab:green', alpha=0.25)
+        sp._add_lines(skew, bg['mixing_lines'], bg['mixing_pressure'], linestyle='dotted', colors='tab:blue', alpha=0.8)
+        for x, p, w in zip(bg['label_temperature'], bg['label_pressure'], bg['mixing_ratios']):
+            skew.ax.text(x, p, f"{1000*w:.2g}")
+    def draw(curves):
+        for _ in range(nfig):
+            skew = SkewT(Figure(figsize=(9, 9)))
+            skew.ax.set_ylim(*sounding_tables.PRESSURE_LIMITS)
+            skew.ax.set_xlim(*sounding_tables.TEMPERATURE_LIMITS)
+            curves(skew)
+    t_skewt = _timeit(lambda: draw(lambda skew: None), repeat=1) / nfig
+    t_metpy = _timeit(lambda: draw(from_metpy), repeat=1) / nfig - t_skewt
+    t_tables = _timeit(lambda: draw(from_tables), repeat=1) / nfig - t_skewt
+    print(f"Background tables: read from file {t_load*1e3:6.1f} ms, recomputed {t_build*1e3:6.0f} ms")
+    print(f"Background curves and labels per figure: metpy {t_metpy*1e3:6.1f} ms, from tables {t_tables*1e3:6.1f} ms "
+          f"(speedup {t_metpy/t_tables:4.1f})")
+
+
+def bench_qc(nlev=6000, nsound=3):
+    '''
+    Time of sounding_qc.preprocess on high-resolution soundings (a synthetic sounding interpolated to nlev levels,
+        with small noise), and of diagnostics and rendering with the cleaned profile versus the thinned one
+    '''
+    import tempfile
+    import matplotlib
+    matplotlib.use('Agg')
+    import sounding_qc as qc
+    rng = np.random.default_rng(0)
+    p = np.geomspace(1000.0, 20.0, nlev)
+    hires = []
+    for seed in range(nsound):
+        df = synthetic_sounding(100, seed=seed)
+        x, xp = -np.log(p), -np.log(df['pressure'].values)
+        cols = {col: np.interp(x, xp, df[col].values) for col in ('height', 'temperature', 'dewpoint', 'direction', 'speed')}
+        cols['temperature'] += rng.normal(0, 0.02, nlev)
+        cols['dewpoint'] += rng.normal(0, 0.05, nlev)
+        hires.append(pd.DataFrame({'pressure': p, **cols, 'station': df['station'].iloc[0], 'time': df['time'].iloc[0]}))
+
+    t_qc = _timeit(lambda: [qc.preprocess(df) for df in hires]) / nsound
+    full = [qc.prepare_sounding(df, thin=False) for df in hires]
+    thinned = [qc.prepare_sounding(df) for df in hires]
+    df = synthetic_sounding(200)
+    same_missing = np.isnan(qc.preprocess(df, thin=False)['dewpoint']).sum() == df['dewpoint'].isna().sum()
+    print(f"Preprocessing {nlev} levels: {t_qc*1e3:5.1f} ms per sounding, "
+          f"{np.mean([len(df) for df in thinned]):5.0f} significant levels kept (missing dewpoints kept: {same_missing})")
+    for method in ('numpy', 'metpy'):
+        t_full = _timeit(lambda: [sp.compute_diagnostics(df, method=method) for df in full], repeat=1) / nsound
+        t_thin = _timeit(lambda: [sp.compute_diagnostics(df, method=method) for df in thinned], repeat=1) / nsound
+        print(f"  compute_diagnostics ({method}): all levels {t_full*1e3:6.0f} ms, thinned {t_thin*1e3:6.0f} ms "
+              f"(speedup {t_full/t_thin:4.1f})")
+    renderer = sp.SkewTRenderer()
+    with tempfile.TemporaryDirectory() as tmp:
+        t_full = _timeit(lambda: [renderer.render(df, f"{tmp}/full.png", dpi=72) for df in full], repeat=1) / nsound
+        t_thin = _timeit(lambda: [renderer.render(df, f"{tmp}/thin.png", dpi=72) for df in thinned], repeat=1) / nsound
+    print(f"  SkewTRenderer PNG: all levels {t_full*1e3:6.0f} ms, thinned {t_thin*1e3:6.0f} ms "
+          f"(speedup {t_full/t_thin:4.1f})")
+
+
+if __name__ == "__main__":
+    bench_stability()
+    bench_diagnostics()
+    bench_climatology()
+    bench_archive()
+    bench_render()
+    bench_export()
+    bench_stream()
+    bench_core()
+    bench_parcels()
+    bench_tables()
+    bench_qc()
@@ -0,0 +1,189 @@
+'''
+Quality control and thinning of soundings ahead of plot_skewt and compute_diagnostics.
+
+High-resolution soundings (e.g. BUFR, one level per second of ascent) carry 5-10 thousand levels,
+with pressure reversals, spikes and far more detail than a plot or an index needs. preprocess()
+cleans and thins a sounding DataFrame in a few vectorized passes:
+
+    1. monotonic pressure: levels that do not lie above all previous ones are dropped
+       (duplicates, balloon oscillations, a descent after burst), as are levels without pressure
+       or temperature
+    2. gross limits: values out of physical range become missing; dewpoints above the temperature
+       are set to it
+    3. spikes: a level whose potential temperature lies outside the range of its two neighbours by
+       more than spike_tol is dropped (it makes a superadiabatic layer on one side, a matching
+       inversion on the other); dewpoints sticking out of their neighbours' range by more than
+       dewpoint_spike_tol become missing
+    4. thinning: significant levels are selected as in the Douglas-Peucker algorithm, so that
+       interpolating linearly in ln(p) between them reproduces temperature and dewpoint within
+       temperature_tol at every dropped level, and the wind components within wind_tol
+
+The result is a compact record array with the float32 columns of sounding_archive:
+
+    import sounding_qc as qc
+    rec = qc.preprocess(df)                         # e.g. a DataFrame from WyomingUpperAir
+    sp.plot_skewt(qc.to_dataframe(rec, 'IAD', '2021-07-07 00:00'))
+    sp.plot_skewt(qc.prepare_sounding(df))          # the same, keeping station and time of df
+'''
+import numpy as np
+import pandas as pd
+
+import sounding_thermo as st
+from sounding_archive import COLUMNS
+
+RECORD_DTYPE = np.dtype([(col, np.float32) for col in COLUMNS])
+
+# Plausible ranges of the columns, in their units; values outside become missing
+LIMITS = {'pressure': (1.0, 1100.0), 'height': (-500.0, 60000.0), 'temperature': (-110.0, 60.0),
+          'dewpoint': (-130.0, 60.0), 'direction': (0.0, 360.0), 'speed': (0.0, 400.0)}
+
+
+def monotonic_levels(p):
+    '''
+    Boolean mask of the levels whose pressure is lower than at every level before them
+        (for a profile listed from the top down, reverse it first)
+    '''
+    p = np.asarray(p, dtype=np.float64)
+    below = np.fmin.accumulate(np.r_[np.inf, p[:-1]])     # Missing pressures do not count
+    return p < below
+
+
+def spikes(x):
+    '''
+    How far each value lies outside the range of its two neighbours (0 inside it, and at both ends;
+        nan where a value or a neighbour is missing)
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    out = np.zeros(len(x))
+    if len(x) > 2:
+        lo, hi = np.fmin(x[:-2], x[2:]), np.fmax(x[:-2], x[2:])
+        lo[np.isnan(x[:-2]) | np.isnan(x[2:])] = np.nan
+        out[1:-1] = np.maximum(np.maximum(x[1:-1] - hi, lo - x[1:-1]), 0.0)
+    return out
+
+
+def significant_levels(p, fields, tolerances, keep=None):
+    '''
+    Douglas-Peucker selection of levels, vectorized: every segment between selected levels is split
+        at its worst level in the same pass, until linear interpolation in ln(p) between selected levels
+        reproduces every field within its tolerance at all other levels
+
+    Required inputs:
+        p          (array) = pressures, strictly decreasing (N)
+        fields      (list) = arrays of the values to reproduce (N each; nan where missing)
+        tolerances  (list) = maximum interpolation error of each field, in its units
+    Optional input:
+        keep       (array) [None] = boolean mask of levels to select in any case
+
+    Output:
+        Boolean mask of the selected levels (always including the first and last, and both ends of
+            every run of missing values of a field)
+    '''
+    x = np.log(np.asarray(p, dtype=np.float64))
+    n = len(x)
+    selected = np.zeros(n, dtype=bool) if keep is None else np.array(keep, dtype=bool)
+    if n < 3:
+        selected[:] = True
+        return selected
+    selected[[0, -1]] = True
+    fields = [np.asarray(y, dtype=np.float64) for y in fields]
+    for y in fields:
+        edge = np.flatnonzero(np.diff(np.isnan(y)))       # Interpolation never spans a gap this way
+        selected[edge] = selected[edge + 1] = True
+
+    while True:
+        idx = np.flatnonzero(selected)
+        seg = np.minimum(np.searchsorted(idx, np.arange(n), side='right') - 1, len(idx) - 2)
+        lo, hi = idx[seg], idx[seg + 1]
+        w = (x - x[lo]) / (x[hi] - x[lo])
+        err = np.zeros(n)
+        for y, tol in zip(fields, tolerances):
+            err = np.fmax(err, np.abs(y - (y[lo] + w * (y[hi] - y[lo]))) / tol)
+        err[selected] = 0.0
+        worst = np.maximum.reduceat(err, idx[:-1])
+        split = worst > 1.0
+        if not split.any():
+            return selected
+        # The first level of each segment to split where its error is largest
+        at = np.flatnonzero(split[seg] & (err == worst[seg]))
+        selected[at[np.unique(seg[at], return_index=True)[1]]] = True
+
+
+def preprocess(df, temperature_tol=0.1, wind_tol=2.0, spike_tol=3.0, dewpoint_spike_tol=15.0, thin=True):
+    '''
+    Cleans and thins a sounding (see the description of this module)
+
+    Required input:
+        df (Pandas dataframe) = sounding data, as for plot_skewt (missing columns are taken as missing values)
+    Optional inputs:              Default:
+        temperature_tol    (float) [0.1]  = Maximum error [K] of temperature and dewpoint interpolated across dropped levels
+        wind_tol           (float) [2.0]  = Maximum error [kts] of the wind components interpolated across dropped levels
+        spike_tol          (float) [3.0]  = Potential temperature spike [K] for a level to be dropped
+        dewpoint_spike_tol (float) [15.0] = Dewpoint spike [K] for a dewpoint to be dropped
+        thin                (bool) [True] = Select significant levels (otherwise only steps 1-3)
+
+    Output:
+        Record array of dtype RECORD_DTYPE, one element per remaining level, from the surface up
+    '''
+    cols = {col: (df[col].to_numpy(dtype=np.float32, na_value=np.nan, copy=True) if col in df else np.full(len(df), np.nan, np.float32))
+            for col in COLUMNS}
+    if len(df) > 1 and cols['pressure'][0] < cols['pressure'][-1]:     # Listed from the top down
+        cols = {col: values[::-1] for col, values in cols.items()}
+
+    # Gross limits
+    for col, (low, high) in LIMITS.items():
+        values = cols[col]
+        values[(values < low) | (values > high)] = np.nan
+    cols['dewpoint'] = np.where(cols['dewpoint'] > cols['temperature'], cols['temperature'], cols['dewpoint'])  # Missing stays missing
+    no_wind = np.isnan(cols['direction']) | np.isnan(cols['speed'])
+    cols['direction'][no_wind] = cols['speed'][no_wind] = np.nan
+
+    # Monotonic pressure, with a temperature at every level (in float32, so no two pressures end up equal)
+    ok = np.isfinite(cols['temperature'])
+    ok[ok] = monotonic_levels(cols['pressure'][ok])
+    p = cols['pressure'][ok].astype(np.float64)
+    T = cols['temperature'][ok].astype(np.float64)
+    Td = cols['dewpoint'][ok].astype(np.float64)
+
+    # Spikes: potential temperature drops the level, dewpoint only the dewpoint
+    theta = st.potential_temperature(100.0 * p, T + 273.15)
+    good = ~(spikes(theta) > spike_tol)
+    Td[spikes(Td) > dewpoint_spike_tol] = np.nan
+    levels = np.flatnonzero(ok)[good]
+    p, T, Td = p[good], T[good], Td[good]
+
+    if thin and len(levels) > 2:
+        direction = np.deg2rad(cols['direction'][levels].astype(np.float64))
+        speed = cols['speed'][levels].astype(np.float64)
+        u, v = -speed * np.sin(direction), -speed * np.cos(direction)
+        sig = significant_levels(p, [T, Td, u, v], [temperature_tol, temperature_tol, wind_tol, wind_tol])
+        levels, Td = levels[sig], Td[sig]
+
+    record = np.empty(len(levels), dtype=RECORD_DTYPE)
+    for col in COLUMNS:
+        record[col] = cols[col][levels]
+    record['dewpoint'] = Td
+    return record
+
+
+def to_dataframe(record, station=None, time=None):
+    '''
+    A record of preprocess as a DataFrame in the layout of WyomingUpperAir, ready for plot_skewt and
+        compute_diagnostics (float32 columns, as read from a sounding_archive)
+    '''
+    df = pd.DataFrame({col: record[col] for col in COLUMNS})
+    if station is not None:
+        df['station'] = station
+    if time is not None:
+        df['time'] = pd.Timestamp(time)
+    return df
+
+
+def prepare_sounding(df, **kwargs):
+    '''
+    preprocess and to_dataframe in one: the cleaned and thinned sounding as a DataFrame, with the station
+        and time of df (keyword arguments as for preprocess)
+    '''
+    return to_dataframe(preprocess(df, **kwargs),
+                        df['station'].iloc[0] if 'station' in df and len(df) else None,
+                        df['time'].iloc[0] if 'time' in df and len(df) else None)
@@ -0,0 +1,423 @@
+'''
+Incremental processing of a sounding as it is received, level by level, during a radiosonde ascent.
+
+A SoundingStream keeps the levels received so far and updates the stability codes, the lifted
+surface parcel, CAPE/CIN and precipitable water from the newest layer only, so each level costs
+the same however many came before it. Attached to a sounding_plotter.SkewTRenderer, it refreshes
+just the plot artists that change:
+
+    import sounding_stream as ss
+    stream = ss.SoundingStream('IAD', datetime(2021, 7, 7, 0))
+    renderer = sp.SkewTRenderer()
+    stream.attach(renderer)
+    for level in receiver:                      # e.g. dicts with pressure, height, temperature, ...
+        stream.add_level(**level)
+        stream.refresh()
+        renderer.fig.savefig('IAD_latest.png')
+
+The indices follow the conventions of compute_diagnostics(method='numpy'), i.e. of metpy.calc: the
+reported LFC is the highest one and the EL the highest one (of the temperature, not the virtual
+temperature); CAPE and CIN are those of metpy.calc.cape_cin (virtual temperatures, levels without
+dewpoint skipped, from the lowest LFC to the highest EL). After each level they are what
+compute_diagnostics gives for the levels received so far, except that CAPE is never negative;
+compute_diagnostics with the default method='metpy' picks the EL with the most CAPE instead when
+there are several. `diagnostics()` gives the full compute_diagnostics result for the levels
+received so far.
+'''
+import numpy as np
+import pandas as pd
+
+import metpy.calc as mpcalc
+import metpy.constants as c
+from metpy.units import units
+
+import sounding_plotter as sp
+import sounding_thermo as st
+
+_FIELDS = ('pressure', 'height', 'temperature', 'dewpoint', 'direction', 'speed')
+
+
+def _isclose(a, b):
+    # np.isclose for two floats (its default tolerances), without the array overhead
+    return abs(a - b) <= 1e-8 + 1e-5 * abs(b)
+
+
+class _Crossings:
+    '''
+    The crossings of a lifted parcel with a profile, found level by level as sounding_thermo.intersections,
+        lfc and el find them on the whole profile, with the area between the two (Rd * integral of
+        parcel - profile d(-ln p), as in cape_cin) at each crossing and at the levels next to the LCL
+    '''
+    def __init__(self, p_lcl):
+        self.p_lcl = p_lcl          # [Pa] LFCs and ELs are only looked for above it
+        self.p = np.nan             # Last level [Pa]
+        self.area = 0.0             # Area from the first level to the last
+        self._last = None           # (ln p, parcel - profile, profile) at the last level
+        self.n_increasing = 0       # Number of crossings to a buoyant parcel
+        self.bottom = self.top = None   # (p, profile, area) at the lowest and highest of them above the LCL
+        self.decreasing = None      # (p, profile, area) at the highest crossing to a negatively buoyant parcel
+        self.buoyant_above_lcl = False
+        self.area_to_lcl = None     # Area at the last point at or below the LCL, and at the first at or above it
+        self.area_from_lcl = None
+
+    def _point(self, p, area):
+        # A level or crossing of the profile, in the order of decreasing pressure
+        close = _isclose(p, self.p_lcl)
+        if p > self.p_lcl or close:
+            self.area_to_lcl = area
+        if (p < self.p_lcl or close) and self.area_from_lcl is None:
+            self.area_from_lcl = area
+
+    def add(self, p, parcel, profile):
+        '''
+        Adds the next level: pressure [Pa], parcel and profile temperatures [K]
+        '''
+        x, d = np.log(p), parcel - profile
+        if self._last is not None:
+            x0, d0, b0 = self._last
+            s0, s = np.sign(d0), np.sign(d)
+            if s != s0 and s0 != 0:                     # The parcel changes side of the profile in this layer
+                f = d0 / (d0 - d)                       # Linear in ln(p)
+                xc = x0 + f * (x - x0)
+                area_c = self.area + c.nounit.Rd * d0 / 2 * (x0 - xc)
+                crossing = (np.exp(xc), b0 + f * (profile - b0), area_c)
+                self._point(crossing[0], area_c)
+                if s > s0:
+                    self.n_increasing += 1
+                    if crossing[0] < self.p_lcl:
+                        self.bottom = self.bottom or crossing
+                        self.top = crossing
+                else:
+                    self.decreasing = crossing
+                self.area = area_c + c.nounit.Rd * d / 2 * (xc - x)
+            else:
+                self.area += c.nounit.Rd * (d0 + d) / 2 * (x0 - x)
+        self._last = (x, d, profile)
+        self.p = p
+        self._point(p, self.area)
+        if p < self.p_lcl and d > 0 and not _isclose(parcel, profile):
+            self.buoyant_above_lcl = True
+
+    def lfc(self, which='top'):
+        '''
+        The LFC as sounding_thermo.lfc: (p, profile, area) of the 'bottom' or 'top' crossing, 'lcl', or None
+        '''
+        crossing = self.bottom if which == 'bottom' else self.top
+        if crossing is not None:
+            return crossing
+        if self.n_increasing == 0:
+            return 'lcl' if self.buoyant_above_lcl else None
+        # Buoyant only below the LCL: none if the parcel also stopped being buoyant there
+        return None if self.decreasing is not None and self.decreasing[0] > self.p_lcl else 'lcl'
+
+    def el(self):
+        '''
+        The highest EL as sounding_thermo.el: (p, profile, area), or None (e.g. the parcel is buoyant at the top)
+        '''
+        if self._last is None or self._last[1] > 0:
+            return None
+        if self.decreasing is not None and self.decreasing[0] < self.p_lcl:
+            return self.decreasing
+        return None
+
+
+class SoundingStream:
+    '''
+    A sounding received level by level, with diagnostics updated for each new level
+
+    Optional input:
+        station       (str) = station identifier, for the plot title and diagnostics()
+        time     (datetime) = launch time
+        abs_tol     (float) = The ± temperature lapse rate range [K/km] for the stability codes (default 1.0)
+        capacity      (int) = number of levels allocated at first (grown by doubling as needed)
+
+    Attributes (current values, updated by add_level):
+        n                                        = number of levels received
+        stability                                = integer array of stability codes per interval
+        parcel                                   = surface parcel temperature profile [K]
+        lcl_pressure, lcl_temperature            = [hPa], [˚C] (nan until the first level)
+        lfc_pressure, lfc_temperature            = [hPa], [˚C] (nan if there is no LFC yet; the LCL
+                                                   while the parcel has been buoyant since below it)
+        el_pressure, el_temperature              = [hPa], [˚C] (nan if there is no EL, e.g. the parcel
+                                                   is still buoyant at the top)
+        cape, cin                                = [J/kg] (CAPE at least 0)
+        pw                                       = precipitable water [mm]
+    '''
+    def __init__(self, station=None, time=None, abs_tol=1.0, capacity=256):
+        self.station = station
+        self.time = time
+        self.abs_tol = abs_tol
+        self.n = 0
+        self._data = {f: np.full(capacity, np.nan) for f in _FIELDS}
+        self._parcel = np.full(capacity, np.nan)
+        self._stability = np.zeros(capacity, dtype=np.int8)
+        self.lcl_pressure = self.lcl_temperature = np.nan
+        self.lfc_pressure = self.lfc_temperature = np.nan
+        self.el_pressure = self.el_temperature = np.nan
+        self.cape = self.cin = self.pw = 0.0
+        self._last = None           # (p [Pa], w) of the last level with a dewpoint
+        self._lfc_track = None      # _Crossings of the parcel with the temperature: at all levels for the LFC,
+        self._el_track = None       #   at levels with a dewpoint for the EL, and with the virtual temperature for
+        self._cape_track = None     #   CAPE and CIN (created with the first level)
+        self._renderer = None
+
+    def __len__(self):
+        return self.n
+
+    def __getattr__(self, name):
+        # The profile columns received so far, as views: stream.pressure, stream.temperature, ...
+        if name in _FIELDS:
+            return self._data[name][:self.n]
+        raise AttributeError(name)
+
+    @property
+    def parcel(self):
+        return self._parcel[:self.n]
+
+    @property
+    def stability(self):
+        return self._stability[:max(self.n-1, 0)]
+
+    def _grow(self):
+        for f, a in self._data.items():
+            self._data[f] = np.r_[a, np.full(len(a), np.nan)]
+        self._parcel = np.r_[self._parcel, np.full(len(self._parcel), np.nan)]
+        self._stability = np.r_[self._stability, np.zeros(len(self._stability), dtype=np.int8)]
+
+    def add_level(self, pressure, height, temperature, dewpoint=np.nan, direction=np.nan, speed=np.nan, **ignored):
+        '''
+        Adds the next level of the ascent and updates the diagnostics from the new layer
+
+        Required input:
+            pressure [hPa], height [m], temperature [˚C]
+        Optional input:
+            dewpoint [˚C], wind direction [˚] and speed [kts] (nan if missing)
+
+        Output:
+            True if the level was added, False if it was skipped because its pressure is not below
+            that of the last level (repeated or descending readings)
+        '''
+        i = self.n
+        if i and not pressure < self._data['pressure'][i-1]:
+            return False
+        if i == len(self._parcel):
+            self._grow()
+        for f, value in zip(_FIELDS, (pressure, height, temperature, dewpoint, direction, speed)):
+            self._data[f][i] = value
+        self.n += 1
+
+        p = pressure * 100.0
+        T = temperature + c.nounit.zero_degc
+        if i == 0:
+            self._start_parcel(pressure, temperature, dewpoint)
+        else:
+            self._lift_parcel(i)
+            d = self._data
+            self._stability[i-1] = sp.stability_codes(d['pressure'][i-1:i+1], d['temperature'][i-1:i+1],
+                                                      d['height'][i-1:i+1], abs_tol=self.abs_tol)[0]
+        self._lfc_track.add(p, self._parcel[i], T)
+        if np.isfinite(dewpoint):
+            self._integrate(p, T, dewpoint + c.nounit.zero_degc, self._parcel[i])
+        self._update_indices()
+        return True
+
+    def add_levels(self, levels):
+        '''
+        Adds several levels, given as a DataFrame (as for plot_skewt) or an iterable of dicts.
+            Returns the number of levels added.
+        '''
+        if isinstance(levels, pd.DataFrame):
+            levels = levels[[f for f in _FIELDS if f in levels]].to_dict('records')
+        return sum(self.add_level(**level) for level in levels)
+
+    def _start_parcel(self, pressure, temperature, dewpoint):
+        # Surface parcel and its LCL, from the first level, and the parcel crossings tracked from there
+        lcl_p, lcl_t = mpcalc.lcl(pressure * units.hPa, temperature * units.degC, dewpoint * units.degC,
+                                  max_iters=50, eps=1e-05)
+        self.lcl_pressure = lcl_p.m_as('hPa')
+        self.lcl_temperature = lcl_t.m_as('degC')
+        p, T, Td = pressure * 100.0, temperature + c.nounit.zero_degc, dewpoint + c.nounit.zero_degc
+        self._w0 = float(st.saturation_mixing_ratio(p, Td))
+        self._parcel[0] = T
+        self._lfc_track = _Crossings(self.lcl_pressure * 100.0)
+        self._el_track = _Crossings(self.lcl_pressure * 100.0)
+        # As metpy.calc.cape_cin, the LCL bounding the LFC of the CAPE is that of the virtual temperature
+        self._cape_track = _Crossings(float(st.lcl(p, st.virtual_temperature(T, self._w0), Td)[0]))
+
+    def _lift_parcel(self, i):
+        # Parcel temperature at level i from that at level i-1: dry adiabat up to the LCL, moist above
+        kappa = c.nounit.kappa
+        p0, p1 = self._data['pressure'][i-1] * 100.0, self._data['pressure'][i] * 100.0
+        T0 = self._parcel[i-1]
+        p_lcl = self.lcl_pressure * 100.0
+        if p1 >= p_lcl:
+            T1 = T0 * (p1/p0)**kappa
+        elif p0 > p_lcl:
+            # From the dry adiabat at the LCL pressure, as metpy.calc.parcel_profile
+            T1 = st.moist_lapse_layers(p_lcl, p1, st.dry_lapse(p_lcl, T0, p0))
+        else:
+            T1 = st.moist_lapse_layers(p0, p1, T0)
+        self._parcel[i] = T1
+
+    def _integrate(self, p, T, Td, T_parcel):
+        # Adds the layer from the last level with a dewpoint up to this one to PW and to the crossings
+        #   of the parcel that give the EL, CAPE and CIN
+        w = float(st.saturation_mixing_ratio(p, Td))
+        if self._last is not None:
+            p0, w0 = self._last
+            self.pw += (w0 + w) / 2 * (p0 - p) / (c.nounit.g * st.RHO_L) * 1000.0
+        self._last = (p, w)
+        self._el_track.add(p, T_parcel, T)
+        w_parcel = self._w0 if p > self.lcl_pressure * 100.0 else float(st.saturation_mixing_ratio(p, T_parcel))
+        self._cape_track.add(p, st.virtual_temperature(T_parcel, w_parcel), st.virtual_temperature(T, w))
+
+    def _update_indices(self):
+        # LFC, EL, CAPE and CIN of the levels so far, from the crossings, as compute_diagnostics(method='numpy')
+        #   finds them on the whole profile
+        lfc = self._lfc_track.lfc('top')
+        if lfc == 'lcl':
+            self.lfc_pressure, self.lfc_temperature = self.lcl_pressure, self.lcl_temperature
+        elif lfc is None:
+            self.lfc_pressure = self.lfc_temperature = np.nan
+        else:
+            self.lfc_pressure, self.lfc_temperature = lfc[0] / 100.0, lfc[1] - c.nounit.zero_degc
+        el = self._el_track.el()
+        if el is None:
+            self.el_pressure = self.el_temperature = np.nan
+        else:
+            self.el_pressure, self.el_temperature = el[0] / 100.0, el[1] - c.nounit.zero_degc
+
+        # CAPE from the lowest LFC to the highest EL (or the top), CIN below the LFC, of the virtual temperatures
+        track = self._cape_track
+        lfc = track.lfc('bottom')
+        if lfc is None:
+            self.cape = self.cin = 0.0
+            return
+        if lfc == 'lcl':        # As in metpy, the LCL is not added to the profile: the nearest levels bound the areas
+            p_lfc, area_lfc, area_cape = track.p_lcl, track.area_to_lcl, track.area_from_lcl
+        else:
+            p_lfc, _, area_lfc = lfc
+            area_cape = area_lfc
+        el = track.el()
+        p_el, _, area_el = el if el is not None else (track.p, None, track.area)
+        self.cin = min(area_lfc, 0.0)
+        # Never negative while the ascent goes on, e.g. with a stable layer just above the LFC
+        self.cape = max(area_el - area_cape, 0.0) if area_cape is not None and p_el <= p_lfc else 0.0
+
+    def dataframe(self):
+        '''
+        The levels received so far as a DataFrame in the layout of WyomingUpperAir
+        '''
+        df = pd.DataFrame({f: self._data[f][:self.n] for f in _FIELDS})
+        df['station'] = self.station
+        df['time'] = self.time
+        return df
+
+    def diagnostics(self):
+        '''
+        The full sounding_plotter.compute_diagnostics of the levels received so far (not incremental),
+            e.g. for the final plot once the ascent has ended
+        '''
+        return sp.compute_diagnostics(self.dataframe(), abs_tol=self.abs_tol)
+
+    ###############################################################
+    ### Incremental plotting
+
+    def attach(self, renderer=None):
+        '''
+        Shows this sounding on a SkewTRenderer (a new one if not given); refresh() then draws the
+            levels received since the last refresh. CAPE and CIN are given as numbers but not shaded
+            while the ascent goes on (the shaded areas change with each level); render the complete
+            sounding with renderer.render(diag=stream.diagnostics()) for the final plot.
+        '''
+        from metpy.plots import add_timestamp
+        if renderer is None:
+            renderer = sp.SkewTRenderer()
+        renderer.clear()
+        self._renderer = renderer
+        fig, skew = renderer.fig, renderer.skew
+        text_edge = sp.TEXT_EDGE
+        self._drawn = 0
+        self._lines = {'temperature': skew.ax.plot([], [], 'crimson')[0],
+                       'dewpoint': skew.ax.plot([], [], 'teal')[0],
+                       'parcel': skew.ax.plot([], [], 'k', linewidth=1)[0]}
+        self._markers = {'lcl': skew.ax.plot([], [], 'ko', markerfacecolor='black')[0],
+                         'lfc': skew.ax.plot([], [], 'wo', markerfacecolor='red')[0],
+                         'el': skew.ax.plot([], [], 'wo', markerfacecolor='sienna')[0],
+                         'T0': skew.ax.plot([], [], color='maroon', marker='x')[0],
+                         'Td0': skew.ax.plot([], [], color='darkslategrey', marker='x')[0]}
+        self._texts = {}
+        if renderer.plot_indices:
+            for key, y, color in [('el_p', 0.47, 'sienna'), ('el_t', 0.44, 'sienna'),
+                                  ('lfc_p', 0.39, 'tab:red'), ('lfc_t', 0.36, 'tab:red'),
+                                  ('cape', 0.305, 'firebrick'), ('cin', 0.265, 'blue'),
+                                  ('pw', 0.21, 'lightseagreen'), ('lcl_p', 0.16, 'black'),
+                                  ('lcl_t', 0.13, 'black'), ('station', 0.61, 'black'),
+                                  ('p0', 0.58, 'black'), ('T0', 0.55, 'black'), ('Td0', 0.52, 'black')]:
+                self._texts[key] = fig.text(text_edge, y, "", ha='left', va='center', fontsize=19, c=color)
+            self._texts['station'].set_text("Station: ")
+        if renderer.plot_stability:
+            skew.ax.set_xlabel('')
+            skew.ax.set_ylabel('')
+        if self.time is not None:
+            add_timestamp(skew.ax, pd.Timestamp(self.time).to_pydatetime(), pretext='Valid: ',
+                          y=1.02, x=0.01, ha='left', fontsize=17)
+        skew.ax.set_title(self.station or '', fontsize=28, x=0.66)
+        return renderer
+
+    def refresh(self):
+        '''
+        Updates the attached plot with the levels received since the last refresh: new stability
+            shading and wind barbs are added, and the lines, markers and numbers are updated in place
+        '''
+        renderer = self._renderer
+        if renderer is None:
+            raise RuntimeError("No plot attached; call attach() first")
+        skew = renderer.skew
+        n, i0 = self.n, max(self._drawn - 1, 0)
+        if n == self._drawn:
+            return renderer.fig
+        d = self._data
+        p, T = d['pressure'][:n], d['temperature'][:n]
+        parcel_c = self._parcel[:n] - c.nounit.zero_degc
+        self._lines['temperature'].set_data(T, p)
+        self._lines['dewpoint'].set_data(d['dewpoint'][:n], p)
+        self._lines['parcel'].set_data(parcel_c, p)
+
+        if renderer.plot_stability and n > 1 and n-1 > i0:
+            from matplotlib.collections import PolyCollection
+            polys = [np.array([[T[k], p[k]], [T[k+1], p[k+1]], [50.0, p[k+1]], [50.0, p[k]]]) for k in range(i0, n-1)]
+            colors = [sp.STABILITY_COLORS[code] for code in self._stability[i0:n-1]]
+            skew.ax.add_collection(PolyCollection(polys, facecolors=colors, alpha=0.4))
+
+        new = np.arange(self._drawn, n)
+        new = new[p[new] >= 100.0]
+        if len(new):
+            u, v = mpcalc.wind_components(d['speed'][new] * units.knots, d['direction'][new] * units.degrees)
+            skew.plot_barbs(p[new], u.m, v.m)
+
+        if self._drawn == 0:
+            self._markers['lcl'].set_data([self.lcl_temperature], [self.lcl_pressure])
+            self._markers['T0'].set_data([T[0]], [p[0]])
+            self._markers['Td0'].set_data([d['dewpoint'][0]], [p[0]])
+        self._markers['lfc'].set_data([self.lfc_temperature], [self.lfc_pressure])
+        self._markers['el'].set_data([self.el_temperature], [self.el_pressure])
+
+        if self._texts:
+            t = self._texts
+            has_el, has_lfc = np.isfinite(self.el_pressure), np.isfinite(self.lfc_pressure)
+            t['el_p'].set_text(f"EL: {self.el_pressure:.0f} hPa" if has_el else "")
+            t['el_t'].set_text(f"EL: {self.el_temperature:.1f}˚C" if has_el else "")
+            t['lfc_p'].set_text(f"LFC: {self.lfc_pressure:.1f} hPa" if has_lfc else "")
+            t['lfc_t'].set_text(f"LFC: {self.lfc_temperature:.1f}˚C" if has_lfc else "")
+            t['cape'].set_text(f"CAPE: {self.cape:.0f} J/kg")
+            t['cin'].set_text(f"CIN: {self.cin:.0f} J/kg")
+            t['pw'].set_text(f"PW: {self.pw:.0f} mm")
+            if self._drawn == 0:
+                t['lcl_p'].set_text(f"LCL: {self.lcl_pressure:.0f} hPa")
+                t['lcl_t'].set_text(f"LCL: {self.lcl_temperature:.1f}˚C")
+                t['p0'].set_text(f"  Pressure: {p[0]:.0f} hPa")
+                t['T0'].set_text(f"  Temperature: {T[0]:.1f}˚C")
+                t['Td0'].set_text(f"  Dew Point: {d['dewpoint'][0]:.1f}˚C")
+        self._drawn = n
+        return renderer.fig
@@ -0,0 +1,131 @@
+'''
+Precomputed tables shared by the Skew-T plots and the thermodynamic calculations, kept in one
+compact binary file (skewt_tables.npz, next to this module) and loaded once per process:
+
+    dry_adiabats, moist_adiabats    temperatures [˚C] of the background adiabats at adiabat_pressure [hPa]
+    mixing_lines                    dewpoints [˚C] of the mixing ratio lines at mixing_pressure [hPa]
+    label_temperature               positions of the mixing ratio labels, at label_pressure [hPa]
+    moist_table                     the moist adiabat lookup table of sounding_thermo (float32, stored
+                                    as the second differences of its bit patterns, which compress well)
+
+The curves are computed with metpy exactly as metpy.plots.SkewT would, so the diagrams are unchanged.
+The file records a format version and every parameter the tables were computed from; if it is
+missing or does not match this module, the tables are recomputed and the file rewritten (if the
+directory is writable). To rebuild it explicitly:
+
+    python sounding_tables.py
+'''
+import os
+
+import numpy as np
+
+TABLE_VERSION = 2
+TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "skewt_tables.npz")
+
+# The diagram background of sounding_plotter
+PRESSURE_LIMITS = (1050.0, 100.0)           # [hPa] y axis, bottom to top
+TEMPERATURE_LIMITS = (-40.0, 50.0)          # [˚C] x axis at the bottom
+DRY_ADIABAT_T0 = np.arange(-40.0, 85.0, 10.0)
+# The default moist adiabats of SkewT.plot_moist_adiabats for these axis limits
+MOIST_ADIABAT_T0 = np.concatenate((np.arange(TEMPERATURE_LIMITS[0], 0, 10), np.arange(0, TEMPERATURE_LIMITS[1] + 1, 5)))
+MIXING_RATIOS = np.array([2e-6, 1e-5, 3e-5, 8e-5, 2e-4, 5e-4, 0.001, 0.002, 0.004, 0.007, 0.01, 0.016, 0.024, 0.032])
+MIXING_PRESSURE = np.arange(1050.0, 80.0, -20.0)
+LABEL_PRESSURE = np.array([120, 120, 120, 120, 120, 120, 120, 120, 165, 220, 268, 367, 497, 645], dtype=np.float64)
+
+_tables = None          # The tables of this process, loaded on first use
+
+
+def _parameters():
+    # Everything the tables depend on, stored in the file to detect stale tables
+    import sounding_thermo as st
+    return {'pressure_limits': np.array(PRESSURE_LIMITS), 'temperature_limits': np.array(TEMPERATURE_LIMITS),
+            'dry_adiabat_t0': DRY_ADIABAT_T0, 'moist_adiabat_t0': MOIST_ADIABAT_T0,
+            'mixing_ratios': MIXING_RATIOS, 'mixing_pressure': MIXING_PRESSURE, 'label_pressure': LABEL_PRESSURE,
+            'table_pressure': st.TABLE_PRESSURE, 'table_theta_w': st.TABLE_THETA_W}
+
+
+def build_tables():
+    '''
+    Computes all tables (about half a second); returns them as a dictionary of arrays
+    '''
+    import metpy.calc as mpcalc
+    from metpy.units import units
+    import sounding_thermo as st
+
+    # As SkewT.plot_dry_adiabats and plot_moist_adiabats: 50 pressures spanning the y axis, adiabats through 1000 hPa
+    p = units.Quantity(np.linspace(*PRESSURE_LIMITS), 'mbar')
+    p_ref = units.Quantity(1000., 'mbar')
+    dry = mpcalc.dry_lapse(p, units.Quantity(DRY_ADIABAT_T0, 'degC')[:, np.newaxis], p_ref).to(units.degC)
+    moist = mpcalc.moist_lapse(p, units.Quantity(MOIST_ADIABAT_T0, 'degC'), p_ref).to(units.degC)
+    mixing = mpcalc.dewpoint(mpcalc.vapor_pressure(MIXING_PRESSURE * units.hPa, MIXING_RATIOS.reshape(-1, 1)))
+    labels = mpcalc.dewpoint(mpcalc.vapor_pressure(LABEL_PRESSURE * units.hPa, MIXING_RATIOS))
+
+    tables = {'version': np.array(TABLE_VERSION),
+              'adiabat_pressure': p.m, 'dry_adiabats': dry.m, 'moist_adiabats': moist.m,
+              'mixing_lines': mixing.m_as('degC'), 'label_temperature': labels.m_as('degC'),
+              'moist_table': st.build_moist_adiabat_table().astype(np.float32)}
+    tables.update(_parameters())
+    return tables
+
+
+def _pack(table):
+    # A smooth float32 table as the second differences of its bit patterns along its rows (int32),
+    #   which compress several times better than the floats and give them back exactly
+    bits = table.view(np.int32).astype(np.int64)
+    return np.diff(np.diff(bits, axis=1, prepend=0), axis=1, prepend=0).astype(np.int32)
+
+
+def _unpack(packed):
+    # The float32 table of _pack
+    return np.cumsum(np.cumsum(packed, axis=1, dtype=np.int64), axis=1).astype(np.int32).view(np.float32)
+
+
+def write_tables(tables, filename=TABLE_FILE):
+    '''
+    Writes tables to a compressed binary .npz file, atomically
+    '''
+    tables = dict(tables)
+    tables['moist_table'] = _pack(tables['moist_table'])
+    tmp = f"{filename}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(tmp, **tables)
+    os.replace(tmp, filename)
+    return filename
+
+
+def _valid(tables):
+    # Whether tables read from a file are of this version and computed for these parameters
+    if 'version' not in tables or int(tables['version']) != TABLE_VERSION:
+        return False
+    return all(key in tables and tables[key].shape == value.shape and np.array_equal(tables[key], value)
+               for key, value in _parameters().items())
+
+
+def tables():
+    '''
+    The tables as a dictionary of read-only arrays, read from TABLE_FILE once per process
+        (recomputed, and the file rewritten, if it is missing or out of date)
+    '''
+    global _tables
+    if _tables is None:
+        loaded = None
+        try:
+            with np.load(TABLE_FILE) as f:
+                loaded = {key: f[key] for key in f.files}
+        except (OSError, ValueError):
+            pass
+        if loaded is not None and _valid(loaded):
+            loaded['moist_table'] = _unpack(loaded['moist_table'])
+        else:
+            loaded = build_tables()
+            try:
+                write_tables(loaded)
+            except OSError:                         # Read-only installation: keep them in memory only
+                pass
+        for value in loaded.values():
+            value.flags.writeable = False
+        _tables = loaded
+    return _tables
+
+
+if __name__ == "__main__":
+    print("Wrote", write_tables(build_tables()))
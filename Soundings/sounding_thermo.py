@@ -0,0 +1,387 @@
+'''
+Numerical core of the sounding calculations, without units.
+
+Every function takes and returns plain NumPy arrays (float64, or float32 promoted) in SI units:
+pressure [Pa], temperature [K], height [m], mixing ratio [kg/kg], CAPE/CIN [J/kg], precipitable
+water [kg/m²] (= mm). Units are checked and converted once, at the API boundary (e.g.
+sounding_plotter.compute_diagnostics with method='numpy'), instead of on every array operation.
+
+The formulas are those of metpy.calc, so results agree with it to within solver tolerances:
+    saturation vapor pressure       Ambaum (2020), over liquid water
+    LCL                             Romps (2017), as metpy.calc.lcl
+    moist adiabats                  the pseudo-adiabatic lapse rate of metpy.calc.moist_lapse
+    LFC, EL, CAPE, CIN              as metpy.calc.lfc, el and cape_cin (linear in ln(p) between levels)
+'''
+import numpy as np
+
+import metpy.constants as c
+
+n = c.nounit                                # Plain-number constants of metpy
+RHO_L = c.rho_l.m_as('kg/m^3')              # Density of liquid water
+
+
+###############################################################
+### Moisture
+
+def saturation_vapor_pressure(T):
+    '''
+    Saturation vapor pressure [Pa] over liquid water at temperature T [K] (Ambaum 2020, as in metpy)
+    '''
+    latent_heat = n.Lv - (n.Cp_l - n.Cp_v) * (T - n.T0)
+    return n.sat_pressure_0c * (n.T0 / T) ** ((n.Cp_l - n.Cp_v) / n.Rv) * \
+           np.exp((n.Lv / n.T0 - latent_heat / T) / n.Rv)
+
+
+def saturation_mixing_ratio(p, T):
+    '''
+    Saturation mixing ratio [kg/kg] at pressure p [Pa] and temperature T [K]; nan where the
+        saturation vapor pressure reaches p. With T the dewpoint, this is the mixing ratio.
+    '''
+    e_s = saturation_vapor_pressure(T)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(e_s < p, n.epsilon * e_s / (p - e_s), np.nan)
+
+
+def virtual_temperature(T, w):
+    '''
+    Virtual temperature [K] for temperature T [K] and mixing ratio w [kg/kg]
+    '''
+    return T * (w + n.epsilon) / (n.epsilon * (1 + w))
+
+
+def dewpoint(e):
+    '''
+    Dewpoint [K] at vapor pressure e [Pa] (Bolton 1980, as metpy.calc.dewpoint)
+    '''
+    val = np.log(e / n.sat_pressure_0c)
+    return n.zero_degc + 243.5 * val / (17.67 - val)
+
+
+def potential_temperature(p, T):
+    '''
+    Potential temperature [K] at pressure p [Pa] and temperature T [K], referred to 1000 hPa
+    '''
+    return T * (1e5 / p) ** n.kappa
+
+
+def equivalent_potential_temperature(p, T, Td):
+    '''
+    Equivalent potential temperature [K] at pressure p [Pa], temperature T [K] and dewpoint Td [K]
+        (Bolton 1980, as metpy.calc.equivalent_potential_temperature)
+    '''
+    r = saturation_mixing_ratio(p, Td)
+    e = saturation_vapor_pressure(Td)
+    t_l = 56 + 1. / (1. / (Td - 56) + np.log(T / Td) / 800.)
+    th_l = potential_temperature(p - e, T) * (T / t_l) ** (0.28 * r)
+    return th_l * np.exp(r * (1 + 0.448 * r) * (3036. / t_l - 1.78))
+
+
+def precipitable_water(p, Td):
+    '''
+    Precipitable water [mm] of a profile of pressure p [Pa] and dewpoint Td [K]; levels with missing
+        dewpoint are skipped, as in metpy.calc.precipitable_water
+    '''
+    ok = np.isfinite(p) & np.isfinite(Td)
+    p, w = p[ok], saturation_mixing_ratio(p[ok], Td[ok])
+    order = np.argsort(p)[::-1]
+    p, w = p[order], w[order]
+    return np.sum((w[1:] + w[:-1]) / 2 * (p[:-1] - p[1:])) / (n.g * RHO_L) * 1000.0
+
+
+###############################################################
+### Parcel ascent
+
+def dry_lapse(p, T_0, p_0):
+    '''
+    Temperature [K] at pressures p [Pa] of parcels lifted dry adiabatically from p_0 [Pa] and T_0 [K]
+    '''
+    return T_0 * (p / p_0) ** n.kappa
+
+
+def moist_dt_dlnp(p, T):
+    '''
+    dT/dln(p) [K] along a moist pseudo-adiabat at pressure p [Pa] and temperature T [K],
+        the equation metpy.calc.moist_lapse integrates
+    '''
+    rs = saturation_mixing_ratio(p, T)
+    return (n.Rd * T + n.Lv * rs) / (n.Cp_d + n.Lv * n.Lv * rs * n.epsilon / (n.Rd * T**2))
+
+
+def moist_lapse_layers(p_0, p_1, T_0, nstep=4):
+    '''
+    Temperature [K] reached by saturated parcels lifted (or lowered) along moist adiabats,
+        each from pressure p_0 and temperature T_0 to pressure p_1, all parcels at once
+        (fourth-order Runge-Kutta in ln(p) with nstep steps per parcel)
+
+    Required input:
+        p_0, p_1 (arrays) = starting and final pressures [Pa]
+        T_0      (array)  = starting temperatures [K]
+    '''
+    lnp = np.log(p_0)
+    h = (np.log(p_1) - lnp) / nstep
+    T = np.asarray(T_0, dtype=np.float64)
+    for _ in range(nstep):
+        k1 = moist_dt_dlnp(np.exp(lnp), T)
+        k2 = moist_dt_dlnp(np.exp(lnp + h/2), T + h/2*k1)
+        k3 = moist_dt_dlnp(np.exp(lnp + h/2), T + h/2*k2)
+        k4 = moist_dt_dlnp(np.exp(lnp + h), T + h*k3)
+        T = T + h/6 * (k1 + 2*k2 + 2*k3 + k4)
+        lnp = lnp + h
+    return T
+
+
+def moist_lapse(p, T_0, p_0):
+    '''
+    Temperature [K] at pressures p [Pa] (p <= p_0, decreasing) of one saturated parcel lifted along
+        a moist adiabat from p_0 [Pa] and T_0 [K], with the adaptive solver and tolerances of metpy
+    '''
+    from scipy.integrate import solve_ivp
+    p = np.asarray(p, dtype=np.float64)
+    T = np.full(p.shape, float(T_0))
+    above = p < p_0 * (1 - 1e-10)
+    if above.any():
+        result = solve_ivp(lambda pp, t: moist_dt_dlnp(pp, t) / pp, t_span=(p_0, p[above][-1]), y0=[T_0],
+                           t_eval=p[above], method='LSODA', atol=1e-7, rtol=1.5e-8)
+        if not result.success:
+            raise ValueError("Moist adiabat integration failed: " + result.message)
+        T[above] = result.y[0]
+    return T
+
+
+def lcl(p_0, T_0, Td_0):
+    '''
+    Pressure [Pa] and temperature [K] of the lifting condensation level of a parcel at p_0 [Pa],
+        T_0 [K] with dewpoint Td_0 [K] (Romps 2017, as metpy.calc.lcl)
+    '''
+    from scipy.special import lambertw
+    w = saturation_mixing_ratio(p_0, Td_0)
+    q = w / (1 + w)
+    moist_heat_ratio = (n.Cp_d + q * (n.Cp_v - n.Cp_d)) / (n.Rd + q * (n.Rv - n.Rd))
+    spec_heat_diff = n.Cp_l - n.Cp_v
+    a = moist_heat_ratio + spec_heat_diff / n.Rv
+    b = -(n.Lv + spec_heat_diff * n.T0) / (n.Rv * T_0)
+    rh = saturation_vapor_pressure(Td_0) / saturation_vapor_pressure(T_0)
+    w_minus1 = lambertw(rh ** (1 / a) * (b / a) * np.exp(b / a), k=-1).real
+    T_lcl = b / a / w_minus1 * T_0
+    return p_0 * (T_lcl / T_0) ** moist_heat_ratio, T_lcl
+
+
+def parcel_profile(p, T_0, Td_0):
+    '''
+    Temperature [K] at pressures p [Pa] (decreasing, p[0] the starting level) of a parcel lifted
+        from p[0], T_0, Td_0: dry adiabatic up to its LCL, moist adiabatic above (as metpy.calc.parcel_profile)
+    '''
+    p = np.asarray(p, dtype=np.float64)
+    p_lcl, _ = lcl(p[0], T_0, Td_0)
+    below = p >= p_lcl
+    T = np.empty(p.shape)
+    T[below] = dry_lapse(p[below], T_0, p[0])
+    # As metpy, the moist adiabat starts from the dry adiabat at the LCL pressure
+    T[~below] = moist_lapse(p[~below], dry_lapse(p_lcl, T_0, p[0]), p_lcl)
+    return T
+
+
+###############################################################
+### Moist adiabat lookup table
+
+# Grid of the table: pressures [Pa] evenly spaced in ln(p), and the temperature at 1000 hPa [K]
+#   that labels each moist adiabat
+TABLE_PRESSURE = np.exp(np.linspace(np.log(110000.0), np.log(1000.0), 512))
+TABLE_THETA_W = np.arange(200.0, 320.01, 0.25)
+
+_moist_table = None     # Loaded on first use, then shared by every lookup in this process
+
+
+def build_moist_adiabat_table():
+    '''
+    Integrates the moist adiabat table (about 0.4 s): temperatures [K] of shape (len(TABLE_PRESSURE), len(TABLE_THETA_W)),
+        column j being the adiabat through 1000 hPa and TABLE_THETA_W[j]
+    '''
+    p = TABLE_PRESSURE
+    table = np.empty((len(p), len(TABLE_THETA_W)))
+    i0 = int(np.searchsorted(-p, -1e5))                 # First grid level above 1000 hPa
+    # Every adiabat at once, from 1000 hPa up and down the grid one step at a time
+    T, p_0 = TABLE_THETA_W, 1e5
+    for i in range(i0, len(p)):
+        T = table[i] = moist_lapse_layers(p_0, p[i], T)
+        p_0 = p[i]
+    T, p_0 = TABLE_THETA_W, 1e5
+    for i in range(i0-1, -1, -1):
+        T = table[i] = moist_lapse_layers(p_0, p[i], T)
+        p_0 = p[i]
+    return table
+
+
+def moist_adiabat_table():
+    '''
+    The moist adiabat table of build_moist_adiabat_table, read once per process from the precomputed
+        tables of sounding_tables (float32)
+    '''
+    global _moist_table
+    if _moist_table is None:
+        import sounding_tables                          # Imported here: it needs this module to build the table
+        _moist_table = sounding_tables.tables()['moist_table']
+    return _moist_table
+
+
+def moist_lapse_table(p, T_0, p_0):
+    '''
+    Temperatures [K] of saturated parcels lifted along moist adiabats, interpolated in moist_adiabat_table:
+        all parcels and pressures at once, with no integration
+
+    Required input:
+        p        (array) = the pressures [Pa] to find the parcel temperatures at (N)
+        T_0, p_0 (arrays) = starting temperatures [K] and pressures [Pa] of the parcels (P)
+
+    Output:
+        Array (P, N) of temperatures; nan outside the table
+    '''
+    table = moist_adiabat_table()
+    rows = np.arange(len(TABLE_PRESSURE), dtype=np.float64)
+    lnp_grid = -np.log(TABLE_PRESSURE)
+    T_0, p_0 = np.atleast_1d(T_0).astype(np.float64), np.atleast_1d(p_0).astype(np.float64)
+
+    # The adiabat of each parcel, as a fractional column: temperatures of all adiabats at p_0, bracketing T_0
+    r = np.interp(-np.log(p_0), lnp_grid, rows, left=np.nan, right=np.nan)
+    i = np.clip(np.nan_to_num(r).astype(int), 0, len(rows)-2)
+    a = (r - i)[:, np.newaxis]
+    T_at_p0 = (1 - a) * table[i] + a * table[i+1]
+    j = np.clip(np.sum(T_at_p0 < T_0[:, np.newaxis], axis=1) - 1, 0, table.shape[1]-2)
+    k = np.arange(len(T_0))
+    col = j + (T_0 - T_at_p0[k, j]) / (T_at_p0[k, j+1] - T_at_p0[k, j])
+    col[(col < 0) | (col > table.shape[1]-1)] = np.nan
+
+    # Bilinear interpolation at every (parcel, pressure)
+    r = np.interp(-np.log(np.asarray(p, dtype=np.float64)), lnp_grid, rows, left=np.nan, right=np.nan)
+    i = np.clip(np.nan_to_num(r).astype(int), 0, len(rows)-2)
+    a = r - i
+    j = np.clip(np.nan_to_num(col).astype(int), 0, table.shape[1]-2)
+    b = (col - j)[:, np.newaxis]
+    i, j = i[np.newaxis, :], j[:, np.newaxis]
+    return ((1 - a) * ((1 - b) * table[i, j] + b * table[i, j+1])
+            + a * ((1 - b) * table[i+1, j] + b * table[i+1, j+1]))
+
+
+###############################################################
+### Lapse rates and integrals
+
+def lapse_rates(p, T, z):
+    '''
+    Lapse rate measures [K/m] of every interval between levels of a profile of pressure p [Pa],
+        temperature T [K] and height z [m]
+
+    Output:
+        t_inv = -dT/dz                                        (negative for an inversion)
+        t_dry = (dry adiabat from the lower level - T) / dz   (positive is absolutely unstable)
+        t_moi = (moist adiabat from the lower level - T) / dz (positive is at least conditionally unstable)
+    '''
+    dz = z[1:] - z[:-1]
+    t_inv = -(T[1:] - T[:-1]) / dz
+    t_dry = (dry_lapse(p[1:], T[:-1], p[:-1]) - T[1:]) / dz
+    with np.errstate(invalid='ignore'):
+        t_moi = (moist_lapse_layers(p[:-1], p[1:], T[:-1]) - T[1:]) / dz
+    return t_inv, t_dry, t_moi
+
+
+def intersections(p, a, b, direction='all'):
+    '''
+    Pressures [Pa] and values of b where profile a crosses profile b, interpolating linearly in ln(p),
+        for a going from below to above b ('increasing'), the reverse ('decreasing') or both ('all')
+    '''
+    d = a - b
+    s = np.sign(d)
+    i = np.flatnonzero((s[:-1] != s[1:]) & (s[:-1] != 0))
+    if direction == 'increasing':
+        i = i[s[i+1] > s[i]]
+    elif direction == 'decreasing':
+        i = i[s[i+1] < s[i]]
+    f = d[i] / (d[i] - d[i+1])
+    lnp = np.log(p)
+    return np.exp(lnp[i] + f * (lnp[i+1] - lnp[i])), b[i] + f * (b[i+1] - b[i])
+
+
+def _pick(x, y, which):
+    # One of several LFCs or ELs: 'bottom' (highest pressure) or 'top'
+    if which == 'bottom':
+        return x[0], y[0]
+    if which == 'top':
+        return x[-1], y[-1]
+    raise ValueError('Invalid option for "which": ' + str(which))
+
+
+def lfc(p, T, parcel, p_lcl, T_lcl, which='top'):
+    '''
+    Pressure [Pa] and temperature [K] of the level of free convection of parcel in the profile T,
+        following metpy.calc.lfc (the LCL if the parcel is already buoyant there; nan if there is none)
+    '''
+    start = 1 if np.isclose(parcel[0], T[0]) else 0
+    x, y = intersections(p[start:], parcel[start:], T[start:], 'increasing')
+    if len(x) == 0:
+        above = p < p_lcl
+        if np.all((parcel[above] < T[above]) | np.isclose(parcel[above], T[above])):
+            return np.nan, np.nan
+        return p_lcl, T_lcl
+    ok = x < p_lcl
+    if not ok.any():
+        x_el, _ = intersections(p[1:], parcel[1:], T[1:], 'decreasing')
+        if len(x_el) and x_el.min() > p_lcl:
+            return np.nan, np.nan
+        return p_lcl, T_lcl
+    return _pick(x[ok], y[ok], which)
+
+
+def el(p, T, parcel, p_lcl, which='top'):
+    '''
+    Pressure [Pa] and temperature [K] of the equilibrium level of parcel in the profile T, following
+        metpy.calc.el (nan if the parcel is still buoyant at the top, or there is none above the LCL)
+    '''
+    if parcel[-1] > T[-1]:
+        return np.nan, np.nan
+    x, y = intersections(p[1:], parcel[1:], T[1:], 'decreasing')
+    if len(x) and x[-1] < p_lcl:
+        ok = x < p_lcl
+        return _pick(x[ok], y[ok], which)
+    return np.nan, np.nan
+
+
+def _area(x, y):
+    # Rd * integral of y d(-ln p) over pressures x (decreasing)
+    return n.Rd * np.sum((y[1:] + y[:-1]) / 2 * (np.log(x[:-1]) - np.log(x[1:])))
+
+
+def cape_cin(p, T, Td, parcel, which_lfc='bottom', which_el='top'):
+    '''
+    CAPE and CIN [J/kg] of parcel (lifted from p[0]) in the profile p [Pa], T [K], Td [K], from the
+        virtual temperatures of parcel and environment, as metpy.calc.cape_cin; levels with a missing
+        dewpoint are skipped
+    '''
+    ok = np.isfinite(p) & np.isfinite(T) & np.isfinite(Td) & np.isfinite(parcel)
+    p, T, Td, parcel = p[ok], T[ok], Td[ok], parcel[ok]
+    p_lcl, _ = lcl(p[0], T[0], Td[0])
+    w_parcel = np.where(p > p_lcl, saturation_mixing_ratio(p[0], Td[0]), saturation_mixing_ratio(p, parcel))
+    Tv = virtual_temperature(T, saturation_mixing_ratio(p, Td))
+    Tv_parcel = virtual_temperature(parcel, w_parcel)
+
+    # As in metpy, the LCLs that bound the LFC and EL are recomputed from the virtual temperatures
+    #   of the parcel and of the environment at the first level
+    p_lfc, _ = lfc(p, Tv, Tv_parcel, *lcl(p[0], Tv_parcel[0], Td[0]), which=which_lfc)
+    if np.isnan(p_lfc):
+        return 0.0, 0.0
+    p_el, _ = el(p, Tv, Tv_parcel, lcl(p[0], Tv[0], Td[0])[0], which=which_el)
+    if np.isnan(p_el):
+        p_el = p[-1]
+
+    # The profile of the difference, with the points where it crosses zero added
+    y = Tv_parcel - Tv
+    xc, _ = intersections(p, y, np.zeros_like(y))
+    x = np.r_[p, xc]
+    y = np.r_[y, np.zeros_like(xc)]
+    order = np.argsort(x)[::-1]
+    x, y = x[order], y[order]
+    keep = np.r_[True, np.diff(x) != 0]
+    x, y = x[keep], y[keep]
+
+    tol = dict(rtol=1e-5, atol=1e-8)
+    in_cape = ((x < p_lfc) | np.isclose(x, p_lfc, **tol)) & ((x > p_el) | np.isclose(x, p_el, **tol))
+    in_cin = (x > p_lfc) | np.isclose(x, p_lfc, **tol)
+    return _area(x[in_cape], y[in_cape]), min(_area(x[in_cin], y[in_cin]), 0.0)